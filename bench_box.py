@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+def conditionals(n: int) -> str:
+	"""
+	Generate a program with `n` conditionals in sequence, each of
+	which updates the variable that the next one tests.
+	"""
+	return ";\n".join(
+		f"if (x{i} < y) then y := y + {i} else y := y - x{i} endif"
+		for i in range(n))
+
+def loop(n: int) -> str:
+	"""
+	Generate a loop whose body has `n` conditionals in sequence.
+	"""
+	return f"while (0 < n) do\n{conditionals(n)};\nn := n - 1\ndone"
+
+# A loop nested in another, whose postcondition differs at each
+# unrolling of the outer loop
+NESTED = (
+	"i := 0; while (i < n) do\n"
+	"j := 0; while (j < m) do s := s + j; j := j + 1 done;\n"
+	"i := i + 1\ndone")
+
+def timed(f):
+	import time
+
+	start = time.perf_counter()
+	res = f()
+	return res, time.perf_counter() - start
+
+if __name__ == "__main__":
+	import argparse
+	import sys
+	from pathlib import Path
+
+	sys.path.append('src')
+
+	from parser import parse, parse_file
+	from symbolic import box
+	import bmc
+	from tinyscript_util import dag_size, vars_prog
+	import z3
+
+	TEST_DIR = Path('.') / 'tests'
+
+	argp = argparse.ArgumentParser(
+		description="Compare formula sizes produced by box with and without joins, and by bmc")
+	argp.add_argument('--max-depth', type=int, default=10,
+		help="loop unrolling depth for the test corpus (default: 10)")
+	argp.add_argument('--textbook-limit', type=int, default=12,
+		help="largest synthetic program to run without joins (default: 12)")
+	args = argp.parse_args()
+
+	def post(alpha):
+		return z3.Or(
+			[z3.Int(v.name) == 0 for v in vars_prog(alpha)] +
+			[z3.Int('#stdout') == 0])
+
+	def report(name: str, alpha, max_depth: int, textbook: bool=True):
+		(f, t) = timed(lambda: box(alpha, post(alpha), max_depth, False))
+		line = f"{name}:\n\tjoins: size={dag_size(f)} time={t:.3f}s"
+		(f, t) = timed(lambda: bmc.encode(alpha, post(alpha), max_depth, False))
+		line += f"\n\tbmc: size={dag_size(f)} time={t:.3f}s"
+		if textbook:
+			(f, t) = timed(lambda: box(alpha, post(alpha), max_depth, False, joins=False))
+			line += f"\n\ttextbook: size={dag_size(f)} time={t:.3f}s"
+		print(line, flush=True)
+
+	sizes = {True: 0, False: 0, 'bmc': 0}
+	times = {True: 0., False: 0., 'bmc': 0.}
+	for test_file in sorted(TEST_DIR.iterdir()):
+		if not str(test_file).endswith('tinyscript'):
+			continue
+		alpha = parse_file(test_file)
+		for joins in (True, False):
+			(f, t) = timed(lambda: box(alpha, post(alpha), args.max_depth, False, joins=joins))
+			sizes[joins] += dag_size(f)
+			times[joins] += t
+		(f, t) = timed(lambda: bmc.encode(alpha, post(alpha), args.max_depth, False))
+		sizes['bmc'] += dag_size(f)
+		times['bmc'] += t
+	print((
+		f"corpus:"
+		f"\n\tjoins: size={sizes[True]} time={times[True]:.3f}s"
+		f"\n\ttextbook: size={sizes[False]} time={times[False]:.3f}s"
+		f"\n\tbmc: size={sizes['bmc']} time={times['bmc']:.3f}s"))
+
+	for n in (4, 8, 12, 16, 64, 256):
+		report(f"{n} conditionals", parse(conditionals(n)), 1, n <= args.textbook_limit)
+	for n in (1, 2, 4, 16):
+		report(f"loop over {n} conditionals", parse(loop(n)), 4, n <= args.textbook_limit // 4)
+	for depth in (8, 16, 25, 40):
+		report(f"nested loops unrolled {depth} times", parse(NESTED), depth, False)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+LOOP_PROGRAMS = {
+	'nested': """
+		i := 0;
+		s := 0;
+		while (i < n) do
+			j := 0;
+			while (j < 10) do
+				s := s + i*j;
+				j := j + 1
+			done;
+			if (1000 < s) then
+				s := s - 1000
+			else
+				output s
+			endif;
+			i := i + 1
+		done""",
+	'collatz': """
+		steps := 0;
+		while (!(n == 1)) do
+			h := 0;
+			while ((h + h) < n) do
+				h := h + 1
+			done;
+			if ((h + h) == n) then
+				n := h
+			else
+				n := (3 * n) + 1
+			endif;
+			steps := steps + 1
+		done;
+		output steps""",
+	'countdown': """
+		while (0 < n) do
+			n := n - 1;
+			skip
+		done""",
+}
+
+def best_of(f, repeat: int) -> float:
+	import time
+
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		f()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+if __name__ == "__main__":
+	import argparse
+	import contextlib
+	import io
+	import random
+	import sys
+	from pathlib import Path
+
+	sys.path.append('src')
+
+	from parser import parse, parse_file
+	from tinyscript_util import vars_prog
+	import batch
+	import compiler
+	import interpreter
+	import tinyscript as tn
+
+	TEST_DIR = Path('.') / 'tests'
+
+	argp = argparse.ArgumentParser(
+		description="Compare tinyscript execution engines")
+	argp.add_argument('--n', type=int, default=2000,
+		help="input size for the loop-heavy programs (default: 2000)")
+	argp.add_argument('--max-steps', type=int, default=None,
+		help="step bound for the loop-heavy programs (default: none)")
+	argp.add_argument('--corpus-max-steps', type=int, default=100,
+		help="step bound for the corpus programs (default: 100)")
+	argp.add_argument('--inputs', type=int, default=100,
+		help="random inputs below n/10 per loop-heavy program (default: 100)")
+	argp.add_argument('--states', type=int, default=20,
+		help="random initial states per corpus program (default: 20)")
+	argp.add_argument('--repeat', type=int, default=3,
+		help="report the best of this many runs (default: 3)")
+	args = argp.parse_args()
+
+	def one_by_one(exc):
+		return lambda runs, max_steps: [
+			exc(st, alpha, max_steps, True) for st, alpha in runs]
+
+	def batched(runs: list, max_steps: int) -> list:
+		states = {}
+		for st, alpha in runs:
+			states.setdefault(alpha, []).append(st)
+		results = {
+			alpha: iter(batch.exc(sts, alpha, max_steps, True))
+			for alpha, sts in states.items()}
+		return [next(results[alpha]) for _, alpha in runs]
+
+	engines = {
+		'recursive': one_by_one(interpreter.exc_recursive),
+		'interpreter': one_by_one(interpreter.exc),
+		'compiler': one_by_one(compiler.exc),
+		'batch': batched,
+	}
+
+	def report(name: str, runs: list, max_steps: int):
+		results = {}
+		times = {}
+		for engine, run in engines.items():
+			# Keep the interpreter's diagnostics out of the report
+			with contextlib.redirect_stdout(io.StringIO()):
+				results[engine] = run(runs, max_steps)
+				times[engine] = best_of(lambda: run(runs, max_steps), args.repeat)
+		for engine in engines:
+			if results[engine] != results['interpreter']:
+				raise AssertionError(f"{engine} disagrees with interpreter on {name}")
+		base = times['recursive']
+		print(f"{name}:" + "".join(
+			f"\n\t{engine}={t:.4f}s ({base/t:.1f}x)" for engine, t in times.items()))
+
+	for name, src in LOOP_PROGRAMS.items():
+		report(name, [(tn.State({'n': args.n}), parse(src))], args.max_steps)
+
+	rng = random.Random(0)
+	for name, src in LOOP_PROGRAMS.items():
+		alpha = parse(src)
+		runs = [
+			(tn.State({'n': rng.randint(1, max(1, args.n // 10))}), alpha)
+			for _ in range(args.inputs)]
+		report(f"{name} ({args.inputs} inputs)", runs, args.max_steps)
+
+	corpus = [
+		parse_file(f) for f in sorted(TEST_DIR.iterdir())
+		if str(f).endswith('tinyscript')]
+	runs = [
+		(tn.State({v.name: rng.randint(-250, 250) for v in vars_prog(alpha)}), alpha)
+		for alpha in corpus
+		for _ in range(args.states)]
+	report(f"corpus ({len(runs)} runs)", runs, args.corpus_max_steps)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+def nested(n: int) -> str:
+	"""
+	Generate `n` counting loops, each nested in the previous one.
+	"""
+	prog = "skip"
+	for i in reversed(range(n)):
+		prog = f"x{i} := 0; while (x{i} < 10) do {prog}; x{i} := x{i} + 1 done"
+	return prog
+
+def timed(f):
+	import time
+
+	start = time.perf_counter()
+	res = f()
+	return res, time.perf_counter() - start
+
+if __name__ == "__main__":
+	import argparse
+	import sys
+	from pathlib import Path
+
+	sys.path.append('src')
+
+	from intervals import prune_prog
+	from parser import parse, parse_file
+	import taint
+
+	TEST_DIR = Path('.') / 'tests'
+
+	argp = argparse.ArgumentParser(
+		description="Time the interval analysis on the test corpus and on nested loops")
+	argp.add_argument('--max-nesting', type=int, default=24,
+		help="deepest loop nesting to time (default: 24)")
+	argp.add_argument('--limit', type=float, default=1.,
+		help="seconds any nested program may take; exceeding it fails (default: 1)")
+	args = argp.parse_args()
+
+	total = 0.
+	for test_file in sorted(TEST_DIR.iterdir()):
+		if not str(test_file).endswith('tinyscript'):
+			continue
+		alpha = parse_file(test_file)
+		(_, t) = timed(lambda: prune_prog(alpha))
+		total += t
+	print(f"corpus:\n\tprune_prog: time={total:.3f}s")
+
+	slow = []
+	for n in range(1, args.max_nesting + 1):
+		alpha = parse(nested(n))
+		(_, t_prune) = timed(lambda: prune_prog(alpha))
+		(_, t_taint) = timed(lambda: taint.symbolic_check(alpha))
+		print(
+			f"{n} nested loops:"
+			f"\n\tprune_prog: time={t_prune:.3f}s"
+			f"\n\ttaint.symbolic_check: time={t_taint:.3f}s", flush=True)
+		if max(t_prune, t_taint) > args.limit:
+			slow.append(n)
+	if slow:
+		sys.exit(f"nestings over {args.limit}s: {slow}")
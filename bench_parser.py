@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+def synthetic_program(n: int, seed: int=0) -> str:
+	"""
+	Generate a random tinyscript program with `n` top-level statements,
+	in the style of the programs in `tests`.
+	"""
+	import random
+
+	rng = random.Random(seed)
+	names = [chr(ord('a') + i) for i in range(10)] + [f"sec_{i}" for i in range(5)]
+
+	def term(depth: int=2) -> str:
+		if depth == 0 or rng.random() < 0.3:
+			return rng.choice(names) if rng.random() < 0.6 else str(rng.randint(-250, 250))
+		op = rng.choice('+-*')
+		return f"({term(depth-1)}){op}({term(depth-1)})"
+
+	def statement() -> str:
+		r = rng.random()
+		if r < 0.6:
+			return f"{rng.choice(names)} := {term()}"
+		if r < 0.8:
+			return f"output {term()}"
+		if r < 0.95:
+			return (
+				f"if (({term()})<({term()})) then\n"
+				f"    {rng.choice(names)} := {term()}\n"
+				f"else\n"
+				f"    output {term()}\n"
+				f"endif")
+		return f"while (({term()})==({term()})) do\n    skip\ndone"
+
+	return ";\n".join(statement() for _ in range(n))
+
+def best_of(f, repeat: int) -> float:
+	import time
+
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		f()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+if __name__ == "__main__":
+	import argparse
+	import sys
+	from pathlib import Path
+
+	sys.path.append('src')
+
+	from parser import parse
+
+	TEST_DIR = Path('.') / 'tests'
+
+	argp = argparse.ArgumentParser(
+		description="Compare the native and pyparsing tinyscript parsers")
+	argp.add_argument('--statements', type=int, default=10000,
+		help="size of the synthetic programs (default: 10000)")
+	argp.add_argument('--programs', type=int, default=3,
+		help="number of synthetic programs (default: 3)")
+	argp.add_argument('--repeat', type=int, default=3,
+		help="report the best of this many runs (default: 3)")
+	argp.add_argument('--no-legacy-synthetic', action='store_true',
+		help="skip the (slow) pyparsing run on synthetic programs")
+	args = argp.parse_args()
+
+	if not TEST_DIR.is_dir():
+		raise ValueError(f"Expected {TEST_DIR} to be a directory")
+
+	corpus = [
+		f.read_text() for f in sorted(TEST_DIR.iterdir())
+		if str(f).endswith('tinyscript')]
+
+	for src in corpus:
+		if parse(src) is not parse(src, legacy=True):
+			raise AssertionError("Parsers disagree on the test corpus")
+
+	native = best_of(lambda: [parse(s) for s in corpus], args.repeat)
+	legacy = best_of(lambda: [parse(s, legacy=True) for s in corpus], args.repeat)
+	print((
+		f"corpus ({len(corpus)} programs):"
+		f"\n\tnative={native:.3f}s"
+		f"\n\tlegacy={legacy:.3f}s"
+		f"\n\tspeedup={legacy/native:.1f}x"))
+
+	synthetic = [
+		synthetic_program(args.statements, seed)
+		for seed in range(args.programs)]
+
+	native = best_of(lambda: [parse(s) for s in synthetic], args.repeat)
+	print((
+		f"synthetic ({args.programs} programs, {args.statements} statements):"
+		f"\n\tnative={native:.3f}s"))
+	if not args.no_legacy_synthetic:
+		legacy = best_of(lambda: [parse(s, legacy=True) for s in synthetic], 1)
+		print((
+			f"\tlegacy={legacy:.3f}s"
+			f"\n\tspeedup={legacy/native:.1f}x"))
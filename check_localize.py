@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# Programs whose sites are followed by a loop that the unrolling depth
+# cuts off, with the expected result of each site of `defuse.localize`
+# and of `taint.localize`
+REGRESSIONS = [
+	(
+		"y := x; while (true) do skip done",
+		['Violates'], []),
+	(
+		"while (true) do skip; output b done",
+		['Violates'], []),
+	(
+		"output sec_a; while (true) do skip done",
+		['Violates'], ['Violates']),
+	(
+		"output sec_a; output sec_b; while (true) do skip done",
+		['Violates', 'Satisfies'], ['Violates', 'Violates']),
+	(
+		"x := sec_a; output x; while (true) do skip done; output y",
+		['Violates', 'Satisfies'], ['Violates']),
+]
+
+def summary(results) -> str:
+	"""
+	The result that the results of the sites of a program amount to.
+	"""
+	if any(r == Result.Violates for _, r, _ in results):
+		return str(Result.Violates)
+	if any(r == Result.Unknown for _, r, _ in results):
+		return str(Result.Unknown)
+	return str(Result.Satisfies)
+
+if __name__ == "__main__":
+	import sys
+	import json
+	from pathlib import Path
+
+	sys.path.append('src')
+
+	from parser import parse, parse_file
+	from symbolic import Result
+	import defuse
+	import taint
+
+	TEST_DIR = Path('.') / 'tests'
+
+	with open(TEST_DIR / 'groundtruth.json', 'r') as f:
+		truth = json.load(f)
+
+	failed = []
+	cases = 0
+
+	for prog, defuse_want, taint_want in REGRESSIONS:
+		alpha = parse(prog)
+		for depth in (1, 5):
+			defuse_res = [r.name for _, r, _ in defuse.localize(alpha, depth)]
+			taint_res = [r.name for _, r, _ in taint.localize(alpha, max_depth=depth)]
+			if (defuse_res, taint_res) != (defuse_want, taint_want):
+				failed.append(f"{prog!r} at depth {depth}: {defuse_res}, {taint_res}")
+
+	# Every program has a site that localize reports violated iff the
+	# program violates the policy
+	for test_file in sorted(TEST_DIR.iterdir()):
+		if not str(test_file).endswith('tinyscript'):
+			continue
+		cases += 1
+		alpha = parse_file(test_file)
+		true_i = truth[str(test_file)]
+		defuse_res = summary(defuse.localize(alpha))
+		taint_res = summary(taint.localize(alpha))
+		if defuse_res != true_i['defuse'] or taint_res != true_i['taint']:
+			failed.append(f"{test_file}: defuse={defuse_res}, taint={taint_res}")
+
+	for f in failed:
+		print(f)
+	print(f"{len(REGRESSIONS)} regressions and {cases} test cases, {len(failed)} failed")
+	if failed:
+		sys.exit(1)
@@ -3,4 +3,4 @@
 if test -f "handin.zip"; then
 	rm handin.zip
 fi
-zip -r handin.zip . -x .git/**\* -x .git\* -x src/__pycache__/**\* -x src/__pycache__\* -x tests\* -x test/**\*
\ No newline at end of file
+zip -r handin.zip . -x .git/**\* -x .git\* -x src/__pycache__/**\* -x src/__pycache__\* -x .parse_cache/**\* -x .parse_cache\* -x tests\* -x test/**\*
\ No newline at end of file
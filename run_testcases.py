@@ -19,11 +19,9 @@ if __name__ == "__main__":
 
 	sys.path.append('src')
 
-	from parser import parse, fmla_parse
+	from parser import parse_file
 	from symbolic import Result
-	import runtime
-	import defuse
-	import taint
+	import policies
 
 	TEST_DIR = Path('.') / 'tests'
 
@@ -43,23 +41,23 @@ if __name__ == "__main__":
 		if subset is None or test_file.name[4:7] in subset:
 			if not str(test_file).endswith('tinyscript'):
 				continue
-			with test_file.open() as f:
-				prog = parse(f.read())
-				runtime_res = runtime.symbolic_check(prog, 100)
-				defuse_res = defuse.symbolic_check(prog)
-				taint_res = taint.symbolic_check(prog)
+			prog = parse_file(test_file)
+			res = policies.check_all(prog, 100)
+			runtime_res = res['runtime']
+			defuse_res = res['defuse']
+			taint_res = res['taint']
 
-				true_i = truth[str(test_file)]
-				runtime_score = score(str(runtime_res), true_i['runtime'])
-				defuse_score = score(str(defuse_res), true_i['defuse'])
-				taint_score = score(str(taint_res), true_i['taint'])
+			true_i = truth[str(test_file)]
+			runtime_score = score(str(runtime_res), true_i['runtime'])
+			defuse_score = score(str(defuse_res), true_i['defuse'])
+			taint_score = score(str(taint_res), true_i['taint'])
 
-				results = (results | {
-					str(test_file): {'runtime': runtime_score,
-									'defuse': defuse_score,
-									'taint': taint_score}}
-					)
-				print(f"{test_file}:", json.dumps(results[str(test_file)]))
+			results = (results | {
+				str(test_file): {'runtime': runtime_score,
+								'defuse': defuse_score,
+								'taint': taint_score}}
+				)
+			print(f"{test_file}:", json.dumps(results[str(test_file)]))
 
 	runtime_total = sum([results[k]['runtime'] for k in results.keys()])
 	defuse_total = sum([results[k]['defuse'] for k in results.keys()])
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+from interpreter import Status
+from typing import Optional
+import interpreter as interp
+import numpy as np
+import tinyscript as tn
+
+# Lane status code for lanes that are still executing; finished lanes
+# hold the `value` of their `Status`
+RUNNING = 0
+
+# Operands below these magnitudes cannot overflow int64 when added or
+# multiplied
+_SUM_SAFE = 2**62
+_PRODUCT_SAFE = 2**31
+
+
+def _fits(a: np.ndarray, bound: int) -> bool:
+    return a.size == 0 or (int(a.min()) > -bound and int(a.max()) < bound)
+
+
+def _column(values: list[int]) -> np.ndarray:
+    try:
+        return np.array(values, dtype=np.int64)
+    except OverflowError:
+        return np.array(values, dtype=object)
+
+
+def _arith(op, a: np.ndarray, b: np.ndarray, bound: int) -> np.ndarray:
+    """
+    Apply `op` elementwise, computing in int64 when both operands are
+    small enough for the result to be exact, and on Python integers in
+    an object array otherwise.
+    """
+    if a.dtype == object or b.dtype == object:
+        return op(a.astype(object), b.astype(object))
+    if _fits(a, bound) and _fits(b, bound):
+        return op(a, b)
+    return op(a.astype(object), b.astype(object))
+
+
+class Batch:
+    """
+    The states of a set of lanes, each of which runs the same program
+    from its own initial state.
+
+    Every variable is stored as a column holding its value in each lane,
+    either as int64 or, once a value no longer fits, as Python integers
+    in an object array, alongside a mask of the lanes in which it is
+    defined. `status` holds `RUNNING` or the final `Status` value of
+    each lane, and `steps` the number of steps each lane has left, or
+    `None` if execution is unbounded.
+    """
+    def __init__(self, states: list[tn.State], max_steps: Optional[int]):
+        self.initial = states
+        self.size = len(states)
+        self.values = {}
+        self.defined = {}
+        names = dict.fromkeys(
+            name for state in states for name in state.variables)
+        for name in names:
+            self.values[name] = _column(
+                [state.variables.get(name, 0) for state in states])
+            self.defined[name] = np.array(
+                [name in state.variables for state in states], dtype=bool)
+        self.status = np.full(self.size, RUNNING, dtype=np.int8)
+        self.steps = (
+            None if max_steps is None else
+            np.full(self.size, max_steps, dtype=np.int64))
+
+    def state(self, lane: int) -> tn.State:
+        """
+        Build the current state of a lane.
+        """
+        variables = dict(self.initial[lane].variables)
+        for name, values in self.values.items():
+            if self.defined[name][lane]:
+                variables[name] = int(values[lane])
+        return tn.State(variables)
+
+    def assign(self, name: str, lanes: np.ndarray, values: np.ndarray):
+        if name not in self.values:
+            self.values[name] = np.zeros(self.size, dtype=values.dtype)
+            self.defined[name] = np.zeros(self.size, dtype=bool)
+        column = self.values[name]
+        if values.dtype == object and column.dtype != object:
+            column = self.values[name] = column.astype(object)
+        column[lanes] = values
+        self.defined[name][lanes] = True
+
+    def finish(self, lanes: np.ndarray, status: Status):
+        self.status[lanes] = status.value
+
+    def step(self, lanes: np.ndarray):
+        if self.steps is not None:
+            self.steps[lanes] -= 1
+
+    def term(self, e: tn.Term, lanes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate a term in the given lanes.
+
+        Args:
+            e (tn.Term): Term to evaluate
+            lanes (np.ndarray): Indices of the lanes to evaluate in
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The value of `e` in each lane,
+                and a mask of the lanes in which `e` mentions an
+                undefined variable, where the value is meaningless
+
+        Raises:
+            TypeError: If the argument isn't a valid tinyscript term
+        """
+        match e:
+            case tn.Const(val):
+                values = _column([val])
+                return (
+                    np.repeat(values, len(lanes)),
+                    np.zeros(len(lanes), dtype=bool))
+            case tn.Var(name):
+                if name not in self.values:
+                    return (
+                        np.zeros(len(lanes), dtype=np.int64),
+                        np.ones(len(lanes), dtype=bool))
+                return self.values[name][lanes], ~self.defined[name][lanes]
+            case tn.Sum(left, right):
+                (a, a_err), (b, b_err) = self.term(left, lanes), self.term(right, lanes)
+                return _arith(np.add, a, b, _SUM_SAFE), a_err | b_err
+            case tn.Difference(left, right):
+                (a, a_err), (b, b_err) = self.term(left, lanes), self.term(right, lanes)
+                return _arith(np.subtract, a, b, _SUM_SAFE), a_err | b_err
+            case tn.Product(left, right):
+                (a, a_err), (b, b_err) = self.term(left, lanes), self.term(right, lanes)
+                return _arith(np.multiply, a, b, _PRODUCT_SAFE), a_err | b_err
+            case _:
+                raise TypeError(
+                    f"term got {type(e)} ({e}), not Term"
+                )
+
+    def fmla(self, p: tn.Formula, lanes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluate a formula in the given lanes. Connectives short-circuit
+        per lane as in `interpreter.fmla_exc`: the second operand is only
+        evaluated, and can only fail, in lanes where the first operand
+        does not decide the result.
+
+        Args:
+            p (tn.Formula): Formula to evaluate
+            lanes (np.ndarray): Indices of the lanes to evaluate in
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The truth value of `p` in each
+                lane, and a mask of the lanes in which evaluating `p`
+                fails
+
+        Raises:
+            TypeError: If the argument isn't a valid tinyscript formula
+        """
+        match p:
+            case tn.TrueC():
+                return np.ones(len(lanes), dtype=bool), np.zeros(len(lanes), dtype=bool)
+            case tn.FalseC():
+                return np.zeros(len(lanes), dtype=bool), np.zeros(len(lanes), dtype=bool)
+            case tn.NotF(q):
+                val, err = self.fmla(q, lanes)
+                return ~val, err
+            case tn.AndF(p, q):
+                return self.lazy(self.fmla(p, lanes), q, lanes, True)
+            case tn.OrF(p, q):
+                return self.lazy(self.fmla(p, lanes), q, lanes, False)
+            case tn.ImpliesF(p, q):
+                val, err = self.fmla(p, lanes)
+                return self.lazy((~val, err), q, lanes, False)
+            case tn.EqF(left, right):
+                (a, a_err), (b, b_err) = self.term(left, lanes), self.term(right, lanes)
+                return np.asarray(a == b, dtype=bool), a_err | b_err
+            case tn.LtF(left, right):
+                (a, a_err), (b, b_err) = self.term(left, lanes), self.term(right, lanes)
+                return np.asarray(a < b, dtype=bool), a_err | b_err
+            case _:
+                raise TypeError(
+                    f"fmla got {type(p)} ({p}), not Formula"
+                )
+
+    def lazy(
+        self,
+        first: tuple[np.ndarray, np.ndarray],
+        q: tn.Formula,
+        lanes: np.ndarray,
+        conj: bool
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Combine the result of evaluating a formula `p` with `q`, giving
+        `p && q` if `conj` is true and `p || q` otherwise, and
+        evaluating `q` only in the lanes where `p` is `conj`.
+        """
+        val, err = first
+        val, err = val.copy(), err.copy()
+        rest = ~err & (val == conj)
+        q_val, q_err = self.fmla(q, lanes[rest])
+        val[rest] = q_val
+        err[rest] = q_err
+        return val, err
+
+    def fail(self, lanes: np.ndarray, eval, quiet: bool):
+        """
+        Finish the given lanes with `Status.Error`, printing the error
+        the interpreter reports for each unless `quiet` is set.
+        """
+        if not quiet:
+            for lane in lanes:
+                try:
+                    eval(self.state(lane))
+                except BaseException as e:
+                    print('Interpreter Error:', str(e))
+        self.finish(lanes, Status.Error)
+
+    def enter(self, lanes: np.ndarray) -> np.ndarray:
+        """
+        Finish the lanes that have no steps left with `Status.Maxsteps`,
+        and return the others.
+        """
+        if self.steps is None:
+            return lanes
+        out = self.steps[lanes] == 0
+        self.finish(lanes[out], Status.Maxsteps)
+        return lanes[~out]
+
+    def update(self, name: str, e: tn.Term, lanes: np.ndarray, quiet: bool):
+        """
+        Assign the value of `e` to `name` in the given lanes, finishing
+        those where it is undefined with `Status.Error`.
+        """
+        values, err = self.term(e, lanes)
+        if err.any():
+            self.fail(lanes[err], lambda st: interp.term_exc(st, e), quiet)
+            values, lanes = values[~err], lanes[~err]
+        self.assign(name, lanes, values)
+        self.step(lanes)
+
+    def running(self, lanes: np.ndarray) -> np.ndarray:
+        return lanes[self.status[lanes] == RUNNING]
+
+    def exc(self, alpha: tn.Prog, lanes: np.ndarray, quiet: bool):
+        """
+        Execute a program in the given lanes, all of which are running.
+        Afterwards, the lanes in which it terminated are still running,
+        and the others have their final status.
+
+        Raises:
+            TypeError: If `alpha` is not a valid tinyscript program
+        """
+        lanes = self.enter(lanes)
+        if len(lanes) == 0:
+            return
+        match alpha:
+            case tn.Asgn(name, e):
+                self.update(name, e, lanes, quiet)
+            case tn.Output(e):
+                self.update('#stdout', e, lanes, quiet)
+            case tn.Block(stmts):
+                for beta in stmts:
+                    self.exc(beta, lanes, quiet)
+                    lanes = self.running(lanes)
+                    if len(lanes) == 0:
+                        return
+            case tn.Seq(alpha_p, beta_p):
+                self.exc(alpha_p, lanes, quiet)
+                self.exc(beta_p, self.running(lanes), quiet)
+            case tn.If(q, alpha_p, beta_p):
+                val, err = self.fmla(q, lanes)
+                if err.any():
+                    self.fail(lanes[err], lambda st: interp.fmla_exc(st, q), quiet)
+                self.exc(alpha_p, lanes[~err & val], quiet)
+                self.exc(beta_p, lanes[~err & ~val], quiet)
+            case tn.While(q, alpha_p):
+                while len(lanes) > 0:
+                    val, err = self.fmla(q, lanes)
+                    if err.any():
+                        self.fail(lanes[err], lambda st: interp.fmla_exc(st, q), quiet)
+                    lanes = lanes[~err & val]
+                    if len(lanes) == 0:
+                        return
+                    steps = None if self.steps is None else self.steps[lanes]
+                    self.exc(alpha_p, lanes, quiet)
+                    done = self.status[lanes] != RUNNING
+                    lanes = lanes[~done]
+                    if steps is not None:
+                        steps = steps[~done]
+                        left = np.minimum(self.steps[lanes], steps - 1)
+                        self.steps[lanes] = left
+                        out = left == 0
+                        self.finish(lanes[out], Status.Maxsteps)
+                        lanes = lanes[~out]
+            case tn.Skip():
+                self.step(lanes)
+            case tn.Abort():
+                self.step(lanes)
+                self.finish(lanes, Status.Aborted)
+            case _:
+                raise TypeError(
+                    f"exc got {type(alpha)} ({alpha}), not Prog"
+                )
+
+
+def exc(
+    states: list[tn.State],
+    alpha: tn.Prog,
+    max_steps: int=None,
+    quiet: bool=False
+) -> list[tuple[tn.State, Status, int]]:
+    """
+    Execute a TinyScript program from many initial states at once.
+    The result for each state is the same as `interpreter.exc` would
+    give, but each statement is executed for all of the states that
+    reach it with a handful of NumPy operations. Errors are printed
+    in the order they occur across all states, rather than state by
+    state.
+
+    Args:
+        states (list[tn.State]): initial states
+        alpha (tn.Prog): program to execute
+        max_steps (int, optional): maximum number of steps to execute
+        quiet (bool, optional): if True, don't print interpreter errors
+
+    Returns:
+        list[tuple[tn.State, Status, int]]: final state, final status,
+            and # steps remaining for each initial state
+    """
+    batch = Batch(states, max_steps)
+    batch.exc(alpha, np.arange(batch.size), quiet)
+    batch.status[batch.status == RUNNING] = Status.Terminated.value
+    return [
+        (
+            batch.state(lane),
+            Status(int(batch.status[lane])),
+            None if batch.steps is None else int(batch.steps[lane]))
+        for lane in range(batch.size)]
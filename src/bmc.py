@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+from tinyscript_util import Encoder
+import tinyscript as tn
+import z3
+
+_TRUE = z3.BoolVal(True)
+_FALSE = z3.BoolVal(False)
+
+
+class _State:
+    """
+    The symbolic state at a program point of the unrolled program.
+
+    `env` maps each variable that has been assigned to the constant
+    holding its current value, and `active` is the condition under which
+    execution reaches the point. Traces that have already aborted are
+    summarized by `stopped`, the condition under which an abort was
+    executed, and `stop_env`, the values the variables had there.
+    """
+    __slots__ = ('env', 'active', 'stopped', 'stop_env')
+
+    def __init__(
+        self,
+        env: dict[str, z3.ExprRef],
+        active: z3.BoolRef,
+        stopped: z3.BoolRef,
+        stop_env: dict[str, z3.ExprRef]
+    ):
+        self.env = env
+        self.active = active
+        self.stopped = stopped
+        self.stop_env = stop_env
+
+    def copy(self) -> '_State':
+        return _State(dict(self.env), self.active, self.stopped, self.stop_env)
+
+
+class _Ssa:
+    """
+    Encodes the traces of a program, with loops unrolled, in static
+    single assignment form: each assignment whose value is not a
+    constant or a variable defines a fresh constant, and where the
+    branches of a conditional meet, each variable they assign
+    differently is defined by an if-then-else of the branch values.
+    The definitions are collected in `defs`, so every subterm is
+    encoded once and the encoding grows linearly with the size of the
+    unrolled program.
+    """
+    def __init__(self, strict: bool):
+        self.strict = strict
+        self.defs = []
+        self.cutoffs = []
+        self.encoder = Encoder()
+
+    def var(self, name: str) -> z3.ArithRef:
+        return self.encoder.var(name)
+
+    def value(self, name: str, env: dict[str, z3.ExprRef]) -> z3.ExprRef:
+        return env[name] if name in env else self.var(name)
+
+    def enc(
+        self,
+        e: tn.Term | tn.Formula,
+        env: dict[str, z3.ExprRef]
+    ) -> z3.ExprRef:
+        """
+        Encode a term or formula over the current values in `env`.
+        """
+        f, names = self.encoder.enc(e), self.encoder.names(e)
+        pairs = [(self.var(x), env[x]) for x in names if x in env]
+        return z3.simplify(z3.substitute(f, *pairs)) if pairs else f
+
+    def define(self, name: str, t: z3.ExprRef) -> z3.ExprRef:
+        """
+        Give a new value to a variable, returning the term that stands
+        for it: `t` itself if it is a constant or a variable, and a
+        fresh constant defined to equal `t` otherwise.
+        """
+        if z3.is_int_value(t) or z3.is_const(t):
+            return t
+        fresh = z3.FreshInt(name)
+        self.defs.append(fresh == t)
+        return fresh
+
+    def merge(
+        self,
+        q: z3.BoolRef,
+        env_a: dict[str, z3.ExprRef],
+        env_b: dict[str, z3.ExprRef]
+    ) -> dict[str, z3.ExprRef]:
+        """
+        Join two environments, taking the values in `env_a` where `q`
+        holds and those in `env_b` elsewhere.
+        """
+        if z3.is_true(q) or z3.is_false(q):
+            return dict(env_a if z3.is_true(q) else env_b)
+        env = {}
+        # Iterate in insertion order rather than over a set of names,
+        # so that the encoding is the same from one run to the next
+        for name in dict.fromkeys([*env_a, *env_b]):
+            a, b = self.value(name, env_a), self.value(name, env_b)
+            env[name] = a if a.eq(b) else self.define(name, z3.If(q, a, b))
+        return env
+
+    def stop(self, st: _State):
+        """
+        End the traces that reach the current point, recording their
+        state as stopped.
+        """
+        st.stop_env = self.merge(st.active, st.env, st.stop_env)
+        st.stopped = _or(st.stopped, st.active)
+        st.active = _FALSE
+
+    def branch(
+        self,
+        q: z3.BoolRef,
+        alpha: tn.Prog,
+        beta: tn.Prog,
+        st: _State,
+        depth: int
+    ):
+        """
+        Execute `alpha` where `q` holds and `beta` elsewhere, then join.
+        """
+        if z3.is_true(q) or z3.is_false(q):
+            self.run(alpha if z3.is_true(q) else beta, st, depth)
+            return
+        st_a, st_b = st.copy(), st
+        entry_a = st_a.active = _and(st.active, q)
+        entry_b = st_b.active = _and(st.active, z3.Not(q))
+        self.run(alpha, st_a, depth)
+        self.run(beta, st_b, depth)
+        # Select by `q` when neither branch ended any traces, which
+        # gives smaller terms than selecting by the active conditions
+        if st_a.active.eq(entry_a) and st_b.active.eq(entry_b):
+            sel = q
+        else:
+            sel = st_a.active
+        st.env = self.merge(sel, st_a.env, st_b.env)
+        st.active = z3.simplify(_or(st_a.active, st_b.active))
+        st.stop_env = self.merge(q, st_a.stop_env, st_b.stop_env)
+        st.stopped = z3.simplify(_or(st_a.stopped, st_b.stopped))
+
+    def run(self, alpha: tn.Prog, st: _State, depth: int):
+        """
+        Symbolically execute a program from state `st`, updating it in
+        place, with loops unrolled `depth` times.
+        """
+        if z3.is_false(st.active):
+            return
+        if depth < 1:
+            if self.strict:
+                self.cutoffs.append(st.active)
+            st.active = _FALSE
+            return
+        match alpha:
+            case tn.Asgn(name, e):
+                st.env[name] = self.define(name, self.enc(e, st.env))
+            case tn.Output(e):
+                st.env['#stdout'] = self.define('#stdout', self.enc(e, st.env))
+            case tn.Skip():
+                pass
+            case tn.Abort():
+                self.stop(st)
+            case tn.Seq(alpha_p, beta_p):
+                self.run(alpha_p, st, depth)
+                self.run(beta_p, st, depth)
+            case tn.Block(stmts):
+                for beta in stmts:
+                    self.run(beta, st, depth)
+            case tn.If(q, alpha_p, beta_p):
+                self.branch(self.enc(q, st.env), alpha_p, beta_p, st, depth)
+            case tn.While(q, alpha_p):
+                self.branch(
+                    self.enc(q, st.env), _Unrolled(alpha_p, alpha), tn.Skip(),
+                    st, depth)
+            case _Unrolled(body, loop):
+                self.run(body, st, depth)
+                self.run(loop, st, depth-1)
+            case _:
+                raise TypeError(
+                    f"run got {type(alpha)} ({alpha}), not Prog"
+                )
+
+
+class _Unrolled:
+    """
+    One unrolling of a loop: its body, executed at the loop's depth,
+    followed by the loop itself with one unrolling fewer.
+    """
+    __match_args__ = ('body', 'loop')
+    __slots__ = __match_args__
+
+    def __init__(self, body: tn.Prog, loop: tn.While):
+        self.body = body
+        self.loop = loop
+
+
+def _and(p: z3.BoolRef, q: z3.BoolRef) -> z3.BoolRef:
+    if z3.is_true(p) or z3.is_false(q):
+        return q
+    if z3.is_true(q) or z3.is_false(p):
+        return p
+    return z3.And(p, q)
+
+
+def _or(p: z3.BoolRef, q: z3.BoolRef) -> z3.BoolRef:
+    if z3.is_false(p) or z3.is_true(q):
+        return q
+    if z3.is_false(q) or z3.is_true(p):
+        return p
+    return z3.Or(p, q)
+
+
+def encode(
+    alpha: tn.Prog,
+    postcondition: z3.BoolRef,
+    max_depth: int=10,
+    depth_exceed_strict: bool=True
+) -> z3.BoolRef:
+    """
+    Encode the traces of a program that violate a postcondition, for
+    bounded model checking. The result is satisfiable iff the negation
+    of `box(alpha, postcondition, max_depth, depth_exceed_strict)` is,
+    and the values its models give to the program variables are the
+    violating initial states.
+
+    The program is unrolled and converted to static single assignment
+    form (see `_Ssa`). The postcondition is instantiated only once, on
+    the final state, which merges the state at the end of the program
+    with the states where it aborts, so unlike `box` it is never copied
+    into the branches of a conditional.
+
+    Args:
+        alpha (tn.Prog): Program to encode
+        postcondition (z3.BoolRef): Formula that should hold whenever
+            the program ends
+        max_depth (int, optional): Loop unrolling depth; defaults to
+            `10`.
+        depth_exceed_strict (bool, optional): Whether traces cut off
+            by the unrolling depth count as violations; defaults to
+            `True`.
+
+    Returns:
+        z3.BoolRef: The conjunction of the definitions of the fresh
+            constants with the condition that some trace violates
+            the postcondition
+
+    Raises:
+        TypeError: `alpha` isn't a program
+    """
+    ssa = _Ssa(depth_exceed_strict)
+    st = _State({}, _TRUE, _FALSE, {})
+    ssa.run(alpha, st, max_depth)
+    ended = z3.simplify(_or(st.active, st.stopped))
+    env = ssa.merge(st.active, st.env, st.stop_env)
+    post = z3.substitute(postcondition, *(
+        (ssa.var(name), t) for name, t in env.items()))
+    violated = _and(ended, z3.Not(post))
+    for cut in ssa.cutoffs:
+        violated = _or(violated, cut)
+    return z3.And(ssa.defs + [violated])
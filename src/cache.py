@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+from tinyscript_util import check_sat, model_from_values, model_values
+from typing import Callable, Optional
+import hashlib
+import json
+import sqlite3
+import time
+import z3
+
+
+# Operators whose arguments can be put in any order
+_COMMUTATIVE = frozenset((
+    z3.Z3_OP_AND, z3.Z3_OP_OR, z3.Z3_OP_XOR, z3.Z3_OP_ADD, z3.Z3_OP_MUL,
+    z3.Z3_OP_EQ, z3.Z3_OP_DISTINCT,
+))
+
+
+def _digest(*parts: str | bytes) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode() if isinstance(part, str) else part)
+        h.update(b"\0")
+    return h.digest()
+
+
+def canonicalize(ps: list[z3.BoolRef]) -> tuple[str, list[str]]:
+    """
+    Compute a key for a list of formulas that is the same for formulas
+    that differ only in the names of their constants, such as those
+    with fresh constants from different runs, or in the order of the
+    arguments of commutative operators, which Z3's simplifier sorts by
+    the internal ids of their terms. It hashes the canonical form of
+    the formulas: the arguments of commutative operators are sorted by
+    a hash of their structure that ignores the names of constants, and
+    the constants are then renamed to `v0`, `v1`, ... in order of first
+    occurrence. Hashing the structure directly, rather than the
+    SMT-LIB serialization of the canonical form, avoids building it.
+
+    Args:
+        ps (list[z3.BoolRef]): Formulas to hash
+
+    Returns:
+        tuple[str, list[str]]: The key, and the original name of each
+            renamed constant, in order
+    """
+    # Visit the formulas as a DAG in postorder, labelling each node by
+    # its operator or, for constants, by their sort alone
+    order, nodes, shapes = [], {}, {}
+    stack = [(p, None) for p in reversed(ps)]
+    while stack:
+        e, children = stack.pop()
+        i = e.get_id()
+        if children is not None:
+            order.append(i)
+            if len(children) > 1 and nodes[i][0][0] in _COMMUTATIVE:
+                children.sort(key=lambda c: shapes[c])
+            shapes[i] = _digest(nodes[i][1], *(shapes[c] for c in children))
+            continue
+        if i in nodes:
+            continue
+        kind = e.decl().kind() if z3.is_app(e) else None
+        if kind == z3.Z3_OP_UNINTERPRETED and e.num_args() == 0:
+            nodes[i] = ((kind, e), "const " + e.sort().sexpr(), [])
+            stack.append((e, []))
+            continue
+        args = e.children()
+        label = f"{kind} {e.decl().name()}" if args else e.sexpr()
+        children = [c.get_id() for c in args]
+        nodes[i] = ((kind, None), label, children)
+        stack.append((e, children))
+        stack.extend((c, None) for c in reversed(args))
+    # Rename the constants in order of first occurrence in the sorted
+    # formulas, and hash them again with the new names
+    consts, index = [], {}
+    stack = [p.get_id() for p in reversed(ps)]
+    while stack:
+        i = stack.pop()
+        if i in index:
+            continue
+        index[i] = None
+        (_, const), _, children = nodes[i]
+        if const is not None:
+            index[i] = len(consts)
+            consts.append(const)
+        else:
+            stack.extend(reversed(children))
+    hashes = {}
+    for i in order:
+        (_, const), label, children = nodes[i]
+        if const is not None:
+            hashes[i] = _digest(label, str(index[i]))
+        else:
+            hashes[i] = _digest(label, *(hashes[c] for c in children))
+    key = _digest(*(hashes[p.get_id()] for p in ps)).hex()
+    return key, [c.decl().name() for c in consts]
+
+
+class SolverCache:
+    """
+    A persistent cache of satisfiability results, stored in an SQLite
+    database. Formulas are looked up by a hash of their canonical form
+    (see `canonicalize`), and each entry holds the result with the
+    values of the model for `z3.sat`, and for `z3.unknown` the timeout
+    it was obtained with, since a longer one may give a definite
+    answer. When the entries take more than `max_bytes`, the least
+    recently used ones are evicted.
+
+    Its `check_sat` method can be passed as the `solver` argument of
+    `find_violation` and the `symbolic_check` functions.
+    """
+    def __init__(
+        self,
+        path: str='.solver_cache.sqlite',
+        max_bytes: int=64 << 20,
+        solver: Callable[..., tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]=check_sat
+    ):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, model TEXT, "
+            "timeout REAL, size INTEGER NOT NULL, used REAL NOT NULL)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+        self.db.commit()
+        self.max_bytes = max_bytes
+        self.solver = solver
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self) -> 'SolverCache':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(
+        self,
+        key: str,
+        names: list[str],
+        ps: list[z3.BoolRef],
+        timeout: Optional[float]
+    ) -> Optional[tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]:
+        row = self.db.execute(
+            "SELECT result, model, timeout FROM results WHERE key = ?",
+            (key,)).fetchone()
+        if row is None:
+            return None
+        result, model, cached_timeout = row
+        if result == 'unknown':
+            if cached_timeout is not None and (
+                    timeout is None or timeout > cached_timeout):
+                return None
+            res = (z3.unknown, None)
+        elif result == 'unsat':
+            res = (z3.unsat, None)
+        else:
+            values = {names[int(c[1:])]: v for c, v in json.loads(model).items()}
+            m = model_from_values(ps, values)
+            if m is None:
+                return None
+            res = (z3.sat, m)
+        # Committed with the next store, or on closing
+        self.db.execute(
+            "UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        return res
+
+    def store(
+        self,
+        key: str,
+        names: list[str],
+        res: z3.CheckSatResult,
+        model: Optional[z3.ModelRef],
+        timeout: Optional[float]
+    ):
+        data = None
+        if model is not None:
+            canon = {x: f'v{i}' for i, x in enumerate(names)}
+            data = json.dumps({
+                canon[x]: v for x, v in model_values(model).items() if x in canon})
+        size = len(key) + len(data or '')
+        self.db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            (key, str(res), data, timeout if res == z3.unknown else None,
+             size, time.time()))
+        total, = self.db.execute("SELECT SUM(size) FROM results").fetchone()
+        if total > self.max_bytes:
+            evicted = []
+            for old, old_size in self.db.execute(
+                    "SELECT key, size FROM results ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((old,))
+                total -= old_size
+            self.db.executemany("DELETE FROM results WHERE key = ?", evicted)
+        self.db.commit()
+
+    def check_sat(
+        self,
+        ps: list[z3.BoolRef],
+        timeout: Optional[float]=None
+    ) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+        """
+        Check a list of formulas for satisfiability like `check_sat`,
+        answering from the cache when it has an entry for them.
+        Results of `z3.unknown` are reused only for timeouts up to the
+        one they were obtained with.
+
+        Args:
+            ps (list[z3.BoolRef]): Formulas to check
+            timeout (float, optional): Timeout in seconds, or `None` for
+                no timeout. Defaults to `None`.
+
+        Returns:
+            tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: As for
+                `check_sat`
+        """
+        key, names = canonicalize(ps)
+        cached = self.lookup(key, names, ps, timeout)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        res, model = self.solver(ps, timeout)
+        self.store(key, names, res, model, timeout)
+        return res, model
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+from functools import lru_cache
+from interpreter import Status
+from tinyscript_util import vars_formula, vars_term
+from typing import Callable, Optional
+import interpreter as interp
+import re
+import tinyscript as tn
+
+
+def term_compile(e: tn.Term, slots: dict[str, str]) -> str:
+    """
+    Translate a tinyscript term to an equivalent Python expression,
+    where each variable is read from the Python local named by its
+    slot. Evaluating the expression raises `UnboundLocalError` exactly
+    when `interpreter.term_exc` raises for an undefined variable.
+
+    Args:
+        e (tn.Term): Term to translate
+        slots (dict[str, str]): Local variable name for each tinyscript
+            variable in `e`
+
+    Returns:
+        str: Python expression
+
+    Raises:
+        TypeError: If the argument isn't a valid tinyscript term
+    """
+    match e:
+        case tn.Const(val):
+            return f"({val})"
+        case tn.Var(name):
+            return slots[name]
+        case tn.Sum(left, right):
+            return f"({term_compile(left, slots)} + {term_compile(right, slots)})"
+        case tn.Difference(left, right):
+            return f"({term_compile(left, slots)} - {term_compile(right, slots)})"
+        case tn.Product(left, right):
+            return f"({term_compile(left, slots)} * {term_compile(right, slots)})"
+        case _:
+            raise TypeError(
+                f"term_compile got {type(e)} ({e}), not Term"
+            )
+
+
+def fmla_compile(p: tn.Formula, slots: dict[str, str]) -> str:
+    """
+    Translate a tinyscript formula to an equivalent Python expression,
+    reading variables as `term_compile` does. Connectives short-circuit
+    in the same order as `interpreter.fmla_exc`.
+
+    Args:
+        p (tn.Formula): Formula to translate
+        slots (dict[str, str]): Local variable name for each tinyscript
+            variable in `p`
+
+    Returns:
+        str: Python expression
+
+    Raises:
+        TypeError: If the argument isn't a valid tinyscript formula
+    """
+    match p:
+        case tn.TrueC():
+            return "True"
+        case tn.FalseC():
+            return "False"
+        case tn.NotF(q):
+            return f"(not {fmla_compile(q, slots)})"
+        case tn.AndF(p, q):
+            return f"({fmla_compile(p, slots)} and {fmla_compile(q, slots)})"
+        case tn.OrF(p, q):
+            return f"({fmla_compile(p, slots)} or {fmla_compile(q, slots)})"
+        case tn.ImpliesF(p, q):
+            return f"((not {fmla_compile(p, slots)}) or {fmla_compile(q, slots)})"
+        case tn.EqF(left, right):
+            return f"({term_compile(left, slots)} == {term_compile(right, slots)})"
+        case tn.LtF(left, right):
+            return f"({term_compile(left, slots)} < {term_compile(right, slots)})"
+        case _:
+            raise TypeError(
+                f"fmla_compile got {type(p)} ({p}), not Formula"
+            )
+
+
+class _Codegen:
+    """
+    Emits a Python function `run(v, n)` equivalent to a tinyscript
+    program, where `v` is the initial variable dictionary and `n` is the
+    number of remaining steps, or `None` if execution is unbounded.
+
+    Each tinyscript variable is resolved ahead of time to a slot, which
+    is a local variable of `run`, so reads and assignments index the
+    frame's fixed array of locals rather than hashing names into a
+    dictionary. Slots of variables missing from `v` start out unbound.
+    The function returns the final status, the remaining steps, and its
+    locals, followed by the exception raised during evaluation if the
+    status is `Status.Error`. Step accounting follows `interpreter.exc`:
+
+        - Executing a statement when no steps remain yields `Maxsteps`.
+        - Assignments, outputs, skips, and aborts take one step; a
+          statement that fails to evaluate an expression takes none.
+        - A loop whose body uses up the last step yields `Maxsteps`,
+          and every iteration uses at least one step.
+    """
+    def __init__(self, bounded: bool):
+        self.bounded = bounded
+        self.lines = []
+        self.loops = 0
+        self.slots = {}
+
+    def slot(self, name: str) -> str:
+        if name not in self.slots:
+            self.slots[name] = f"s{len(self.slots)}"
+        return self.slots[name]
+
+    def emit(self, indent: int, line: str):
+        self.lines.append(f"{' '*indent}{line}")
+
+    def term(self, e: tn.Term) -> str:
+        for x in vars_term(e):
+            self.slot(x.name)
+        return term_compile(e, self.slots)
+
+    def fmla(self, p: tn.Formula) -> str:
+        for x in vars_formula(p):
+            self.slot(x.name)
+        return fmla_compile(p, self.slots)
+
+    def stmt(self, alpha: tn.Prog, indent: int):
+        if self.bounded:
+            self.emit(indent, "if n == 0: return (MAXSTEPS, 0, locals())")
+        step = "n -= 1" if self.bounded else "pass"
+        match alpha:
+            case tn.Skip():
+                self.emit(indent, step)
+            case tn.Asgn(name, e):
+                e = self.term(e)
+                self.emit(indent, f"{self.slot(name)} = {e}")
+                self.emit(indent, step)
+            case tn.Output(e):
+                e = self.term(e)
+                self.emit(indent, f"{self.slot('#stdout')} = {e}")
+                self.emit(indent, step)
+            case tn.Abort():
+                self.emit(indent,
+                    "return (ABORTED, n - 1, locals())" if self.bounded else
+                    "return (ABORTED, None, locals())")
+            case tn.Seq(alpha_p, beta_p):
+                self.stmt(alpha_p, indent)
+                self.stmt(beta_p, indent)
+            case tn.Block(stmts):
+                for beta in stmts:
+                    self.stmt(beta, indent)
+            case tn.If(q, alpha_p, beta_p):
+                self.emit(indent, f"if {self.fmla(q)}:")
+                self.stmt(alpha_p, indent+4)
+                self.emit(indent, "else:")
+                self.stmt(beta_p, indent+4)
+            case tn.While(q, alpha_p) if not self.bounded:
+                self.emit(indent, f"while {self.fmla(q)}:")
+                self.stmt(alpha_p, indent+4)
+            case tn.While(q, alpha_p):
+                m = f"m{self.loops}"
+                self.loops += 1
+                self.emit(indent, "while n > 0:")
+                self.emit(indent+4, f"if not {self.fmla(q)}: break")
+                self.emit(indent+4, f"{m} = n")
+                self.stmt(alpha_p, indent+4)
+                self.emit(indent+4, "if n == 0: return (MAXSTEPS, 0, locals())")
+                self.emit(indent+4, f"if n > {m} - 1: n = {m} - 1")
+                self.emit(indent, "else:")
+                self.emit(indent+4, "return (MAXSTEPS, 0, locals())")
+            case _:
+                raise TypeError(
+                    f"prog_compile got {type(alpha)} ({alpha}), not Prog"
+                )
+
+    def source(self, alpha: tn.Prog) -> str:
+        self.stmt(alpha, 8)
+        return "\n".join([
+            "def run(v, n):",
+            *(f"    if {name!r} in v: {slot} = v[{name!r}]"
+              for name, slot in self.slots.items()),
+            "    try:",
+            *self.lines,
+            "    except Exception as e:",
+            "        return (ERROR, n, locals(), e)",
+            "    return (TERMINATED, n, locals())",
+        ])
+
+
+@lru_cache(maxsize=256)
+def prog_compile(
+    alpha: tn.Prog,
+    bounded: bool=True
+) -> Optional[tuple[Callable, dict[str, str]]]:
+    """
+    Compile a tinyscript program to a Python function. Results are
+    cached per program, which is cheap to look up because nodes are
+    hash-consed.
+
+    Args:
+        alpha (tn.Prog): Program to compile
+        bounded (bool, optional): Whether to generate step accounting;
+            code generated without it may only run with `max_steps`
+            set to `None`. Defaults to `True`.
+
+    Returns:
+        Optional[tuple[Callable, dict[str, str]]]: Function taking the
+            initial variable dictionary and the remaining number of
+            steps, and the slot of each variable the program mentions.
+            The function returns a tuple of the final status, the
+            remaining steps, and a dictionary mapping slots to their
+            final values, followed by the exception raised during
+            evaluation if the status is `Status.Error`. `None` is
+            returned if the generated code exceeds the nesting limits
+            of the Python compiler.
+
+    Raises:
+        TypeError: If `alpha` is not a valid tinyscript program
+    """
+    gen = _Codegen(bounded)
+    src = gen.source(alpha)
+    env = {
+        'TERMINATED': Status.Terminated,
+        'ABORTED': Status.Aborted,
+        'ERROR': Status.Error,
+        'MAXSTEPS': Status.Maxsteps,
+    }
+    try:
+        exec(compile(src, f"<tinyscript {id(alpha):#x}>", 'exec'), env)
+    except (SyntaxError, RecursionError, MemoryError):
+        return None
+    return env['run'], gen.slots
+
+
+_UNBOUND_SLOT = re.compile(r"'(s\d+)'")
+
+
+def exc(
+    state: tn.State,
+    alpha: tn.Prog,
+    max_steps: int=None,
+    quiet: bool=False
+) -> tuple[tn.State, Status, int]:
+    """
+    Execute a TinyScript program by compiling it to Python. This is a
+    drop-in replacement for `interpreter.exc`, with the same results
+    and step accounting, that avoids dispatching on every node at
+    every step and copying the state on every assignment. Variables
+    the program defines that were not in `state` may appear in a
+    different order in the final state. Programs too deeply nested
+    for the Python compiler are run by `interpreter.exc` instead.
+
+    Args:
+        state (tn.State): initial state
+        alpha (tn.Prog): program to execute
+        max_steps (int, optional): maximum number of steps to execute
+        quiet (bool, optional): if True, don't print interpreter errors
+
+    Returns:
+        tuple[tn.State, Status, int]: final state, final status, # steps remaining
+    """
+    compiled = prog_compile(alpha, max_steps is not None)
+    if compiled is None:
+        return interp.exc(state, alpha, max_steps, quiet)
+    run, slots = compiled
+    status, steps, env, *err = run(state.variables, max_steps)
+    v = dict(state.variables)
+    for name, slot in slots.items():
+        if slot in env:
+            v[name] = env[slot]
+    if err and not quiet:
+        e, = err
+        if isinstance(e, UnboundLocalError):
+            slot = _UNBOUND_SLOT.search(str(e)).group(1)
+            name = next(name for name, s in slots.items() if s == slot)
+            e = RuntimeError(
+                f"Variable {name} undefined in state {tn.State(v)}")
+        print('Interpreter Error:', str(e))
+    return (tn.State(v), status, steps)
@@ -1,45 +1,408 @@
 #!/usr/bin/env python3
 
-from symbolic import box, Result
+from collections import Counter
+from optimize import fold_prog
+from symbolic import (
+	box,
+	confirm_violations,
+	find_violation,
+	find_violations,
+	Result
+)
 from tinyscript_util import (
 	check_sat,
-	stringify
+	stringify,
+	vars_formula,
+	vars_prog,
+	vars_term
 )
+from typing import Optional
 import tinyscript as tn
+import z3
+
+# Set by the instrumented program when it uses an undefined variable
+VIOLATED = '#violated'
+
+# Number of programs decided by each stage of `symbolic_check`:
+# `'dataflow'` for `dataflow_check`, `'symbolic'` for the solver
+DECIDED_BY = Counter()
+
+def def_var(name: str) -> str:
+	"""
+	Name of the flag that records whether variable `name` is defined.
+	"""
+	return f"#def_{name}"
 
-def instrument(alpha: tn.Prog) -> tn.Prog:
+def _conj(ps: list[tn.Formula]) -> tn.Formula:
+	ps = [p for p in ps if not isinstance(p, tn.TrueC)]
+	if not ps:
+		return tn.TrueC()
+	res = ps[0]
+	for p in ps[1:]:
+		res = tn.AndF(res, p)
+	return res
+
+def defined_term(e: tn.Term, known: frozenset[str]=frozenset()) -> tn.Formula:
+	"""
+	A formula that holds iff every variable in `e` is defined,
+	leaving out those in `known`, which are defined already.
+	"""
+	return _conj([
+		tn.EqF(tn.Var(def_var(x.name)), tn.Const(1))
+		for x in vars_term(e) if x.name not in known])
+
+def defined_fmla(p: tn.Formula, known: frozenset[str]=frozenset()) -> tn.Formula:
+	"""
+	A formula that holds iff evaluating `p` only uses defined
+	variables, leaving out those in `known`. Connectives
+	short-circuit as in the interpreter, so the second operand of
+	`&&`, `||` and `->` only needs to be defined when the first does
+	not decide the result.
+	"""
+	match p:
+		case tn.TrueC() | tn.FalseC():
+			return tn.TrueC()
+		case tn.NotF(q):
+			return defined_fmla(q, known)
+		case tn.AndF(p1, q):
+			return _conj([
+				defined_fmla(p1, known), _implied(p1, defined_fmla(q, known))])
+		case tn.OrF(p1, q):
+			return _conj([
+				defined_fmla(p1, known),
+				_implied(tn.NotF(p1), defined_fmla(q, known))])
+		case tn.ImpliesF(p1, q):
+			return _conj([
+				defined_fmla(p1, known), _implied(p1, defined_fmla(q, known))])
+		case tn.EqF(left, right) | tn.LtF(left, right):
+			return _conj([defined_term(left, known), defined_term(right, known)])
+		case _:
+			raise TypeError(
+				f"defined_fmla got {type(p)} ({p}), not Formula"
+			)
+
+def _implied(p: tn.Formula, q: tn.Formula) -> tn.Formula:
+	return q if isinstance(q, tn.TrueC) else tn.ImpliesF(p, q)
+
+def site_var(i: int) -> str:
+	"""
+	Name of the flag set by the `i`-th check when checks are recorded
+	by site (see `instrument`).
+	"""
+	return f"{VIOLATED}_{i}"
+
+def _stop(target: Optional[str], site: Optional[int]) -> tn.Prog:
+	"""
+	The statement that ends a trace after a check of site `site`, or
+	of `#violated` if that is `None`, has recorded a violation (see
+	`instrument`).
+	"""
+	if target is None:
+		return tn.Abort()
+	return tn.If(
+		tn.EqF(tn.Var(target), tn.Const(site or 0)), tn.Abort(), tn.Skip())
+
+def _use(
+	d: tn.Formula,
+	sites: Optional[list[tn.Prog]],
+	alpha: tn.Prog,
+	site: Optional[int]=None,
+	target: Optional[str]=None) -> list[tn.Prog]:
+	"""
+	Statements that record a violation unless `d` holds, for a use in
+	statement `alpha`, and then end the trace, as the interpreter
+	does, so that a loop cut off later by the unrolling depth cannot
+	hide the violation. If `sites` is given, the check sets the flag
+	of site `site`, or if that is `None`, of a new site for `alpha`,
+	appended to `sites`. If `target` is given, the trace only ends
+	when it selects the check (see `_stop`).
+	"""
+	if isinstance(d, tn.TrueC):
+		return []
+	flag = VIOLATED
+	if sites is not None:
+		if site is None:
+			site = len(sites)
+			sites.append(alpha)
+		flag = site_var(site)
+	return [tn.If(d, tn.Skip(), tn.Block.of([
+		tn.Asgn(flag, tn.Const(1)), _stop(target, site)]))]
+
+def _meet(
+	must_a: Optional[frozenset[str]],
+	must_b: Optional[frozenset[str]]) -> Optional[frozenset[str]]:
+	if must_a is None or must_b is None:
+		return must_b if must_a is None else must_a
+	return must_a & must_b
+
+def _track(
+	alpha: tn.Prog,
+	must: Optional[frozenset[str]],
+	sites: Optional[list[tn.Prog]]=None,
+	target: Optional[str]=None) -> tuple[tn.Prog, Optional[frozenset[str]], bool]:
+	"""
+	Instrument a statement, given the variables `must` that are
+	defined on every path to it, or `None` if it is unreachable.
+	This is a must-defined dataflow analysis: uses of variables in
+	`must` cannot be undefined, so they are not checked. Returns the
+	instrumented statement, the variables defined on every path
+	after it, and whether it checks any use. If `sites` is given,
+	each check sets its own flag, and `target` selects the checks
+	that end the trace (see `_use`).
+	"""
+	if must is None:
+		return alpha, None, False
+	match alpha:
+		case tn.Asgn(name, e):
+			use = _use(defined_term(e, must), sites, alpha, target=target)
+			# A variable in `must` got there by an assignment that
+			# already set its flag on every path
+			if name in must:
+				return tn.Block.of(use + [alpha]), must, bool(use)
+			return tn.Block.of(use + [
+				alpha, tn.Asgn(def_var(name), tn.Const(1))]), must | {name}, bool(use)
+		case tn.Output(e):
+			use = _use(defined_term(e, must), sites, alpha, target=target)
+			return tn.Block.of(use + [alpha]), must, bool(use)
+		case tn.Skip():
+			return alpha, must, False
+		case tn.Abort():
+			return alpha, None, False
+		case tn.Seq(alpha_p, beta_p):
+			alpha_t, must, checked_a = _track(alpha_p, must, sites, target)
+			beta_t, must, checked_b = _track(beta_p, must, sites, target)
+			return tn.Seq(alpha_t, beta_t), must, checked_a or checked_b
+		case tn.Block(stmts):
+			res, checked = [], False
+			for beta in stmts:
+				beta_t, must, checked_b = _track(beta, must, sites, target)
+				res.append(beta_t)
+				checked = checked or checked_b
+			return tn.Block.of(res), must, checked
+		case tn.If(q, alpha_p, beta_p):
+			use = _use(defined_fmla(q, must), sites, alpha, target=target)
+			alpha_t, must_a, checked_a = _track(alpha_p, must, sites, target)
+			beta_t, must_b, checked_b = _track(beta_p, must, sites, target)
+			return tn.Block.of(use + [tn.If(q, alpha_t, beta_t)]), \
+				_meet(must_a, must_b), bool(use) or checked_a or checked_b
+		case tn.While(q, alpha_p):
+			# The condition is evaluated on entry and after each
+			# iteration. Every iteration starts with at least the
+			# variables defined on entry, and the loop may not run.
+			site = None if sites is None else len(sites)
+			use = _use(defined_fmla(q, must), sites, alpha, target=target)
+			alpha_t, must_end, checked = _track(alpha_p, must, sites, target)
+			# Both checks of the condition are of the same site
+			use_end = [] if must_end is None else _use(
+				defined_fmla(q, must_end), sites, alpha, site if use else None, target)
+			return tn.Block.of(use + [
+				tn.While(q, tn.Block.of([alpha_t] + use_end))]), \
+				must, bool(use) or checked or bool(use_end)
+		case _:
+			raise TypeError(
+				f"instrument got {type(alpha)} ({alpha}), not Prog"
+			)
+
+def _evaluated(p: tn.Formula) -> list[tn.Var]:
+	"""
+	The variables that evaluating `p` always reads, whatever the
+	values: short-circuiting connectives may skip their second operand.
+	"""
+	match p:
+		case tn.EqF() | tn.LtF():
+			return vars_formula(p)
+		case tn.NotF(q) | tn.AndF(q, _) | tn.OrF(q, _) | tn.ImpliesF(q, _):
+			return _evaluated(q)
+	return []
+
+def _has(alpha: tn.Prog, kinds: tuple[type, ...]) -> bool:
+	"""
+	Whether `alpha` has a statement of one of the given types.
+	"""
+	if isinstance(alpha, kinds):
+		return True
+	match alpha:
+		case tn.Seq(alpha_p, beta_p) | tn.If(_, alpha_p, beta_p):
+			return _has(alpha_p, kinds) or _has(beta_p, kinds)
+		case tn.Block(stmts):
+			return any(_has(beta, kinds) for beta in stmts)
+		case tn.While(_, alpha_p):
+			return _has(alpha_p, kinds)
+	return False
+
+def _undefined_use(
+	alpha: tn.Prog,
+	may: frozenset[str]) -> tuple[bool, Optional[frozenset[str]]]:
+	"""
+	Look for a use of a variable that is undefined on every path to
+	it, at a point that every trace reaches, before any loop, given
+	the variables
+	`may` that are defined on some path to `alpha`. Returns whether
+	there is one, and the variables defined on some path after
+	`alpha`, or `None` if not every trace gets past it.
+	"""
+	def undefined(vs: list[tn.Var]) -> bool:
+		return any(x.name not in may for x in vs)
+
+	match alpha:
+		case tn.Asgn(name, e):
+			return undefined(vars_term(e)), may | {name}
+		case tn.Output(e):
+			return undefined(vars_term(e)), may
+		case tn.Skip():
+			return False, may
+		case tn.Seq(alpha_p, beta_p):
+			return _undefined_use(tn.Block((alpha_p, beta_p)), may)
+		case tn.Block(stmts):
+			for beta in stmts:
+				found, may = _undefined_use(beta, may)
+				if found or may is None:
+					return found, may
+			return False, may
+		case tn.If(q, alpha_p, beta_p):
+			if undefined(_evaluated(q)):
+				return True, may
+			if _has(alpha, (tn.While, tn.Abort)):
+				return False, None
+			return False, may | {x.name for x in vars_prog(alpha)}
+		case tn.While(q, _):
+			return undefined(_evaluated(q)), None
+	return False, None
+
+def dataflow_check(alpha: tn.Prog) -> Result:
+	"""
+	Decides the define-before-use policy without a solver when a
+	dataflow analysis suffices. After folding constants with
+	`optimize.fold_prog`, a must-defined analysis proves that every
+	use is of a variable defined on every path to it, or a
+	may-defined analysis finds a use that every trace reaches before
+	any loop, of a variable defined on no path to it. Since the
+	instrumented program ends the trace at such a use, the unrolling
+	depth does not matter.
+	
+	Args:
+	    alpha (tn.Prog): Program to check
+	
+	Returns:
+	    Result: Result.Satisfies or Result.Violates, as
+	    	`symbolic_check` would return at any unrolling depth,
+	    	or Result.Unknown if the analysis is inconclusive.
+	"""
+	alpha = fold_prog(alpha)
+	_, _, checked = _track(alpha, frozenset())
+	if not checked:
+		return Result.Satisfies
+	found, _ = _undefined_use(alpha, frozenset())
+	return Result.Violates if found else Result.Unknown
+
+def instrument(
+	alpha: tn.Prog,
+	sites: Optional[list[tn.Prog]]=None,
+	target: Optional[str]=None) -> tn.Prog:
 	"""
 	Instruments a program to support symbolic checking 
 	for violations of the define-before-use policy.
 	
 	Args:
 	    alpha (tn.Prog): A tinyscript program to instrument
+	    sites (list[tn.Prog], optional): If given, each checked
+	    	statement is appended to it, and the checks of the
+	    	`i`-th one set the flag `site_var(i)` instead of
+	    	`#violated`.
+	    target (str, optional): If given, a check that records
+	    	a violation only ends the trace when the variable
+	    	`target` equals its site, or `0` without `sites`. The
+	    	program never assigns `target`, so the initial state
+	    	chooses the check a trace stops at, and a program
+	    	instrumented for several policies at once can leave
+	    	the traces of the others running.
 	
 	Returns:
 	    tn.Prog: The instrumented program. It should be possible
 	    	to use the box modality and a satisfiability solver
 	    	to determine whether a trace in the original program
 	    	`alpha` exists that uses an undefined variable.
+	    	No variable is defined initially. The flag `#def_x`
+	    	records whether `x` has been assigned, and
+	    	`#violated` is set, and the trace ends, when a
+	    	statement is about to use an undefined variable.
+	    	Uses of variables that are defined on every path to
+	    	them are not checked.
+	"""
+	prefix = [tn.Asgn(def_var(x.name), tn.Const(0)) for x in vars_prog(alpha)]
+	tracked, _, _ = _track(alpha, frozenset(), sites, target)
+	flags = [VIOLATED] + [site_var(i) for i in range(len(sites or []))]
+	return tn.Block.of(
+		prefix + [tn.Asgn(flag, tn.Const(0)) for flag in flags] + [tracked])
+
+def localize(
+	alpha: tn.Prog,
+	max_depth: int=1,
+	timeout: int=10
+) -> list[tuple[tn.Prog, Result, Optional[tn.State]]]:
+	"""
+	Checks each statement that may use an undefined variable
+	separately, reporting every one that does with its own
+	witness. Each checked statement sets its own flag (see
+	`instrument`), and the flags are checked by
+	`symbolic.find_violations`, as assumption-guarded queries on
+	one incremental solver, so the program is encoded once
+	rather than once per statement. A trace ends at its first
+	undefined use, as in the interpreter, so a loop cut off after
+	it cannot hide it. The witnesses are then replayed
+	together on the instrumented program by
+	`symbolic.confirm_violations`, and one whose run ends without
+	setting its flag is reported as Result.Unknown.
+	
+	Args:
+	    alpha (tn.Prog): Program to check
+	    max_depth (int, optional): Loop unrolling depth
+	    timeout (int, optional): Solver timeout of each query, in
+	    	seconds
+	
+	Returns:
+	    list[tuple[tn.Prog, Result, Optional[tn.State]]]: For each
+	    	statement whose uses are checked, in program order, the
+	    	statement, the result for its uses as `symbolic_check`
+	    	would give it, and for Result.Violates, an initial
+	    	state from which a trace within the unrolling depth
+	    	reaches it with a variable it uses undefined.
 	"""
-	return alpha
+	sites = []
+	beta = instrument(alpha, sites)
+	flags = [site_var(i) for i in range(len(sites))]
+	found = find_violations(
+		beta, [z3.Int(flag) == 0 for flag in flags], max_depth, False, timeout)
+	return [
+		(site, r, state)
+		for site, (r, state) in zip(sites, confirm_violations(alpha, beta, flags, found))]
 
 def symbolic_check(
 	alpha: tn.Prog, 
 	max_depth: int=1,
-	timeout: int=10
+	timeout: int=10,
+	backend: str='box',
+	solver=check_sat
 ) -> Result:
 	"""
 	Uses the box modality and a satisfiability solver to determine
 	whether there are any traces that attempt to use an undefined
 	variable. This function only considers traces generated after
 	unrolling loops up to `max_depth` times, and will terminate
-	the solver after `timeout` seconds.
+	the solver after `timeout` seconds. Programs that
+	`dataflow_check` decides are not passed to the solver; the
+	stage that decided each program is counted in `DECIDED_BY`.
 	
 	Args:
 	    alpha (tn.Prog): Program to check
 	    max_depth (int, optional): Loop unrolling depth
 	    timeout (int, optional): In seconds; if `None`, then the
 	    	solver cannot timeout
+	    backend (str, optional): Search engine, one of
+	    	`symbolic.BACKENDS`
+	    solver (optional): Function called like `check_sat` by the
+	    	`'box'` and `'bmc'` backends, e.g. the `check_sat`
+	    	method of a `cache.SolverCache`
 	
 	Returns:
 	    Result: The status of the check, one of three values:
@@ -53,10 +416,24 @@ def symbolic_check(
 	    	  solver timed out, returning z3.unknown).
 
 	"""
+	res = dataflow_check(alpha)
+	if res != Result.Unknown:
+		DECIDED_BY['dataflow'] += 1
+		return res
+	DECIDED_BY['symbolic'] += 1
+	post = z3.Int(VIOLATED) == 0
+	res, _ = find_violation(
+		instrument(alpha), post, max_depth, False, timeout, backend,
+		solver=solver)
+	match res:
+		case z3.unsat:
+			return Result.Satisfies
+		case z3.sat:
+			return Result.Violates
 	return Result.Unknown
 
 if __name__ == "__main__":
-	from parser import parse, fmla_parse
+	from parser import parse_file
 	import sys
 	from pathlib import Path
 
@@ -72,18 +449,17 @@ if __name__ == "__main__":
 	for test_file in list(TEST_DIR.iterdir()):
 		if not str(test_file).endswith('tinyscript'):
 			continue
-		with test_file.open() as f:
-			prog = parse(f.read())
-			res = symbolic_check(prog)
-			print((
-				f"{test_file} result:" 
-				f"{res}"))
-			match res:
-				case Result.Satisfies:
-					passed += 1
-				case Result.Violates:
-					violate += 1
-				case Result.Unknown:
-					unknown += 1
+		prog = parse_file(test_file)
+		res = symbolic_check(prog)
+		print((
+			f"{test_file} result:" 
+			f"{res}"))
+		match res:
+			case Result.Satisfies:
+				passed += 1
+			case Result.Violates:
+				violate += 1
+			case Result.Unknown:
+				unknown += 1
 
 	print(f"\n{passed=}, {violate=}, {unknown=}")
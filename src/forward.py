@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+from tinyscript_util import Encoder
+from typing import Callable, Optional
+import time
+import tinyscript as tn
+import z3
+
+# A continuation is either `None`, for the end of the program, or a
+# pair of the next statement, with the unrolling level it runs at, and
+# the continuation after it. Continuations share their tails, so pushing
+# a statement is O(1) however much of the program remains.
+Cont = Optional[tuple[tuple[tn.Prog, int], 'Cont']]
+
+# A path condition, as a linked list of the branch conditions taken,
+# most recent first
+Conds = Optional[tuple[z3.BoolRef, 'Conds']]
+
+
+class _Path:
+    """
+    A pending path of the exploration: the continuation and symbolic
+    store to resume with, and the conditions `conds` of the branches
+    taken to reach it. A branch of the current path is resumed by
+    adding `cond`, if any, on top of the first `scopes` solver scopes,
+    where the rest of `conds` already holds; a path with `scopes` set
+    to `None` is resumed from scratch.
+    """
+    __slots__ = ('scopes', 'cond', 'conds', 'cont', 'store')
+
+    def __init__(
+        self,
+        scopes: Optional[int],
+        cond: Optional[z3.BoolRef],
+        conds: Conds,
+        cont: Cont,
+        store: dict[str, z3.ExprRef]
+    ):
+        self.scopes = scopes
+        self.cond = cond
+        self.conds = conds
+        self.cont = cont
+        self.store = store
+
+
+class Explorer:
+    """
+    Forward symbolic execution of a program, looking for a path that
+    ends in a state violating a postcondition.
+
+    The symbolic store maps each variable to its value in terms of the
+    initial state, where variable `x` starts as `z3.Int('x')`, so a
+    model of a path condition is an initial state that follows the
+    path. Paths are explored depth-first on one incremental solver:
+    each branch pushes a scope with its condition, and backtracking pops
+    back to the scope the branch was taken in, so the solver keeps what
+    it learned about the shared prefix. Branch conditions that simplify
+    to a constant, which is common after constant assignments, are
+    decided without calling the solver, and infeasible branches are
+    pruned as soon as they are reached.
+
+    Loops are unrolled as by `symbolic.box`. Each statement runs at a
+    level, the number of loop iterations its enclosing loops have
+    completed: the body of a loop reached at level `k` runs at level
+    `k`, and the loop is reached again at level `k+1`. Reaching a loop
+    at level `max_depth` cuts the path off, which is the same as
+    reaching it with depth `0` in `box`. Cut-off paths violate the
+    postcondition if `strict` is set, and are dropped otherwise; either
+    way they are kept in `frontier`, so that they can be resumed with a
+    larger `max_depth` (see `deepen`). An `abort` ends its path, which
+    must satisfy the postcondition where it is executed.
+
+    Unlike `box`, the number of paths, and so the work done, can be
+    exponential in the number of conditionals in sequence; the
+    advantage is that infeasible paths cost nothing beyond the check
+    that rules them out.
+    """
+    def __init__(
+        self,
+        postcondition: z3.BoolRef,
+        max_depth: int,
+        strict: bool,
+        timeout: Optional[float]
+    ):
+        self.post = postcondition
+        self.max_depth = max_depth
+        self.strict = strict
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.solver = z3.Solver()
+        self.encoder = Encoder()
+        self.post_names = tuple(
+            str(x) for x in z3.z3util.get_vars(postcondition))
+        self.frontier = []
+        self.unknown = False
+
+    def var(self, name: str) -> z3.ArithRef:
+        return self.encoder.var(name)
+
+    def enc(
+        self,
+        e: tn.Term | tn.Formula,
+        store: dict[str, z3.ExprRef]
+    ) -> z3.ExprRef:
+        """
+        Encode a term or formula, substituting the values in `store` for
+        the variables it mentions and folding constants.
+        """
+        f, names = self.encoder.enc(e), self.encoder.names(e)
+        return self.subst(f, names, store)
+
+    def subst(
+        self,
+        f: z3.ExprRef,
+        names: tuple[str, ...],
+        store: dict[str, z3.ExprRef]
+    ) -> z3.ExprRef:
+        pairs = [(self.var(x), store[x]) for x in names if x in store]
+        return z3.simplify(z3.substitute(f, *pairs)) if pairs else f
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def check(self, *ps: z3.BoolRef) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+        """
+        Check the current path condition together with `ps`, within
+        the time left, returning a model if they are satisfiable. A
+        result of `z3.unknown` is remembered, as it means that the
+        search can no longer conclude that there is no violation.
+        """
+        if self.deadline is not None:
+            left = self.deadline - time.monotonic()
+            if left <= 0:
+                self.unknown = True
+                return z3.unknown, None
+            self.solver.set(timeout=max(1, int(left*1000)))
+        self.solver.push()
+        self.solver.add(*ps)
+        res = self.solver.check()
+        model = self.solver.model() if res == z3.sat else None
+        self.solver.pop()
+        if res == z3.unknown:
+            self.unknown = True
+        return res, model
+
+    def feasible(self, cond: z3.BoolRef) -> bool:
+        """
+        Decide whether a branch may be taken. If the solver gives up,
+        the branch is explored, so that no violation is missed.
+        """
+        if z3.is_true(cond):
+            return True
+        if z3.is_false(cond):
+            return False
+        return self.check(cond)[0] != z3.unsat
+
+    def violated(self, store: dict[str, z3.ExprRef]) -> Optional[z3.ModelRef]:
+        """
+        Check whether the postcondition can fail at the end of the
+        current path, returning a model if it can.
+        """
+        post = self.subst(self.post, self.post_names, store)
+        if z3.is_true(post):
+            return None
+        return self.check(z3.Not(post))[1]
+
+    def resume(self, path: _Path):
+        """
+        Set the solver up so that its assertions are the path condition
+        of `path`.
+        """
+        if path.scopes is None:
+            self.solver.pop(self.solver.num_scopes())
+            self.solver.push()
+            conds = path.conds
+            while conds is not None:
+                cond, conds = conds
+                self.solver.add(cond)
+        else:
+            self.solver.pop(self.solver.num_scopes() - path.scopes)
+            if path.cond is not None:
+                self.solver.push()
+                self.solver.add(path.cond)
+
+    def run(self, alpha: tn.Prog) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+        """
+        Explore the paths of a program until one violates the
+        postcondition.
+
+        Returns:
+            tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: `z3.sat`
+                and a model of the initial state if a violating path was
+                found, `z3.unsat` if there is none, and `z3.unknown` if
+                the solver gave up on some path or ran out of time.
+
+        Raises:
+            TypeError: If `alpha` is not a valid tinyscript program
+        """
+        return self.explore([_Path(0, None, None, ((alpha, 0), None), {})])
+
+    def explore(self, paths: list[_Path]) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+        """
+        Explore the given paths, and the paths they branch into, until
+        one violates the postcondition.
+        """
+        while paths:
+            if self.expired():
+                return z3.unknown, None
+            path = paths.pop()
+            self.resume(path)
+            model = self.follow(path.cont, path.store, path.conds, paths)
+            if model is not None:
+                return z3.sat, model
+        return (z3.unknown if self.unknown else z3.unsat), None
+
+    def follow(
+        self,
+        cont: Cont,
+        store: dict[str, z3.ExprRef],
+        conds: Conds,
+        paths: list[_Path]
+    ) -> Optional[z3.ModelRef]:
+        """
+        Execute a continuation on the current path, whose condition is
+        `conds`, until it ends or branches. The feasible branches are
+        pushed onto `paths`, the then-branch last so that it is
+        explored first.
+        """
+        while cont is not None:
+            (alpha, level), rest = cont
+            if level >= self.max_depth:
+                self.frontier.append(_Path(None, None, conds, cont, store))
+                return self.check()[1] if self.strict else None
+            cont = rest
+            match alpha:
+                case tn.Asgn(name, e):
+                    store[name] = self.enc(e, store)
+                case tn.Output(e):
+                    store['#stdout'] = self.enc(e, store)
+                case tn.Skip():
+                    pass
+                case tn.Abort():
+                    return self.violated(store)
+                case tn.Seq(alpha_p, beta_p):
+                    cont = ((alpha_p, level), ((beta_p, level), cont))
+                case tn.Block(stmts):
+                    for beta in reversed(stmts):
+                        cont = ((beta, level), cont)
+                case tn.If(q, alpha_p, beta_p):
+                    q = self.enc(q, store)
+                    branches = [
+                        (z3.simplify(z3.Not(q)), ((beta_p, level), cont)),
+                        (q, ((alpha_p, level), cont))]
+                    self.branch(branches, store, conds, paths)
+                    return None
+                case tn.While(q, alpha_p):
+                    q = self.enc(q, store)
+                    branches = [
+                        (z3.simplify(z3.Not(q)), cont),
+                        (q, ((alpha_p, level), ((alpha, level+1), cont)))]
+                    self.branch(branches, store, conds, paths)
+                    return None
+                case _:
+                    raise TypeError(
+                        f"follow got {type(alpha)} ({alpha}), not Prog"
+                    )
+        return self.violated(store)
+
+    def branch(
+        self,
+        branches: list[tuple[z3.BoolRef, Cont]],
+        store: dict[str, z3.ExprRef],
+        conds: Conds,
+        paths: list[_Path]
+    ):
+        feasible = [(c, k) for c, k in branches if self.feasible(c)]
+        scopes = self.solver.num_scopes()
+        for i, (cond, cont) in enumerate(feasible):
+            last = i == len(feasible) - 1
+            # When only one branch is feasible, its condition is implied
+            # by the path so far and need not be asserted
+            if len(feasible) == 1:
+                paths.append(_Path(scopes, None, conds, cont, store))
+            else:
+                paths.append(_Path(
+                    scopes, cond, (cond, conds), cont,
+                    store if last else dict(store)))
+
+    def witness(self, path: _Path) -> Optional[z3.ModelRef]:
+        """
+        Find a model of the condition of a pending path.
+        """
+        self.resume(path)
+        return self.check()[1]
+
+
+def explore(
+    alpha: tn.Prog,
+    postcondition: z3.BoolRef,
+    max_depth: int=10,
+    depth_exceed_strict: bool=True,
+    timeout: Optional[float]=None
+) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+    """
+    Search forward through the paths of a program for an initial state
+    from which it ends in a state violating a postcondition, unrolling
+    loops up to `max_depth` times (see `Explorer`). The result has the
+    same meaning as `check_sat([z3.Not(box(alpha, postcondition,
+    max_depth, depth_exceed_strict))], timeout)`.
+
+    Args:
+        alpha (tn.Prog): Program to explore
+        postcondition (z3.BoolRef): Formula that should hold whenever
+            the program ends
+        max_depth (int, optional): Loop unrolling depth; defaults to
+            `10`
+        depth_exceed_strict (bool, optional): Whether paths cut off by
+            the unrolling depth count as violations; defaults to `True`
+        timeout (float, optional): Timeout in seconds for the whole
+            search, or `None` for no timeout
+
+    Returns:
+        tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: `z3.sat` and
+            a model of the initial state if a violating path exists,
+            `z3.unsat` if none does, and `z3.unknown` otherwise.
+    """
+    explorer = Explorer(postcondition, max_depth, depth_exceed_strict, timeout)
+    return explorer.run(alpha)
+
+
+def deepen(
+    alpha: tn.Prog,
+    postcondition: z3.BoolRef,
+    max_depth: int=10,
+    depth_exceed_strict: bool=True,
+    timeout: Optional[float]=None,
+    confirm: Optional[Callable[[z3.ModelRef], bool]]=None
+) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+    """
+    Search like `explore`, but by iterative deepening: loops are
+    unrolled once, then twice, and so on up to `max_depth` times, and
+    the search stops as soon as the answer is definite. Each round only
+    resumes the paths the previous round cut off, on the same solver,
+    so shallow unrollings are never explored twice.
+
+    The answer is definite when a path that is not cut off violates the
+    postcondition, or when no path is cut off, since then deeper
+    unrollings add no paths. If `depth_exceed_strict` is set, a path
+    cut off before `max_depth` is only a candidate violation: the
+    search stops with the first initial state that follows one of them
+    and that `confirm` accepts, e.g. because running the program from
+    it shows a violation.
+
+    Args:
+        alpha (tn.Prog): Program to explore
+        postcondition (z3.BoolRef): Formula that should hold whenever
+            the program ends
+        max_depth (int, optional): Largest loop unrolling depth to try;
+            defaults to `10`
+        depth_exceed_strict (bool, optional): Whether paths cut off by
+            `max_depth` count as violations; defaults to `True`
+        timeout (float, optional): Timeout in seconds for the whole
+            search, or `None` for no timeout
+        confirm (Callable[[z3.ModelRef], bool], optional): Decides
+            whether the model of a cut-off path witnesses a violation
+
+    Returns:
+        tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: as for
+            `explore` with the same `max_depth`, except that the model
+            may be found at a smaller depth.
+    """
+    explorer = Explorer(postcondition, 1, False, timeout)
+    res, model = explorer.run(alpha)
+    while res != z3.sat and not explorer.expired():
+        paths, explorer.frontier = explorer.frontier, []
+        if not paths:
+            return res, None
+        last = explorer.max_depth >= max_depth
+        if last and not depth_exceed_strict:
+            return res, None
+        if depth_exceed_strict and (last or confirm is not None):
+            first = None
+            for path in paths:
+                model = explorer.witness(path)
+                if model is None:
+                    continue
+                if confirm is not None and confirm(model):
+                    return z3.sat, model
+                first = model if first is None else first
+            if last:
+                return (z3.unknown, None) if first is None else (z3.sat, first)
+        explorer.max_depth += 1
+        res, model = explorer.explore(paths)
+    return (res, model) if res == z3.sat else (z3.unknown, None)
@@ -61,6 +61,106 @@ def exc(
     """
     Execute a TinyScript program.
 
+    Statements are run from an explicit work stack rather than by
+    recursion, so the depth of the Python stack does not grow with
+    the size or nesting of the program, and the state is updated in
+    place on a private copy of `state`. Each entry on the stack is
+    either a statement to execute, or a pair of a loop and the steps
+    remaining when its body was entered, which is popped when the
+    body finishes an iteration.
+
+    Args:
+        state (tn.State): initial state
+        alpha (tn.Prog): program to execute
+        max_steps (int, optional): maximum number of steps to execute
+        quiet (bool, optional): if True, don't print interpreter errors
+
+    Returns:
+        tuple[tn.State, Status, int]: final state, final status, # steps remaining
+    """
+    state = tn.State(dict(state.variables))
+    variables = state.variables
+    stack = [alpha]
+    while stack:
+        alpha = stack.pop()
+        if isinstance(alpha, tuple):
+            alpha, steps = alpha
+            if max_steps is not None:
+                if max_steps == 0:
+                    return (state, Status.Maxsteps, 0)
+                max_steps = min(max_steps, steps-1)
+                if max_steps == 0:
+                    return (state, Status.Maxsteps, 0)
+        if max_steps == 0:
+            return (state, Status.Maxsteps, 0)
+        match alpha:
+            case tn.Asgn(name, e):
+                try:
+                    variables[name] = term_exc(state, e)
+                except BaseException as e:
+                    if not quiet:
+                        print('Interpreter Error:', str(e))
+                    return (state, Status.Error, max_steps)
+                if max_steps is not None:
+                    max_steps -= 1
+            case tn.Block(stmts):
+                stack.extend(reversed(stmts))
+            case tn.While(q, alpha_p):
+                try:
+                    q_val = fmla_exc(state, q)
+                except BaseException as e:
+                    if not quiet:
+                        print('Interpreter Error:', str(e))
+                    return (state, Status.Error, max_steps)
+                if q_val:
+                    stack.append((alpha, max_steps))
+                    stack.append(alpha_p)
+            case tn.If(q, alpha_p, beta_p):
+                try:
+                    q_val = fmla_exc(state, q)
+                except BaseException as e:
+                    if not quiet:
+                        print('Interpreter Error:', str(e))
+                    return (state, Status.Error, max_steps)
+                stack.append(alpha_p if q_val else beta_p)
+            case tn.Output(e):
+                try:
+                    variables['#stdout'] = term_exc(state, e)
+                except BaseException as e:
+                    if not quiet:
+                        print('Interpreter Error:', str(e))
+                    return (state, Status.Error, max_steps)
+                if max_steps is not None:
+                    max_steps -= 1
+            case tn.Skip():
+                if max_steps is not None:
+                    max_steps -= 1
+            case tn.Seq(alpha_p, beta_p):
+                stack.append(beta_p)
+                stack.append(alpha_p)
+            case tn.Abort():
+                return (
+                    state,
+                    Status.Aborted,
+                    max_steps-1 if max_steps is not None else None)
+            case _:
+                raise TypeError(
+                    f"exc got {type(alpha)} ({alpha}), not Prog"
+                )
+    return (state, Status.Terminated, max_steps)
+
+
+def exc_recursive(
+    state: tn.State,
+    alpha: tn.Prog,
+    max_steps: int=None,
+    quiet: bool=False
+) -> tuple[tn.State, Status, int]:
+    """
+    Execute a TinyScript program by recursion on its structure. This
+    is the original formulation of `exc`, which it should agree with;
+    it is kept as a reference for testing and benchmarking.
+
     Args:
         state (tn.State): initial state
         alpha (tn.Prog): program to execute
@@ -71,7 +171,6 @@ def exc(
         tuple[tn.State, Status, int]: final state, final status, # steps remaining
     """
     if max_steps == 0:
-        print("we're 0!")
         return (state, Status.Maxsteps, 0)
     match alpha:
         case tn.Skip():
@@ -91,12 +190,19 @@ def exc(
                 Status.Terminated,
                 max_steps-1 if max_steps is not None else None)
         case tn.Seq(alpha_p, beta_p):
-            o1 = exc(state, alpha_p, max_steps, quiet)
+            o1 = exc_recursive(state, alpha_p, max_steps, quiet)
             match o1[1]:
                 case Status.Maxsteps|Status.Aborted|Status.Error:
                     return o1
                 case Status.Terminated:
-                    return exc(o1[0], beta_p, o1[2], quiet)
+                    return exc_recursive(o1[0], beta_p, o1[2], quiet)
+        case tn.Block(stmts):
+            for beta in stmts:
+                o1 = exc_recursive(state, beta, max_steps, quiet)
+                if o1[1] != Status.Terminated:
+                    return o1
+                state, max_steps = o1[0], o1[2]
+            return (state, Status.Terminated, max_steps)
         case tn.If(q, alpha_p, beta_p):
             try:
                 q_val = fmla_exc(state, q)
@@ -105,9 +211,9 @@ def exc(
                     print('Interpreter Error:', str(e))
                 return (state, Status.Error, max_steps)
             if q_val:
-                return exc(state, alpha_p, max_steps, quiet)
+                return exc_recursive(state, alpha_p, max_steps, quiet)
             else:
-                return exc(state, beta_p, max_steps, quiet)
+                return exc_recursive(state, beta_p, max_steps, quiet)
         case tn.While(q, alpha_p):
             while max_steps is None or max_steps > 0:
                 try:
@@ -118,7 +224,7 @@ def exc(
                     return (state, Status.Error, max_steps)
                 if not q_val:
                     return (state, Status.Terminated, max_steps)
-                state = exc(state, alpha_p, max_steps, quiet)
+                state = exc_recursive(state, alpha_p, max_steps, quiet)
                 match state[1]:
                     case Status.Maxsteps|Status.Aborted|Status.Error:
                         return state
@@ -127,7 +233,7 @@ def exc(
                 if max_steps is not None:
                     max_steps = min(state[2], max_steps-1)
                 state = state[0]
-            return (state, Status.Maxsteps)
+            return (state, Status.Maxsteps, 0)
         case tn.Output(e):
             try:
                 e_val = term_exc(state, e)
@@ -146,7 +252,7 @@ def exc(
                 max_steps-1 if max_steps is not None else None)
         case _:
             raise TypeError(
-                f"exc got {type(alpha)} ({alpha}), not Prog"
+                f"exc_recursive got {type(alpha)} ({alpha}), not Prog"
             )
 
 
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+from typing import Optional
+from optimize import NOOP
+from tinyscript_util import vars_prog
+import itertools
+import math
+import tinyscript as tn
+
+# The least and greatest values of a variable, which are infinite when
+# it has no bound in that direction, and are never empty
+Interval = tuple[int | float, int | float]
+
+TOP = (-math.inf, math.inf)
+
+# Maps variables to the interval of their values at a program point,
+# those missing having any value; `None` stands for an unreachable
+# point
+Env = Optional[dict[str, Interval]]
+
+# Iterations of a loop that are joined exactly before widening
+WIDEN_AFTER = 2
+
+
+def _mul(a: int | float, b: int | float) -> int | float:
+    # Bounds are integers or infinite, and zero times anything is zero
+    return 0 if a == 0 or b == 0 else a * b
+
+
+def interval_term(e: tn.Term, env: dict[str, Interval]) -> Interval:
+    """
+    Compute an interval that contains every value of a term in the
+    states where each variable is in its interval in `env`.
+
+    Args:
+        e (tn.Term): Term to evaluate
+        env (dict[str, Interval]): Intervals of the variables, those
+            missing having any value
+
+    Returns:
+        Interval: The interval of the term
+
+    Raises:
+        TypeError: `e` isn't a term
+    """
+    match e:
+        case tn.Const(value):
+            return value, value
+        case tn.Var(name):
+            return env.get(name, TOP)
+        case tn.Sum(left, right):
+            (a, b), (c, d) = interval_term(left, env), interval_term(right, env)
+            return a + c, b + d
+        case tn.Difference(left, right):
+            (a, b), (c, d) = interval_term(left, env), interval_term(right, env)
+            return a - d, b - c
+        case tn.Product(left, right):
+            (a, b), (c, d) = interval_term(left, env), interval_term(right, env)
+            bounds = [_mul(a, c), _mul(a, d), _mul(b, c), _mul(b, d)]
+            return min(bounds), max(bounds)
+        case _:
+            raise TypeError(
+                f"interval_term got {type(e)} ({e}), not Term"
+            )
+
+
+def join(env_a: Env, env_b: Env) -> Env:
+    """
+    The smallest environment that contains both `env_a` and `env_b`.
+    """
+    if env_a is None or env_b is None:
+        return env_b if env_a is None else env_a
+    return {
+        x: (min(a, c), max(b, d))
+        for x, (a, b) in env_a.items() if x in env_b
+        for c, d in [env_b[x]]}
+
+
+def widen(env_a: Env, env_b: Env) -> Env:
+    """
+    Join `env_b` into `env_a`, dropping the bounds of `env_a` that
+    `env_b` exceeds, so that repeated widening stops growing.
+    """
+    if env_a is None or env_b is None:
+        return env_b if env_a is None else env_a
+    return {
+        x: (a if c >= a else -math.inf, b if d <= b else math.inf)
+        for x, (a, b) in env_a.items() if x in env_b
+        for c, d in [env_b[x]]}
+
+
+def _bound(env: dict[str, Interval], e: tn.Term, lo, hi) -> Env:
+    """
+    Restrict `env` to the states where `e` is within `lo` and `hi`,
+    which only narrows variables, or returns `None` if there are none.
+    """
+    a, b = interval_term(e, env)
+    lo, hi = max(a, lo), min(b, hi)
+    if lo > hi:
+        return None
+    if isinstance(e, tn.Var) and (lo, hi) != (a, b):
+        env = dict(env)
+        env[e.name] = lo, hi
+    return env
+
+
+def refine(p: tn.Formula, env: Env, truth: bool=True) -> Env:
+    """
+    Restrict an environment to the states where `p` has the value
+    `truth`. Comparisons narrow the variables they compare to those
+    of the other side, and connectives combine the restrictions of
+    their operands, so the result contains every such state, and is
+    `None` if `p` can be shown to never have that value.
+
+    Args:
+        p (tn.Formula): Formula to assume
+        env (Env): Environment to restrict
+        truth (bool, optional): Value assumed for `p`; defaults to
+            `True`.
+
+    Returns:
+        Env: The restricted environment
+
+    Raises:
+        TypeError: `p` isn't a formula
+    """
+    if env is None:
+        return None
+    match p:
+        case tn.TrueC():
+            return env if truth else None
+        case tn.FalseC():
+            return None if truth else env
+        case tn.NotF(q):
+            return refine(q, env, not truth)
+        case tn.AndF(q, r) if truth:
+            return refine(r, refine(q, env, True), True)
+        case tn.AndF(q, r):
+            return join(
+                refine(q, env, False),
+                refine(r, refine(q, env, True), False))
+        case tn.OrF(q, r) if truth:
+            return join(
+                refine(q, env, True),
+                refine(r, refine(q, env, False), True))
+        case tn.OrF(q, r):
+            return refine(r, refine(q, env, False), False)
+        case tn.ImpliesF(q, r):
+            return refine(tn.OrF(tn.NotF(q), r), env, truth)
+        case tn.EqF(left, right) if truth:
+            a, b = interval_term(right, env)
+            env = _bound(env, left, a, b)
+            if env is None:
+                return None
+            a, b = interval_term(left, env)
+            return _bound(env, right, a, b)
+        case tn.EqF(left, right):
+            # Only a constant at the end of an interval can be removed
+            for e, other in ((left, right), (right, left)):
+                a, b = interval_term(other, env)
+                if a != b:
+                    continue
+                c, d = interval_term(e, env)
+                if (c, d) == (a, a):
+                    return None
+                if c == a:
+                    env = _bound(env, e, a + 1, d)
+                elif d == a:
+                    env = _bound(env, e, c, a - 1)
+            return env
+        case tn.LtF(left, right):
+            if not truth:
+                left, right = right, left
+            # left < right, or right <= left if the comparison is false
+            gap = 1 if truth else 0
+            _, b = interval_term(right, env)
+            env = _bound(env, left, -math.inf, b - gap)
+            if env is None:
+                return None
+            a, _ = interval_term(left, env)
+            return _bound(env, right, a + gap, math.inf)
+        case _:
+            raise TypeError(
+                f"refine got {type(p)} ({p}), not Formula"
+            )
+
+
+def _run(
+    alpha: tn.Prog,
+    env: Env,
+    at: Optional[dict[int, Env]],
+    memo: dict
+) -> Env:
+    """
+    Execute a statement over intervals from `env`, returning the
+    environment after it, and joining the one before each statement
+    into `at`, by `id`, if given. Loop invariants are shared through
+    `memo` (see `_head`).
+    """
+    if at is not None:
+        i = id(alpha)
+        at[i] = join(at[i], env) if i in at else env
+    if env is None:
+        return None
+    match alpha:
+        case tn.Asgn(name, e):
+            env = dict(env)
+            env[name] = interval_term(e, env)
+            return env
+        case tn.Output() | tn.Skip():
+            return env
+        case tn.Abort():
+            return None
+        case tn.Seq(alpha_p, beta_p):
+            return _run(beta_p, _run(alpha_p, env, at, memo), at, memo)
+        case tn.Block(stmts):
+            for beta in stmts:
+                env = _run(beta, env, at, memo)
+            return env
+        case tn.If(q, alpha_p, beta_p):
+            return join(
+                _run(alpha_p, refine(q, env, True), at, memo),
+                _run(beta_p, refine(q, env, False), at, memo))
+        case tn.While(q, alpha_p):
+            head = _head(q, alpha_p, env, memo)
+            _run(alpha_p, refine(q, head, True), at, memo)
+            return refine(q, head, False)
+        case _:
+            raise TypeError(
+                f"analyze got {type(alpha)} ({alpha}), not Prog"
+            )
+
+
+def _head(q: tn.Formula, alpha: tn.Prog, env: Env, memo: dict) -> Env:
+    """
+    Compute an invariant at the head of `while (q) alpha` entered with
+    `env`, by joining iterations, widening after `WIDEN_AFTER` of them,
+    and then narrowing once.
+
+    The loop leaves the variables it neither reads nor assigns as they
+    are in `env`, so the invariant is computed over the others, and
+    kept in `memo` by the loop and their intervals. A loop nested in
+    another is thus analyzed again only when an iteration of the outer
+    one changes the variables it uses, rather than at every iteration,
+    which would take time exponential in the nesting depth.
+    """
+    if env is None:
+        return None
+    if ('vars', q, alpha) not in memo:
+        memo['vars', q, alpha] = {v.name for v in vars_prog(tn.While(q, alpha))}
+    names = memo['vars', q, alpha]
+    used = {x: i for x, i in env.items() if x in names}
+    key = ('head', q, alpha, tuple(sorted(used.items())))
+    if key not in memo:
+        head = used
+        for i in itertools.count():
+            new = join(used, _run(alpha, refine(q, head, True), None, memo))
+            if i >= WIDEN_AFTER:
+                new = widen(head, new)
+            if new == head:
+                break
+            head = new
+        # The invariant is a post-fixpoint, so one more iteration stays
+        # within it, and recovers the bounds that the exit test implies
+        memo[key] = join(used, _run(alpha, refine(q, head, True), None, memo))
+    return {x: i for x, i in env.items() if x not in names} | memo[key]
+
+
+def analyze(
+    alpha: tn.Prog,
+    env: Env=None
+) -> tuple[Env, dict[int, Env]]:
+    """
+    Compute, for every point of a program, intervals that contain the
+    values of its variables in every execution that reaches it. This
+    is an abstract interpretation of `alpha`, like `interpreter.exc`
+    but over intervals: conditions restrict the environments of the
+    branches and loop bodies they guard with `refine`, branches join,
+    and loops are iterated to a fixed point, with widening at their
+    head, so each loop body is analyzed a few times. The invariant of
+    a nested loop is reused while the variables it uses keep their
+    intervals (see `_head`), so it is not recomputed at every
+    iteration of the loops around it.
+
+    Args:
+        alpha (tn.Prog): Program to analyze
+        env (Env, optional): Intervals of the variables before
+            `alpha`; defaults to any value for each.
+
+    Returns:
+        tuple[Env, dict[int, Env]]: The environment after `alpha`, for
+            the executions that end normally, and the environment
+            before each statement of `alpha`, keyed by its `id`
+
+    Raises:
+        TypeError: `alpha` isn't a program
+    """
+    at = {}
+    return _run(alpha, {} if env is None else env, at, {}), at
+
+
+def _prune(
+    alpha: tn.Prog,
+    env: dict[str, Interval],
+    memo: dict
+) -> tuple[Optional[tn.Prog], Env]:
+    """
+    Prune a statement reached with `env`, returning the result, or
+    `None` if the statement can be removed, and the environment
+    after it. Loop invariants are shared through `memo`, as in `_run`.
+    """
+    match alpha:
+        case tn.Asgn() | tn.Output() | tn.Skip() | tn.Abort():
+            return alpha, _run(alpha, env, None, memo)
+        case tn.Seq(alpha_p, beta_p):
+            return _prune(tn.Block((alpha_p, beta_p)), env, memo)
+        case tn.Block(stmts):
+            res = []
+            for beta in stmts:
+                if env is None:
+                    # The rest of the block is unreachable
+                    break
+                beta_p, env = _prune(beta, env, memo)
+                if beta_p is not None:
+                    res.append(beta_p)
+            return (tn.Block.of(res) if res else None), env
+        case tn.If(q, alpha_p, beta_p):
+            env_t, env_f = refine(q, env, True), refine(q, env, False)
+            if env_f is None:
+                return _prune(alpha_p, env_t, memo)
+            if env_t is None:
+                return _prune(beta_p, env_f, memo)
+            alpha_o, env_a = _prune(alpha_p, env_t, memo)
+            beta_o, env_b = _prune(beta_p, env_f, memo)
+            return tn.If(q, alpha_o or NOOP, beta_o or NOOP), join(env_a, env_b)
+        case tn.While(q, alpha_p):
+            if refine(q, env, True) is None:
+                return None, env
+            head = _head(q, alpha_p, env, memo)
+            alpha_o, _ = _prune(alpha_p, refine(q, head, True), memo)
+            return tn.While(q, alpha_o or NOOP), refine(q, head, False)
+        case _:
+            raise TypeError(
+                f"prune_prog got {type(alpha)} ({alpha}), not Prog"
+            )
+
+
+def prune_prog(alpha: tn.Prog, env: Env=None) -> tn.Prog:
+    """
+    Remove the code of a program that the intervals computed by
+    `analyze` show can never run: conditionals whose condition always
+    or never holds are replaced by the branch they take, loops whose
+    condition never holds on entry are removed, and so are statements
+    after an `abort` or a loop whose condition always holds. This
+    decides the conditions that `optimize.fold_prog` cannot, such as
+    those on variables bounded by an earlier test or a loop, but it
+    replaces no variable by its value.
+
+    Only conditions are removed, and no statement of a trace, so the
+    result can stand in for `alpha` wherever `fold_prog` can. The
+    conditions of uninstrumented programs may however read undefined
+    variables, so only instrumented ones should be pruned for the
+    define-before-use policy.
+
+    Args:
+        alpha (tn.Prog): Program to prune
+        env (Env, optional): Intervals of the variables before
+            `alpha`; defaults to any value for each.
+
+    Returns:
+        tn.Prog: The pruned program, which is `optimize.NOOP` if
+            nothing in `alpha` can run
+
+    Raises:
+        TypeError: `alpha` isn't a program
+    """
+    res, _ = _prune(alpha, {} if env is None else env, {})
+    return NOOP if res is None else res
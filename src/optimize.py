@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+from typing import Optional
+import tinyscript as tn
+
+# Maps the variables whose value is known at a program point to it;
+# `None` stands for an unreachable point
+Env = Optional[dict[str, int]]
+
+# A statement that does nothing, not even count as a step, for places
+# where every statement of a branch was removed
+NOOP = tn.While(tn.FalseC(), tn.Skip())
+
+
+def fold_term(e: tn.Term, env: dict[str, int]) -> tn.Term:
+    """
+    Replace the variables of a term whose value is known by it, and
+    evaluate the operations whose operands are both constants.
+
+    Args:
+        e (tn.Term): Term to fold
+        env (dict[str, int]): Known values of variables
+
+    Returns:
+        tn.Term: The folded term
+
+    Raises:
+        TypeError: `e` isn't a term
+    """
+    match e:
+        case tn.Const(_):
+            return e
+        case tn.Var(name):
+            return tn.Const(env[name]) if name in env else e
+        case tn.Sum(left, right) | tn.Difference(left, right) | \
+                tn.Product(left, right):
+            left_f, right_f = fold_term(left, env), fold_term(right, env)
+            match left_f, right_f, e:
+                case tn.Const(a), tn.Const(b), tn.Sum():
+                    return tn.Const(a + b)
+                case tn.Const(a), tn.Const(b), tn.Difference():
+                    return tn.Const(a - b)
+                case tn.Const(a), tn.Const(b), tn.Product():
+                    return tn.Const(a * b)
+            if left_f is left and right_f is right:
+                return e
+            return type(e)(left_f, right_f)
+        case _:
+            raise TypeError(
+                f"fold_term got {type(e)} ({e}), not Term"
+            )
+
+
+def _bool(b: bool) -> tn.Formula:
+    return tn.TrueC() if b else tn.FalseC()
+
+
+def fold_formula(p: tn.Formula, env: dict[str, int]) -> tn.Formula:
+    """
+    Fold the terms of a formula, evaluate the comparisons between
+    constants, and simplify the connectives with a constant operand.
+    A constant right operand is only removed when that leaves the left
+    one, so every variable that evaluating the formula reads, with
+    short-circuiting, is still read, and undefined uses are kept.
+
+    Args:
+        p (tn.Formula): Formula to fold
+        env (dict[str, int]): Known values of variables
+
+    Returns:
+        tn.Formula: The folded formula
+
+    Raises:
+        TypeError: `p` isn't a formula
+    """
+    match p:
+        case tn.TrueC() | tn.FalseC():
+            return p
+        case tn.EqF(left, right) | tn.LtF(left, right):
+            left_f, right_f = fold_term(left, env), fold_term(right, env)
+            match left_f, right_f, p:
+                case tn.Const(a), tn.Const(b), tn.EqF():
+                    return _bool(a == b)
+                case tn.Const(a), tn.Const(b), tn.LtF():
+                    return _bool(a < b)
+            if left_f is left and right_f is right:
+                return p
+            return type(p)(left_f, right_f)
+        case tn.NotF(q):
+            match fold_formula(q, env):
+                case tn.TrueC():
+                    return tn.FalseC()
+                case tn.FalseC():
+                    return tn.TrueC()
+                case q_f:
+                    return p if q_f is q else tn.NotF(q_f)
+        case tn.AndF(q, r) | tn.OrF(q, r) | tn.ImpliesF(q, r):
+            q_f = fold_formula(q, env)
+            match q_f, p:
+                case tn.FalseC(), tn.AndF() | tn.ImpliesF():
+                    return _bool(isinstance(p, tn.ImpliesF))
+                case tn.TrueC(), tn.OrF():
+                    return tn.TrueC()
+                case tn.TrueC(), tn.AndF() | tn.ImpliesF():
+                    return fold_formula(r, env)
+                case tn.FalseC(), tn.OrF():
+                    return fold_formula(r, env)
+            r_f = fold_formula(r, env)
+            match r_f, p:
+                case tn.TrueC(), tn.AndF():
+                    return q_f
+                case tn.FalseC(), tn.OrF():
+                    return q_f
+            if q_f is q and r_f is r:
+                return p
+            return type(p)(q_f, r_f)
+        case _:
+            raise TypeError(
+                f"fold_formula got {type(p)} ({p}), not Formula"
+            )
+
+
+def _assigned(alpha: tn.Prog) -> set[str]:
+    match alpha:
+        case tn.Asgn(name, _):
+            return {name}
+        case tn.Seq(alpha_p, beta_p) | tn.If(_, alpha_p, beta_p):
+            return _assigned(alpha_p) | _assigned(beta_p)
+        case tn.Block(stmts):
+            return set().union(*(_assigned(beta) for beta in stmts))
+        case tn.While(_, alpha_p):
+            return _assigned(alpha_p)
+    return set()
+
+
+def _merge(env_a: Env, env_b: Env) -> Env:
+    if env_a is None or env_b is None:
+        return env_b if env_a is None else env_a
+    return {x: v for x, v in env_a.items() if env_b.get(x) == v}
+
+
+def _opt(alpha: tn.Prog, env: dict[str, int]) -> tuple[Optional[tn.Prog], Env]:
+    """
+    Optimize a statement reached with the known values in `env`,
+    returning the result, or `None` if the statement can be removed,
+    and the known values after it.
+    """
+    match alpha:
+        case tn.Asgn(name, e):
+            e_f = fold_term(e, env)
+            env = dict(env)
+            if isinstance(e_f, tn.Const):
+                env[name] = e_f.value
+            else:
+                env.pop(name, None)
+            return (alpha if e_f is e else tn.Asgn(name, e_f)), env
+        case tn.Output(e):
+            e_f = fold_term(e, env)
+            return (alpha if e_f is e else tn.Output(e_f)), env
+        case tn.Skip():
+            return alpha, env
+        case tn.Abort():
+            return alpha, None
+        case tn.Seq(alpha_p, beta_p):
+            return _opt(tn.Block((alpha_p, beta_p)), env)
+        case tn.Block(stmts):
+            res = []
+            for beta in stmts:
+                if env is None:
+                    # The rest of the block is unreachable
+                    break
+                beta_o, env = _opt(beta, env)
+                if beta_o is not None:
+                    res.append(beta_o)
+            return (tn.Block.of(res) if res else None), env
+        case tn.If(q, alpha_p, beta_p):
+            match fold_formula(q, env):
+                case tn.TrueC():
+                    return _opt(alpha_p, env)
+                case tn.FalseC():
+                    return _opt(beta_p, env)
+                case q_f:
+                    alpha_o, env_a = _opt(alpha_p, env)
+                    beta_o, env_b = _opt(beta_p, env)
+                    return (
+                        tn.If(q_f, alpha_o or NOOP, beta_o or NOOP),
+                        _merge(env_a, env_b))
+        case tn.While(q, alpha_p):
+            if isinstance(fold_formula(q, env), tn.FalseC):
+                return None, env
+            # Only the values that no iteration changes are known in
+            # the loop, and after it
+            assigned = _assigned(alpha_p)
+            env = {x: v for x, v in env.items() if x not in assigned}
+            q_f = fold_formula(q, env)
+            alpha_o, _ = _opt(alpha_p, env)
+            exit = None if isinstance(q_f, tn.TrueC) else env
+            return tn.While(q_f, alpha_o or NOOP), exit
+        case _:
+            raise TypeError(
+                f"fold_prog got {type(alpha)} ({alpha}), not Prog"
+            )
+
+
+def fold_prog(alpha: tn.Prog, env: Optional[dict[str, int]]=None) -> tn.Prog:
+    """
+    Propagate constants through a program and remove the code that
+    can never run. Variables whose value is known are replaced by it,
+    operations and comparisons between constants are evaluated,
+    conditionals with a constant condition are replaced by the branch
+    they take, loops whose condition is false on entry are removed,
+    and so are statements after an `abort` or a loop that never exits.
+
+    Every trace of the result executes the same assignments, outputs,
+    skips and aborts as the corresponding trace of `alpha`, in the
+    same order, so it takes the same number of steps, aborts at the
+    same point, and exceeds the unrolling depth of `box` when it does.
+    A variable only has a known value once it has been assigned on
+    every path, from constants, so replacing it removes no undefined
+    use, and no taint. The result can therefore stand in for `alpha`,
+    before or after instrumentation, with every policy.
+
+    Args:
+        alpha (tn.Prog): Program to optimize
+        env (dict[str, int], optional): Values of variables known
+            before `alpha`; defaults to none.
+
+    Returns:
+        tn.Prog: The optimized program, which is `NOOP` if nothing
+            in `alpha` can run
+
+    Raises:
+        TypeError: `alpha` isn't a program
+    """
+    res, _ = _opt(alpha, {} if env is None else env)
+    return NOOP if res is None else res
@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 
 from functools import lru_cache
+from itertools import accumulate, chain
 from pyparsing import (
     Regex,
     Word,
     Forward,
     Suppress,
+    ZeroOrMore,
     alphas,
     alphanums,
 )
+from pathlib import Path
+from tinyscript_util import AST_FORMAT_VERSION, ast_dumps, ast_loads
+from typing import Callable, Optional, Union
+import hashlib
+import marshal
+import os
+import re
+import sys
 import tinyscript as tn
 
 
@@ -98,25 +108,383 @@ def ProgramParser():
     abort_prog = (Suppress("abort")).set_parse_action(tn.Abort.parseaction)
 
     statement = assign_prog | if_prog | while_prog | output_prog | skip_prog | abort_prog
-    prog <<= statement \
-        ^ (
-            prog + Suppress(";") + statement
-        ).set_parse_action(tn.Seq.parseaction)
+    prog <<= (
+        statement + ZeroOrMore(Suppress(";") + statement)
+    ).set_parse_action(tn.Block.parseaction)
 
-    prog.enable_left_recursion()
     return prog
 
 
-def term_parse(s: str):
-    return TermParser().parse_string(s, parse_all=True)[0]
+class ParseError(Exception):
+    """
+    Raised by the native parser on malformed input
+    """
+    def __init__(self, msg: str, s: str, loc: int):
+        super().__init__(msg)
+        self.msg = msg
+        self.s = s
+        self.loc = loc
+
+    def __str__(self) -> str:
+        # Computed lazily, as the parser raises and catches these
+        # while backtracking.
+        line = self.s.count('\n', 0, self.loc) + 1
+        col = self.loc - self.s.rfind('\n', 0, self.loc)
+        return f"{self.msg} (at line {line}, col {col})"
+
+
+# Each match is a token together with the whitespace preceding it.
+# Whitespace and letters are those of the pyparsing grammar, which are
+# ASCII, and digits those of its `\d`; any other character is a token
+# of its own, which `_token_kind` rejects.
+_TOKEN_RE = re.compile(
+    r"([ \t\n\r]*)(\d+|[A-Za-z#][A-Za-z0-9_]*|:=|==|&&|\|\||->|[-+*<!();]|[^ \t\n\r])")
+
+_OPERATORS = {':=', '==', '&&', '||', '->', '-', '+', '*', '<', '!', '(', ')', ';'}
+
+
+def _token_kind(tok: str) -> str:
+    if tok in _OPERATORS:
+        return tok
+    # Classified as `_TOKEN_RE` matched them: `str.isdigit` and
+    # `str.isalpha` also hold for e.g. '²' and 'é', which only match
+    # as single bad characters
+    c = tok[0]
+    if c.isdecimal():
+        return 'int'
+    if c.isascii() and c.isalpha() or c == '#':
+        return 'ident'
+    return 'bad'
+
+
+# Binary operators by precedence level; all of them are left-associative,
+# matching the left-recursive pyparsing grammar.
+_TERM_OPS = {
+    '+': (1, tn.Sum),
+    '-': (1, tn.Difference),
+    '*': (2, tn.Product),
+}
+_FMLA_OPS = {
+    '->': (1, tn.ImpliesF),
+    '||': (2, tn.OrF),
+    '&&': (3, tn.AndF),
+}
+
+
+class _Parser:
+    """
+    Tokenizer and precedence-climbing parser for tinyscript. Builds
+    the same `tn.*` nodes as the pyparsing grammar in time linear in
+    the length of the input.
+    """
+    def __init__(self, s: str):
+        self.s = s
+        # Token kinds are the operator text itself, 'int', 'ident', or
+        # 'eof'; keywords are ordinary identifiers, as in the pyparsing
+        # grammar, so e.g. `skip := 1` is still an assignment.
+        toks = _TOKEN_RE.findall(s)
+        self.space = [ws for ws, _ in toks] + ['']
+        self.vals = [tok for _, tok in toks] + ['']
+        self.locs = None
+        kind_of = {}
+        self.kinds = [
+            kind_of.get(tok) or kind_of.setdefault(tok, _token_kind(tok))
+            for tok in self.vals[:-1]] + ['eof']
+        if 'bad' in self.kinds:
+            self.pos = self.kinds.index('bad')
+            raise ParseError(
+                f"Unexpected character {self.vals[self.pos]!r}", s, self.loc())
+        self.pos = 0
+        # Token positions at which a parenthesized formula is known not
+        # to start, so backtracking into a comparison is attempted once.
+        self.not_paren = set()
+
+    def loc(self) -> int:
+        """
+        Offset of the current token in the source text
+        """
+        if self.locs is None:
+            self.locs = list(accumulate(
+                map(len, chain.from_iterable(zip(self.space, self.vals)))))
+        return self.locs[2*self.pos] if self.kinds[self.pos] != 'eof' \
+            else len(self.s)
+
+    def error(self, expected: str):
+        tok = self.vals[self.pos] or 'end of input'
+        raise ParseError(
+            f"Expected {expected}, found {tok!r}", self.s, self.loc())
+
+    def expect(self, kind: str, val: Optional[str]=None) -> str:
+        if self.kinds[self.pos] != kind or (
+                val is not None and self.vals[self.pos] != val):
+            self.error(repr(val if val is not None else kind))
+        self.pos += 1
+        return self.vals[self.pos-1]
+
+    def keyword(self, val: str) -> bool:
+        return self.kinds[self.pos] == 'ident' and self.vals[self.pos] == val
+
+    def climb(self, atom: Callable, ops: dict, min_prec: int=1) -> tn.Token:
+        left = atom()
+        while True:
+            op = ops.get(self.kinds[self.pos])
+            if op is None or op[0] < min_prec:
+                return left
+            self.pos += 1
+            left = op[1](left, self.climb(atom, ops, op[0]+1))
+
+    def term(self) -> tn.Term:
+        return self.climb(self.term_atom, _TERM_OPS)
+
+    def term_atom(self) -> tn.Term:
+        kind = self.kinds[self.pos]
+        if kind == 'int':
+            self.pos += 1
+            return tn.Const(self.vals[self.pos-1])
+        if kind == 'ident':
+            self.pos += 1
+            return tn.Var(self.vals[self.pos-1])
+        if kind == '(':
+            self.pos += 1
+            e = self.term()
+            self.expect(')')
+            return e
+        # Negative literals are a single token in the pyparsing grammar
+        # (`-?\d+`), so the sign must be immediately followed by digits.
+        if (kind == '-' and self.kinds[self.pos+1] == 'int' and
+                not self.space[self.pos+1]):
+            self.pos += 2
+            return tn.Const('-' + self.vals[self.pos-1])
+        self.error('term')
+
+    def fmla(self) -> tn.Formula:
+        return self.climb(self.fmla_not, _FMLA_OPS)
+
+    def fmla_not(self) -> tn.Formula:
+        if self.kinds[self.pos] == '!':
+            self.pos += 1
+            return tn.NotF(self.fmla_atom())
+        return self.fmla_atom()
+
+    def fmla_atom(self) -> tn.Formula:
+        if self.keyword('true'):
+            self.pos += 1
+            return tn.TrueC()
+        if self.keyword('false'):
+            self.pos += 1
+            return tn.FalseC()
+        start = self.pos
+        if self.kinds[start] == '(' and start not in self.not_paren:
+            # A parenthesis may open either a formula or the left-hand
+            # term of a comparison; like the pyparsing grammar, prefer
+            # the formula and fall back to the comparison.
+            try:
+                self.pos += 1
+                p = self.fmla()
+                self.expect(')')
+                return p
+            except ParseError:
+                self.not_paren.add(start)
+                self.pos = start
+        left = self.term()
+        match self.kinds[self.pos]:
+            case '==':
+                self.pos += 1
+                return tn.EqF(left, self.term())
+            case '<':
+                self.pos += 1
+                return tn.LtF(left, self.term())
+        self.error("'==' or '<'")
+
+    def condition(self) -> tn.Formula:
+        self.expect('(')
+        q = self.fmla()
+        self.expect(')')
+        return q
+
+    def prog(self) -> tn.Prog:
+        stmts = [self.statement()]
+        while self.kinds[self.pos] == ';':
+            self.pos += 1
+            stmts.append(self.statement())
+        return stmts[0] if len(stmts) == 1 else tn.Block(stmts)
+
+    def statement(self) -> tn.Prog:
+        if self.kinds[self.pos] != 'ident':
+            self.error('statement')
+        if self.kinds[self.pos+1] == ':=':
+            name = self.vals[self.pos]
+            self.pos += 2
+            return tn.Asgn(name, self.term())
+        match self.vals[self.pos]:
+            case 'if':
+                self.pos += 1
+                q = self.condition()
+                self.expect('ident', 'then')
+                alpha = self.prog()
+                self.expect('ident', 'else')
+                beta = self.prog()
+                self.expect('ident', 'endif')
+                return tn.If(q, alpha, beta)
+            case 'while':
+                self.pos += 1
+                q = self.condition()
+                self.expect('ident', 'do')
+                alpha = self.prog()
+                self.expect('ident', 'done')
+                return tn.While(q, alpha)
+            case 'output':
+                self.pos += 1
+                return tn.Output(self.term())
+            case 'skip':
+                self.pos += 1
+                return tn.Skip()
+            case 'abort':
+                self.pos += 1
+                return tn.Abort()
+        self.error("':='")
+
+    def parse_all(self, rule: Callable) -> tn.Token:
+        res = rule()
+        if self.kinds[self.pos] != 'eof':
+            self.error('end of input')
+        return res
+
+
+def term_parse(s: str, legacy: bool=False) -> tn.Term:
+    """
+    Parse a tinyscript term
+
+    Args:
+        s (str): Source text
+        legacy (bool, optional): Use the pyparsing grammar instead
+            of the native parser; defaults to `False`.
+
+    Returns:
+        tn.Term: Parsed term
+
+    Raises:
+        ParseError: If `s` is not a valid term (`ParseException`
+            when `legacy` is set)
+    """
+    if legacy:
+        return TermParser().parse_string(s, parse_all=True)[0]
+    p = _Parser(s)
+    return p.parse_all(p.term)
+
+
+def fmla_parse(s: str, legacy: bool=False) -> tn.Formula:
+    """
+    Parse a tinyscript formula
+
+    Args:
+        s (str): Source text
+        legacy (bool, optional): Use the pyparsing grammar instead
+            of the native parser; defaults to `False`.
+
+    Returns:
+        tn.Formula: Parsed formula
+
+    Raises:
+        ParseError: If `s` is not a valid formula (`ParseException`
+            when `legacy` is set)
+    """
+    if legacy:
+        return FormulaParser().parse_string(s, parse_all=True)[0]
+    p = _Parser(s)
+    return p.parse_all(p.fmla)
+
+
+def parse(s: str, legacy: bool=False) -> tn.Prog:
+    """
+    Parse a tinyscript program
+
+    Args:
+        s (str): Source text
+        legacy (bool, optional): Use the pyparsing grammar instead
+            of the native parser; defaults to `False`.
+
+    Returns:
+        tn.Prog: Parsed program
+
+    Raises:
+        ParseError: If `s` is not a valid program (`ParseException`
+            when `legacy` is set)
+    """
+    if legacy:
+        return ProgramParser().parse_string(s, parse_all=True)[0]
+    p = _Parser(s)
+    return p.parse_all(p.prog)
+
+
+# Directory holding cached parses for `parse_file`; `None` disables caching,
+# which setting TINYSCRIPT_PARSE_CACHE to an empty value selects.
+_cache_dir = os.environ.get('TINYSCRIPT_PARSE_CACHE', '.parse_cache')
+PARSE_CACHE_DIR = Path(_cache_dir) if _cache_dir else None
 
 
-def fmla_parse(s: str):
-    return FormulaParser().parse_string(s, parse_all=True)[0]
-
-
-def parse(s: str):
-    return ProgramParser().parse_string(s, parse_all=True)[0]
+@lru_cache
+def _grammar_digest() -> bytes:
+    """
+    Digest of everything that determines the AST produced for a given
+    source text, so that cache entries are invalidated automatically
+    when the grammar, the node classes, or the serialization format
+    change.
+    """
+    h = hashlib.sha256()
+    for module_file in (__file__, tn.__file__):
+        h.update(Path(module_file).read_bytes())
+    h.update(repr((AST_FORMAT_VERSION, marshal.version,
+                   sys.version_info[:2])).encode())
+    return h.digest()
+
+
+def parse_file(
+    path: Union[str, Path],
+    legacy: bool=False,
+    cache_dir: Optional[Path]=PARSE_CACHE_DIR
+) -> tn.Prog:
+    """
+    Parse a tinyscript source file, using a persistent on-disk cache
+    keyed by the content of the file. Warm runs deserialize the stored
+    AST and do not invoke either parser.
+
+    Args:
+        path (Union[str, Path]): Source file
+        legacy (bool, optional): Use the pyparsing grammar on a cache
+            miss; defaults to `False`.
+        cache_dir (Path, optional): Cache directory, or `None` to
+            always parse; defaults to `PARSE_CACHE_DIR`.
+
+    Returns:
+        tn.Prog: Parsed program
+
+    Raises:
+        ParseError: If the file does not contain a valid program
+            (`ParseException` when `legacy` is set)
+    """
+    src = Path(path).read_bytes()
+    if cache_dir is None:
+        return parse(src.decode(), legacy)
+    key = hashlib.sha256(_grammar_digest() + bytes([legacy]) + src)
+    entry = Path(cache_dir) / f"{key.hexdigest()}.ast"
+    try:
+        alpha = ast_loads(entry.read_bytes())
+        if isinstance(alpha, tn.Prog):
+            return alpha
+    except (OSError, ValueError):
+        # Missing or corrupt entries are parsed again and overwritten
+        pass
+    alpha = parse(src.decode(), legacy)
+    try:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename, so concurrent runs never see partial entries
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(ast_dumps(alpha))
+        os.replace(tmp, entry)
+    except OSError:
+        pass
+    return alpha
 
 
 if __name__ == "__main__":
@@ -125,4 +493,4 @@ if __name__ == "__main__":
     global b
     b = fmla_parse
     global p
-    p = parse
+    p = parse
\ No newline at end of file
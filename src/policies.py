@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+from symbolic import find_violations, Result
+from tinyscript_util import check_sat
+import defuse
+import runtime
+import taint
+import tinyscript as tn
+import z3
+
+# The policies that `check_all` checks, in the order of its results
+POLICIES = ('runtime', 'defuse', 'taint')
+
+# Flags set by the program that `instrument` builds, when a trace uses
+# an undefined variable, and counting the tainted values it outputs
+UNDEFINED = '#violated_defuse'
+TAINTED = '#violated_taint'
+
+# Variables that the program that `instrument` builds never assigns,
+# which select whether a trace ends at a violation of each policy
+UNDEFINED_STOP = '#stop_defuse'
+TAINTED_STOP = '#stop_taint'
+
+
+def _rename_term(e: tn.Term, old: str, new: str) -> tn.Term:
+    match e:
+        case tn.Var(name):
+            return tn.Var(new) if name == old else e
+        case tn.Sum(left, right) | tn.Difference(left, right) | \
+                tn.Product(left, right):
+            left_r, right_r = _rename_term(left, old, new), _rename_term(right, old, new)
+            if left_r is not left or right_r is not right:
+                return type(e)(left_r, right_r)
+    return e
+
+
+def _rename_fmla(p: tn.Formula, old: str, new: str) -> tn.Formula:
+    match p:
+        case tn.EqF(left, right) | tn.LtF(left, right):
+            left_r, right_r = _rename_term(left, old, new), _rename_term(right, old, new)
+            if left_r is not left or right_r is not right:
+                return type(p)(left_r, right_r)
+        case tn.NotF(q):
+            q_r = _rename_fmla(q, old, new)
+            if q_r is not q:
+                return tn.NotF(q_r)
+        case tn.AndF(q, r) | tn.OrF(q, r) | tn.ImpliesF(q, r):
+            q_r, r_r = _rename_fmla(q, old, new), _rename_fmla(r, old, new)
+            if q_r is not q or r_r is not r:
+                return type(p)(q_r, r_r)
+    return p
+
+
+def _rename(alpha: tn.Prog, old: str, new: str) -> tn.Prog:
+    """
+    Rename the variable `old` of a program to `new`, sharing the parts
+    of `alpha` that do not mention it.
+    """
+    match alpha:
+        case tn.Asgn(name, e):
+            e_r = _rename_term(e, old, new)
+            if name == old or e_r is not e:
+                return tn.Asgn(new if name == old else name, e_r)
+        case tn.Output(e):
+            e_r = _rename_term(e, old, new)
+            if e_r is not e:
+                return tn.Output(e_r)
+        case tn.Seq(alpha_p, beta_p):
+            alpha_r, beta_r = _rename(alpha_p, old, new), _rename(beta_p, old, new)
+            if alpha_r is not alpha_p or beta_r is not beta_p:
+                return tn.Seq(alpha_r, beta_r)
+        case tn.Block(stmts):
+            stmts_r = [_rename(beta, old, new) for beta in stmts]
+            if any(beta_r is not beta for beta_r, beta in zip(stmts_r, stmts)):
+                return tn.Block.of(stmts_r)
+        case tn.If(q, alpha_p, beta_p):
+            q_r = _rename_fmla(q, old, new)
+            alpha_r, beta_r = _rename(alpha_p, old, new), _rename(beta_p, old, new)
+            if q_r is not q or alpha_r is not alpha_p or beta_r is not beta_p:
+                return tn.If(q_r, alpha_r, beta_r)
+        case tn.While(q, alpha_p):
+            q_r, alpha_r = _rename_fmla(q, old, new), _rename(alpha_p, old, new)
+            if q_r is not q or alpha_r is not alpha_p:
+                return tn.While(q_r, alpha_r)
+    return alpha
+
+
+def instrument(
+    alpha: tn.Prog,
+    source_prefix: str='sec_',
+    policies: tuple[str, ...]=('defuse', 'taint')
+) -> tn.Prog:
+    """
+    Instrument a program for the define-before-use and taint policies
+    at once, as `defuse.instrument` and `taint.instrument` do, with
+    their flags renamed to `UNDEFINED` and `TAINTED`. A violation of
+    either policy only ends the trace when `UNDEFINED_STOP` or
+    `TAINTED_STOP` is `0` initially, so a trace that violates one
+    policy can go on to violate the other. The define-before-use
+    instrumentation is applied first, since applied second it would
+    check the reads of `TAINTED_STOP` as uses of an undefined
+    variable; the taint instrumentation only adds the taint of its
+    bookkeeping variables, which no output depends on, and which
+    slicing removes.
+
+    Args:
+        alpha (tn.Prog): Program to instrument
+        source_prefix (str, optional): String prefix for source
+            variables
+        policies (tuple[str, ...], optional): The policies to
+            instrument for, among `'defuse'` and `'taint'`; defaults
+            to both.
+
+    Returns:
+        tn.Prog: The instrumented program, whose traces violate the
+            define-before-use policy iff they end with `UNDEFINED`
+            positive, and the taint policy iff they end with `TAINTED`
+            positive
+    """
+    if 'defuse' in policies:
+        alpha = _rename(
+            defuse.instrument(alpha, target=UNDEFINED_STOP),
+            defuse.VIOLATED, UNDEFINED)
+    if 'taint' in policies:
+        alpha = _rename(
+            taint.instrument(alpha, source_prefix, target=TAINTED_STOP),
+            taint.VIOLATED, TAINTED)
+    return alpha
+
+
+def check_all(
+    alpha: tn.Prog,
+    step_bound: int=100,
+    source_prefix: str='sec_',
+    max_depth: int=1,
+    timeout: int=10,
+    runtime_depth: int=100,
+    solver=check_sat
+) -> dict[str, Result]:
+    """
+    Check a program against every policy in one pass, giving the same
+    results as `runtime.symbolic_check`, `defuse.symbolic_check` and
+    `taint.symbolic_check` with their default backends.
+
+    The dataflow stages of the define-before-use and taint checks run
+    first, as in their `symbolic_check`. The programs they leave
+    undecided are instrumented once for the policies left (see
+    `instrument`), and the policies' postconditions are checked with
+    `symbolic.find_violations`, so the program is encoded once, and
+    each policy's question is an assumption-guarded query on one
+    incremental solver. The runtime policy is checked with
+    `runtime.symbolic_check`, since it unrolls loops to a different
+    depth, counts cut-off traces as violations, and bounds every loop
+    of its instrumented program by the step counter, so its traces are
+    not those of the other two.
+
+    With a `solver` other than `check_sat`, such as
+    `cache.SolverCache.check_sat` or `portfolio.check_sat_portfolio`,
+    each query of the shared session is one call to it on the shared
+    formula, rather than a query on an incremental z3 solver.
+
+    Args:
+        alpha (tn.Prog): Program to check
+        step_bound (int, optional): Step bound of the runtime policy
+        source_prefix (str, optional): String prefix for source
+            variables of the taint policy
+        max_depth (int, optional): Loop unrolling depth of the
+            define-before-use and taint checks
+        timeout (int, optional): Solver timeout of each query, in
+            seconds
+        runtime_depth (int, optional): Loop unrolling depth of the
+            runtime check
+        solver (optional): Function called like `check_sat` by every
+            check; defaults to `check_sat`.
+
+    Returns:
+        dict[str, Result]: The result for each policy in `POLICIES`
+    """
+    results = {'runtime': runtime.symbolic_check(
+        alpha, step_bound, runtime_depth, timeout, solver=solver)}
+    pending = {}
+    for name, module, res, flag in (
+            ('defuse', defuse, defuse.dataflow_check(alpha), UNDEFINED),
+            ('taint', taint, taint.dataflow_check(alpha, source_prefix), TAINTED)):
+        if res != Result.Unknown:
+            module.DECIDED_BY['dataflow'] += 1
+            results[name] = res
+        else:
+            module.DECIDED_BY['symbolic'] += 1
+            pending[name] = flag
+    if pending:
+        found = find_violations(
+            instrument(alpha, source_prefix, tuple(pending)),
+            [z3.Int(flag) == 0 for flag in pending.values()],
+            max_depth, False, timeout,
+            solver=None if solver is check_sat else solver)
+        for name, (res, _) in zip(pending, found):
+            match res:
+                case z3.unsat:
+                    results[name] = Result.Satisfies
+                case z3.sat:
+                    results[name] = Result.Violates
+                case _:
+                    results[name] = Result.Unknown
+    return {name: results[name] for name in POLICIES}
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass
+from tinyscript_util import check_sat, model_from_values, model_values
+from typing import Optional
+import multiprocessing
+import queue
+import time
+import z3
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    One way of solving a formula in a portfolio: the `logic` argument
+    to pass to `check_sat`, a random seed for Z3's solvers, and, if
+    `width` is set, the width of the bit-vectors that integers are
+    encoded as (see `bv_encode`). Bit-vector configurations can only
+    ever answer `z3.sat`, since their encoding excludes the models in
+    which some operation overflows.
+    """
+    name: str
+    logic: Optional[str]='auto'
+    seed: int=0
+    width: Optional[int]=None
+
+
+CONFIGS = (
+    Config('tactics', 'auto'),
+    Config('default', None),
+    Config('tactics-seed-1', 'auto', seed=1),
+    Config('default-seed-1', None, seed=1),
+    Config('bv32', None, width=32),
+    Config('bv64', None, width=64),
+)
+
+# Seconds between checks that some worker is still running, while
+# waiting for answers
+_POLL = 0.1
+
+
+class Unsupported(Exception):
+    """
+    Raised by `bv_encode` for formulas it cannot translate.
+    """
+
+
+def _fold(op, guard, args: list[z3.BitVecRef], guards: list) -> z3.BitVecRef:
+    res = args[0]
+    for arg in args[1:]:
+        guards.extend(guard(res, arg))
+        res = op(res, arg)
+    return res
+
+
+def bv_encode(
+    e: z3.ExprRef,
+    width: int,
+    guards: list[z3.BoolRef],
+    memo: Optional[dict]=None
+) -> z3.ExprRef:
+    """
+    Translate a quantifier-free integer formula to signed bit-vectors
+    of the given width, appending to `guards` a condition for each
+    addition, subtraction and multiplication that holds iff it does
+    not overflow. A model of the translation and its guards gives the
+    same values to every term as the integer semantics, so it is a
+    model of `e`; the converse fails for models that need large values.
+
+    Args:
+        e (z3.ExprRef): Formula or term to translate
+        width (int): Width of the bit-vectors
+        guards (list[z3.BoolRef]): Receives the overflow guards
+        memo (dict, optional): Translations of subexpressions
+
+    Returns:
+        z3.ExprRef: The translation of `e`
+
+    Raises:
+        Unsupported: `e` has operators other than Boolean connectives,
+            integer comparisons, `+`, `-` and `*`, or a constant that
+            does not fit
+    """
+    memo = {} if memo is None else memo
+    if e.get_id() in memo:
+        return memo[e.get_id()]
+    if z3.is_int_value(e):
+        val = e.as_long()
+        if not -2**(width-1) <= val < 2**(width-1):
+            raise Unsupported(f"{val} does not fit in {width} bits")
+        res = z3.BitVecVal(val, width)
+    elif z3.is_const(e) and z3.is_int(e):
+        res = z3.BitVec(e.decl().name(), width)
+    elif z3.is_const(e) and z3.is_bool(e):
+        res = e
+    else:
+        args = [bv_encode(a, width, guards, memo) for a in e.children()]
+        k = e.decl().kind()
+        if k == z3.Z3_OP_ADD:
+            res = _fold(lambda a, b: a + b, lambda a, b: [
+                z3.BVAddNoOverflow(a, b, True),
+                z3.BVAddNoUnderflow(a, b)], args, guards)
+        elif k == z3.Z3_OP_SUB:
+            res = _fold(lambda a, b: a - b, lambda a, b: [
+                z3.BVSubNoOverflow(a, b),
+                z3.BVSubNoUnderflow(a, b, True)], args, guards)
+        elif k == z3.Z3_OP_MUL:
+            res = _fold(lambda a, b: a * b, lambda a, b: [
+                z3.BVMulNoOverflow(a, b, True),
+                z3.BVMulNoUnderflow(a, b)], args, guards)
+        elif k == z3.Z3_OP_UMINUS:
+            guards.append(z3.BVSNegNoOverflow(args[0]))
+            res = -args[0]
+        elif k == z3.Z3_OP_LE:
+            res = args[0] <= args[1]
+        elif k == z3.Z3_OP_LT:
+            res = args[0] < args[1]
+        elif k == z3.Z3_OP_GE:
+            res = args[0] >= args[1]
+        elif k == z3.Z3_OP_GT:
+            res = args[0] > args[1]
+        elif k == z3.Z3_OP_EQ:
+            res = args[0] == args[1]
+        elif k == z3.Z3_OP_DISTINCT:
+            res = z3.Distinct(args)
+        elif k == z3.Z3_OP_ITE:
+            res = z3.If(*args)
+        elif k == z3.Z3_OP_AND:
+            res = z3.And(args)
+        elif k == z3.Z3_OP_OR:
+            res = z3.Or(args)
+        elif k == z3.Z3_OP_NOT:
+            res = z3.Not(args[0])
+        elif k == z3.Z3_OP_IMPLIES:
+            res = z3.Implies(*args)
+        elif k == z3.Z3_OP_XOR:
+            res = z3.Xor(*args)
+        elif k in (z3.Z3_OP_TRUE, z3.Z3_OP_FALSE):
+            res = e
+        else:
+            raise Unsupported(f"{e.decl()} is not supported")
+    memo[e.get_id()] = res
+    return res
+
+
+def _answer(
+    smt2: str,
+    config: Config,
+    deadline: Optional[float]
+) -> tuple[str, Optional[dict[str, int | bool]]]:
+    """
+    Solve the formulas in `smt2` with one configuration, returning the
+    result and the model's value for each constant.
+    """
+    ps = list(z3.parse_smt2_string(smt2))
+    if config.seed:
+        z3.set_param('smt.random_seed', config.seed)
+        z3.set_param('sat.random_seed', config.seed)
+    if config.width is not None:
+        guards, memo = [], {}
+        try:
+            ps = [bv_encode(p, config.width, guards, memo) for p in ps] + guards
+        except Unsupported:
+            return 'unknown', None
+    timeout = None if deadline is None else max(0.001, deadline - time.time())
+    res, model = check_sat(ps, timeout, config.logic)
+    if res == z3.unsat and config.width is not None:
+        res = z3.unknown
+    return str(res), None if model is None else model_values(model)
+
+
+def _solve(smt2: str, config: Config, deadline: Optional[float], answers):
+    """
+    Solve the formulas in `smt2` with one configuration, in a worker
+    process, and put the configuration's name, the result, and the
+    model's value for each constant on `answers`. Errors are answered
+    as `'unknown'`, so that the portfolio does not wait for the
+    worker.
+    """
+    try:
+        answer, values = _answer(smt2, config, deadline)
+    except Exception:
+        answer, values = 'unknown', None
+    answers.put((config.name, answer, values))
+
+
+def check_sat_portfolio(
+    ps: list[z3.BoolRef],
+    timeout: int=None,
+    configs: tuple[Config, ...]=CONFIGS,
+    processes: Optional[int]=None
+) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+    """
+    Check a list of formulas for satisfiability like `check_sat`, but
+    with several solver configurations in parallel, each in its own
+    process. The first definite answer wins, and the other processes
+    are killed; if none answers within `timeout`, the result is
+    `z3.unknown`.
+
+    Args:
+        ps (list[z3.BoolRef]): Formulas to check
+        timeout (int, optional): Timeout in seconds for the whole
+            portfolio, or `None` for no timeout. Defaults to `None`.
+        configs (tuple[Config, ...], optional): Configurations to run;
+            defaults to `CONFIGS`
+        processes (int, optional): Run only the first this many
+            configurations; defaults to the number of CPUs
+
+    Returns:
+        tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: As for
+            `check_sat`
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    configs = configs[:processes or multiprocessing.cpu_count()]
+    s = z3.Solver()
+    s.add(ps)
+    smt2 = s.to_smt2()
+    ctx = multiprocessing.get_context('spawn')
+    answers = ctx.Queue()
+    workers = [
+        ctx.Process(target=_solve, args=(smt2, c, deadline, answers), daemon=True)
+        for c in configs]
+    for w in workers:
+        w.start()
+    res, values = z3.unknown, None
+    try:
+        pending = len(workers)
+        while pending:
+            left = None if deadline is None else deadline - time.time()
+            if left is not None and left <= 0:
+                break
+            # A worker killed before answering, e.g. for lack of memory,
+            # never answers, so the queue is polled and the wait ends
+            # once every worker has died; their answers are queued
+            # before they exit, so those dead before the poll are in
+            alive = any(w.is_alive() for w in workers)
+            try:
+                _, answer, values = answers.get(
+                    timeout=_POLL if left is None else min(left, _POLL))
+            except queue.Empty:
+                if not alive:
+                    break
+                continue
+            pending -= 1
+            if answer in ('sat', 'unsat'):
+                res = z3.sat if answer == 'sat' else z3.unsat
+                break
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.kill()
+        for w in workers:
+            w.join()
+    if res == z3.sat:
+        left = None if deadline is None else max(0.001, deadline - time.time())
+        model = model_from_values(ps, values, left)
+        return (z3.sat, model) if model is not None else (z3.unknown, None)
+    return res, None
@@ -1,12 +1,53 @@
 #!/usr/bin/env python3
 
+from collections import Counter
+from intervals import prune_prog
+from optimize import fold_formula, fold_term
 from typing import Optional
-from symbolic import box, Result
+from symbolic import box, find_violation, Result
 from tinyscript_util import (
 	check_sat,
+	state_from_z3_model,
 	stringify
 )
+import compiler
+import interpreter as interp
+import math
 import tinyscript as tn
+import z3
+
+# Counter of the steps executed so far by the instrumented program
+STEPS = '#steps'
+
+# Number of programs decided by each stage of `symbolic_check`:
+# `'static'` for `static_check`, `'symbolic'` for the solver
+DECIDED_BY = Counter()
+
+def _tick() -> tn.Prog:
+	return tn.Asgn(STEPS, tn.Sum(tn.Var(STEPS), tn.Const(1)))
+
+def _count(alpha: tn.Prog, guard: Optional[tn.Formula]) -> tn.Prog:
+	"""
+	Increment the step counter before each assignment, output, abort
+	and skip in a program. If `guard` is given, it is conjoined to the
+	condition of each loop.
+	"""
+	match alpha:
+		case tn.Asgn() | tn.Output() | tn.Skip() | tn.Abort():
+			return tn.Block.of([_tick(), alpha])
+		case tn.Seq(alpha_p, beta_p):
+			return tn.Seq(_count(alpha_p, guard), _count(beta_p, guard))
+		case tn.Block(stmts):
+			return tn.Block.of(_count(beta, guard) for beta in stmts)
+		case tn.If(q, alpha_p, beta_p):
+			return tn.If(q, _count(alpha_p, guard), _count(beta_p, guard))
+		case tn.While(q, alpha_p):
+			q = q if guard is None else tn.AndF(guard, q)
+			return tn.While(q, _count(alpha_p, guard))
+		case _:
+			raise TypeError(
+				f"instrument got {type(alpha)} ({alpha}), not Prog"
+			)
 
 def instrument(alpha: tn.Prog, step_bound: Optional[int]=None) -> tn.Prog:
 	"""
@@ -24,27 +65,184 @@ def instrument(alpha: tn.Prog, step_bound: Optional[int]=None) -> tn.Prog:
 	    	`alpha` exists that executes for longer than the bound
 	    	on steps. A step occurs when the program executes an
 	    	assignment, output, abort, or skip statement.
+	    	The variable `#steps` counts the steps executed. If
+	    	`step_bound` is given, loops also exit once it is
+	    	exceeded, which does not change whether a trace
+	    	exceeds it, but cuts the paths that need exploring.
+	"""
+	guard = None
+	if step_bound is not None:
+		guard = tn.LtF(tn.Var(STEPS), tn.Const(step_bound + 1))
+	return tn.Block.of([tn.Asgn(STEPS, tn.Const(0)), _count(alpha, guard)])
+
+class _Undecided(Exception):
 	"""
-	return alpha
+	Raised when the static analysis cannot bound the steps of a loop.
+	"""
+
+# The least and greatest number of steps of a set of traces
+Span = tuple[int, int | float]
+
+# The traces of a statement that end normally, with their steps and
+# the values of variables known after them, and those that abort
+Summary = tuple[Optional[tuple[int, int | float, dict[str, int]]], Optional[Span]]
+
+def _join(a: Optional[Span], b: Optional[Span]) -> Optional[Span]:
+	if a is None or b is None:
+		return b if a is None else a
+	return (min(a[0], b[0]), max(a[1], b[1]))
+
+def _then(first: Summary, rest, limit: int) -> Summary:
+	"""
+	Compose the summary of a statement with that of what follows it,
+	computed by `rest` from the values known after the statement.
+	Once every trace has exceeded `limit` steps, what follows is not
+	analyzed, since it can only add steps.
+	"""
+	normal, aborted = first
+	if normal is None:
+		return first
+	lo, hi, env = normal
+	if lo > limit:
+		return (lo, math.inf, {}), _join(aborted, (lo, math.inf))
+	(normal_r, aborted_r) = rest(env)
+	if aborted_r is not None:
+		aborted = _join(aborted, (lo + aborted_r[0], hi + aborted_r[1]))
+	if normal_r is None:
+		return None, aborted
+	return (lo + normal_r[0], hi + normal_r[1], normal_r[2]), aborted
+
+def _steps(alpha: tn.Prog, env: dict[str, int], limit: int) -> Summary:
+	"""
+	Bound the steps of the traces of a statement from a state where
+	the variables in `env` have known values, as in `fold_prog`.
+	Conditionals whose condition is not known contribute the least
+	and greatest steps of their branches, and loops are followed one
+	iteration at a time, as long as their condition is known.
+	"""
+	match alpha:
+		case tn.Asgn(name, e):
+			env = dict(env)
+			e = fold_term(e, env)
+			if isinstance(e, tn.Const):
+				env[name] = e.value
+			else:
+				env.pop(name, None)
+			return (1, 1, env), None
+		case tn.Output() | tn.Skip():
+			return (1, 1, env), None
+		case tn.Abort():
+			return None, (1, 1)
+		case tn.Seq(alpha_p, beta_p):
+			return _steps(tn.Block((alpha_p, beta_p)), env, limit)
+		case tn.Block(stmts):
+			res = (0, 0, env), None
+			for beta in stmts:
+				res = _then(res, lambda env: _steps(beta, env, limit), limit)
+			return res
+		case tn.If(q, alpha_p, beta_p):
+			match fold_formula(q, env):
+				case tn.TrueC():
+					return _steps(alpha_p, env, limit)
+				case tn.FalseC():
+					return _steps(beta_p, env, limit)
+			(normal_a, aborted_a) = _steps(alpha_p, env, limit)
+			(normal_b, aborted_b) = _steps(beta_p, env, limit)
+			if normal_a is None or normal_b is None:
+				normal = normal_b if normal_a is None else normal_a
+			else:
+				normal = (
+					min(normal_a[0], normal_b[0]), max(normal_a[1], normal_b[1]),
+					{x: v for x, v in normal_a[2].items() if normal_b[2].get(x) == v})
+			return normal, _join(aborted_a, aborted_b)
+		case tn.While(q, alpha_p):
+			res = (0, 0, env), None
+			# Every iteration takes a step unless its body only has
+			# loops that do not run, so after this many iterations
+			# either the limit is exceeded or the loop never ends
+			for _ in range(limit + 2):
+				match fold_formula(q, res[0][2]):
+					case tn.FalseC():
+						return res
+					case tn.TrueC():
+						pass
+					case _:
+						raise _Undecided()
+				res = _then(res, lambda env: _steps(alpha_p, env, limit), limit)
+				if res[0] is None or res[0][0] > limit:
+					return res
+			raise _Undecided()
+		case _:
+			raise TypeError(
+				f"static_check got {type(alpha)} ({alpha}), not Prog"
+			)
+
+def static_check(alpha: tn.Prog, step_bound: int) -> Result:
+	"""
+	Decides the runtime policy without a solver when the steps of
+	`alpha` can be bounded statically. The program is followed with
+	the values of variables known from constant assignments, as in
+	`optimize.fold_prog`, so loops with a constant trip count are
+	counted exactly, and conditionals whose condition is not known
+	contribute the least and greatest steps of their branches.
+	The code that `intervals.prune_prog` shows cannot run is removed
+	first, which decides more conditions, and removes loops that are
+	never entered.
+	
+	Args:
+	    alpha (tn.Prog): Program to check
+	    step_bound (int): Step bound to check
+	
+	Returns:
+	    Result: Result.Satisfies if no trace takes more than
+	    	`step_bound` steps, Result.Violates if every trace
+	    	does, and Result.Unknown otherwise, or if a loop
+	    	condition depends on values that are not known.
+	"""
+	try:
+		normal, aborted = _steps(prune_prog(alpha), {}, step_bound)
+	except _Undecided:
+		return Result.Unknown
+	spans = ([(normal[0], normal[1])] if normal is not None else []) + \
+		([aborted] if aborted is not None else [])
+	if max(hi for _, hi in spans) <= step_bound:
+		return Result.Satisfies
+	if min(lo for lo, _ in spans) > step_bound:
+		return Result.Violates
+	return Result.Unknown
 
 def symbolic_check(
 	alpha: tn.Prog, 
 	step_bound: int,
-	max_depth: int=1,
-	timeout: int=10) -> Result:
+	max_depth: int=100,
+	timeout: int=10,
+	backend: str='deepening',
+	solver=check_sat) -> Result:
 	"""
 	Uses the box modality and a satisfiability solver to determine
 	whether there are any traces that execute more than `step_bound`
 	steps. A step occurs when the program executes an assignment, 
 	output, abort, or skip statement. This function only considers 
 	traces generated after unrolling loops up to `max_depth` times, 
-	and will terminate the solver after `timeout` seconds.
+	and will terminate the solver after `timeout` seconds. Programs
+	that `static_check` decides are not passed to the solver; the
+	stage that decided each program is counted in `DECIDED_BY`.
 	
 	Args:
 	    alpha (tn.Prog): Program to check
 	    step_bound (int): Step bound to check
 	    max_depth (int, optional): Loop unrolling depth
 	    timeout (int, optional): Solver timeout, in seconds
+	    backend (str, optional): Search engine, one of
+	    	`symbolic.BACKENDS`. The default, `'deepening'`,
+	    	unrolls loops only as far as needed, stopping once
+	    	every trace ends or one that is cut off is shown to
+	    	run for more than `step_bound` steps, so a large
+	    	`max_depth` costs nothing on programs that do not
+	    	need it.
+	    solver (optional): Function called like `check_sat` by the
+	    	`'box'` and `'bmc'` backends, e.g. the `check_sat`
+	    	method of a `cache.SolverCache`
 	
 	Returns:
 	    Result: The status of the check, one of three values:
@@ -64,10 +262,40 @@ def symbolic_check(
 	    	  not return a state that caused the interpreter to execute
 	    	  at least `step_bound` steps.
 	"""
+	res = static_check(alpha, step_bound)
+	if res != Result.Unknown:
+		DECIDED_BY['static'] += 1
+		return res
+	DECIDED_BY['symbolic'] += 1
+	post = z3.Int(STEPS) <= step_bound
+
+	# Verdicts on the models replayed so far, by id, so that the model
+	# `find_violation` returns is not run again; the models are kept
+	# so that their ids are not reused
+	replayed = {}
+
+	def exceeds(model: z3.ModelRef) -> bool:
+		if id(model) not in replayed:
+			state = state_from_z3_model(alpha, model)
+			_, status, _ = compiler.exc(state, alpha, step_bound, quiet=True)
+			replayed[id(model)] = (model, status == interp.Status.Maxsteps)
+		return replayed[id(model)][1]
+
+	res, model = find_violation(
+		instrument(alpha, step_bound), post, max_depth, True, timeout, backend,
+		exceeds, solver)
+	match res:
+		case z3.unsat:
+			return Result.Satisfies
+		case z3.sat:
+			# The model may only reach the unrolling depth, so it is
+			# a violation only if the interpreter confirms it
+			if exceeds(model):
+				return Result.Violates
 	return Result.Unknown
 
 if __name__ == "__main__":
-	from parser import parse, fmla_parse
+	from parser import parse_file
 	import sys
 	from pathlib import Path
 
@@ -83,18 +311,17 @@ if __name__ == "__main__":
 	for test_file in list(TEST_DIR.iterdir()):
 		if not str(test_file).endswith('tinyscript'):
 			continue
-		with test_file.open() as f:
-			prog = parse(f.read())
-			res = symbolic_check(prog, 100)
-			print((
-				f"{test_file} result:" 
-				f"{res}"))
-			match res:
-				case Result.Satisfies:
-					passed += 1
-				case Result.Violates:
-					violate += 1
-				case Result.Unknown:
-					unknown += 1
+		prog = parse_file(test_file)
+		res = symbolic_check(prog, 100)
+		print((
+			f"{test_file} result:" 
+			f"{res}"))
+		match res:
+			case Result.Satisfies:
+				passed += 1
+			case Result.Violates:
+				violate += 1
+			case Result.Unknown:
+				unknown += 1
 
 	print(f"\n{passed=}, {violate=}, {unknown=}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+from tinyscript_util import vars_formula, vars_term
+from typing import Iterable, Optional
+import tinyscript as tn
+
+
+def _collect(alpha: tn.Prog, names: set[str]) -> bool:
+    """
+    Add to `names` the variables that the statements of `alpha` which
+    can affect `names` read, returning whether there are any. Those
+    are the assignments to variables in `names`, outputs if `#stdout`
+    is in `names`, aborts, loops, and conditionals that contain any of
+    them; loops are always kept, since whether a trace exits them
+    within the unrolling depth decides whether it goes on at all.
+    """
+    match alpha:
+        case tn.Asgn(name, e):
+            if name in names:
+                names.update(v.name for v in vars_term(e))
+                return True
+            return False
+        case tn.Output(e):
+            if '#stdout' in names:
+                names.update(v.name for v in vars_term(e))
+                return True
+            return False
+        case tn.Skip():
+            return False
+        case tn.Abort():
+            return True
+        case tn.Seq(alpha_p, beta_p):
+            # Both sides are visited, so no short-circuiting `or`
+            return any([_collect(alpha_p, names), _collect(beta_p, names)])
+        case tn.Block(stmts):
+            return any([_collect(beta, names) for beta in stmts])
+        case tn.If(q, alpha_p, beta_p):
+            kept = any([_collect(alpha_p, names), _collect(beta_p, names)])
+            if kept:
+                names.update(v.name for v in vars_formula(q))
+            return kept
+        case tn.While(q, alpha_p):
+            _collect(alpha_p, names)
+            names.update(v.name for v in vars_formula(q))
+            return True
+        case _:
+            raise TypeError(
+                f"slice_prog got {type(alpha)} ({alpha}), not Prog"
+            )
+
+
+def relevant_vars(alpha: tn.Prog, criterion: Iterable[str]) -> set[str]:
+    """
+    Compute the cone of influence of a set of variables at the end of
+    a program: the variables whose values, at some point, can affect
+    the final values of those in `criterion`, either by flowing into
+    them through assignments or by deciding which statements that do
+    so are executed.
+
+    Args:
+        alpha (tn.Prog): Program to analyze
+        criterion (Iterable[str]): Names of the variables of interest
+
+    Returns:
+        set[str]: The names of the relevant variables, which include
+            `criterion`
+    """
+    names = set(criterion)
+    while True:
+        size = len(names)
+        _collect(alpha, names)
+        if len(names) == size:
+            return names
+
+
+def _slice(alpha: tn.Prog, names: set[str]) -> Optional[tn.Prog]:
+    match alpha:
+        case tn.Asgn(name, _):
+            return alpha if name in names else None
+        case tn.Output(_):
+            return alpha if '#stdout' in names else None
+        case tn.Skip():
+            return None
+        case tn.Abort():
+            return alpha
+        case tn.Seq(alpha_p, beta_p):
+            return _block([_slice(alpha_p, names), _slice(beta_p, names)])
+        case tn.Block(stmts):
+            return _block([_slice(beta, names) for beta in stmts])
+        case tn.If(q, alpha_p, beta_p):
+            alpha_s, beta_s = _slice(alpha_p, names), _slice(beta_p, names)
+            if alpha_s is None and beta_s is None:
+                return None
+            return tn.If(q, alpha_s or tn.Skip(), beta_s or tn.Skip())
+        case tn.While(q, alpha_p):
+            return tn.While(q, _slice(alpha_p, names) or tn.Skip())
+
+
+def _block(stmts: list[Optional[tn.Prog]]) -> Optional[tn.Prog]:
+    stmts = [beta for beta in stmts if beta is not None]
+    return tn.Block.of(stmts) if stmts else None
+
+
+def slice_prog(alpha: tn.Prog, criterion: Iterable[str]) -> tn.Prog:
+    """
+    Remove the statements of a program that cannot affect the final
+    values of the variables in `criterion`: assignments to variables
+    outside their cone of influence (see `relevant_vars`), outputs
+    unless `#stdout` is in it, skips, and conditionals left with
+    nothing in either branch. Aborts and loops are kept, so the traces
+    of the result end, abort and exceed the unrolling depth exactly
+    when the corresponding traces of `alpha` do, and have the same
+    final values for the variables in the cone of influence.
+
+    Slicing an instrumented program by the variables of the property
+    being checked (e.g. `#violated`, or `#steps`) thus gives the same
+    answer with `box`, and models that agree on the variables that
+    matter. Since skips are removed, it must not be applied to a
+    program whose steps are counted by an interpreter rather than by
+    its own instrumentation.
+
+    Args:
+        alpha (tn.Prog): Program to slice
+        criterion (Iterable[str]): Names of the variables of interest
+
+    Returns:
+        tn.Prog: The sliced program, which is `skip` if nothing in
+            `alpha` is relevant
+
+    Raises:
+        TypeError: `alpha` isn't a program
+    """
+    return _slice(alpha, relevant_vars(alpha, criterion)) or tn.Skip()
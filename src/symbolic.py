@@ -1,63 +1,669 @@
 from tinyscript_util import (
-    fmla_enc,
+    Encoder,
+    check_sat,
+    dag_size,
     simplify,
-    term_enc
+    states_from_z3_models,
+    vars_prog
 )
 from enum import Enum
+from intervals import prune_prog
+from optimize import fold_prog
+from slicing import slice_prog
+from typing import Callable, Optional
+import batch
+import bmc
+import forward
 import tinyscript as tn
 import z3
 
 Result = Enum('Result', ['Satisfies', 'Violates', 'Unknown'])
 
+# Engines that `find_violation` can search for violations with
+BACKENDS = ('box', 'forward', 'bmc', 'deepening')
+
+_TRUE = z3.BoolVal(True)
+_FALSE = z3.BoolVal(False)
+
+# Postconditions with fewer subexpressions than this are cheaper to
+# copy into both branches of a conditional than to bind with a join
+_JOIN_SIZE = 32
+
+# Steps that `confirm_violations` runs each counterexample for
+REPLAY_STEPS = 10000
+
+
+def _and(*ps: z3.BoolRef) -> z3.BoolRef:
+    ps = [p for p in ps if not z3.is_true(p)]
+    if any(z3.is_false(p) for p in ps):
+        return _FALSE
+    return ps[0] if len(ps) == 1 else z3.And(ps) if ps else _TRUE
+
+
+def _or(*ps: z3.BoolRef) -> z3.BoolRef:
+    ps = [p for p in ps if not z3.is_false(p)]
+    if any(z3.is_true(p) for p in ps):
+        return _TRUE
+    return ps[0] if len(ps) == 1 else z3.Or(ps) if ps else _FALSE
+
+
+def _implies(p: z3.BoolRef, q: z3.BoolRef) -> z3.BoolRef:
+    if z3.is_true(q) or z3.is_false(p):
+        return _TRUE
+    return q if z3.is_true(p) else z3.Implies(p, q)
+
+
+def _assigned(alpha: tn.Prog, memo: dict) -> tuple[str, ...]:
+    """
+    Collect the names of the variables a program may assign, including
+    `#stdout` if it has an `output` statement.
+    """
+    if alpha in memo:
+        return memo[alpha]
+    match alpha:
+        case tn.Asgn(name, _):
+            names = (name,)
+        case tn.Output(_):
+            names = ('#stdout',)
+        case tn.Seq(alpha_p, beta_p) | tn.If(_, alpha_p, beta_p):
+            names = _assigned(alpha_p, memo) + _assigned(beta_p, memo)
+        case tn.Block(stmts):
+            names = tuple(
+                name for beta in stmts for name in _assigned(beta, memo))
+        case tn.While(_, alpha_p):
+            names = _assigned(alpha_p, memo)
+        case _:
+            names = ()
+    memo[alpha] = names = tuple(dict.fromkeys(names))
+    return names
+
+
+class _Box:
+    """
+    Applies the axioms of dynamic logic to one program and postcondition,
+    memoizing on each subprogram, intermediate postcondition, and depth
+    so that shared subproblems are only solved once.
+
+    With `joins` set, conditionals do not substitute the postcondition
+    into both branches, which makes the size of the result exponential
+    in the number of conditionals in sequence. Runs of loop- and
+    abort-free statements are instead summarized by one substitution,
+    which maps each variable a conditional assigns to an if-then-else
+    term. For other conditionals and loops with a large postcondition,
+    the values of the variables that they may assign are bound to fresh
+    constants `J`, and
+
+        [if q then a else b] P
+
+    becomes
+
+        [if q then a else b] true && (Exit(J) -> P[J/x])
+
+    where `Exit(J)` holds iff the conditional terminates normally in a
+    state where the assigned variables `x` equal `J`, and is derived by
+    the dual, diamond axioms in `exits`. For a loop nested in another,
+    the postcondition is the rest of the outer loop's unrolling, which
+    differs at each unrolling, so without a join the inner loop would
+    be unrolled again into each one. Because programs are
+    deterministic, at most one `J` satisfies `Exit(J)`, so `P` is
+    mentioned once and the result is valid iff it holds for all values
+    of the fresh constants, which is exactly what checking the
+    satisfiability of its negation decides. Aborts, and traces cut off
+    by the depth bound, are accounted for by the first conjunct.
+    """
+    def __init__(self, final: z3.BoolRef, strict: bool, joins: bool):
+        self.final = final
+        self.strict = strict
+        self.joins = joins
+        self.assigned = {}
+        self.simples = {}
+        self.encoder = Encoder()
+        self.fresh = set()
+        self.memo = {}
+
+    def simple(self, alpha: tn.Prog) -> bool:
+        """
+        Check whether a program is loop- and abort-free, so that its
+        effect can be computed as a substitution. Without `joins`, only
+        assignments, outputs and skips count as simple.
+        """
+        if alpha not in self.simples:
+            match alpha:
+                case tn.Asgn() | tn.Output() | tn.Skip():
+                    res = True
+                case tn.Seq(alpha_p, beta_p) | tn.If(_, alpha_p, beta_p) if self.joins:
+                    res = self.simple(alpha_p) and self.simple(beta_p)
+                case tn.Block(stmts) if self.joins:
+                    res = all(self.simple(beta) for beta in stmts)
+                case _:
+                    res = False
+            self.simples[alpha] = res
+        return self.simples[alpha]
+
+    def effect(self, alpha: tn.Prog, env: dict[str, z3.ExprRef]):
+        """
+        Update `env`, which maps variables to their values in terms of
+        the initial state, with the effect of a simple program. After a
+        conditional, each variable either branch assigns is mapped to
+        an if-then-else term, so that the postcondition is not copied.
+        """
+        match alpha:
+            case tn.Asgn(name, e):
+                env[name] = self.enc(e, env)
+            case tn.Output(e):
+                env['#stdout'] = self.enc(e, env)
+            case tn.Seq(alpha_p, beta_p):
+                self.effect(alpha_p, env)
+                self.effect(beta_p, env)
+            case tn.Block(stmts):
+                for beta in stmts:
+                    self.effect(beta, env)
+            case tn.If(q, alpha_p, beta_p):
+                q = self.enc(q, env)
+                env_a, env_b = dict(env), dict(env)
+                self.effect(alpha_p, env_a)
+                self.effect(beta_p, env_b)
+                for name in _assigned(alpha, self.assigned):
+                    a = env_a[name] if name in env_a else self.var(name)
+                    b = env_b[name] if name in env_b else self.var(name)
+                    env[name] = a if a.eq(b) else z3.If(q, a, b)
+
+    def straight(
+        self,
+        stmts: list[tn.Prog],
+        post: z3.BoolRef
+    ) -> z3.BoolRef:
+        """
+        Substitute the effect of a run of simple statements into a
+        postcondition at once.
+        """
+        env = {}
+        for alpha in stmts:
+            self.effect(alpha, env)
+        return self.subst(post, env)
+
+    def var(self, name: str) -> z3.ArithRef:
+        return self.encoder.var(name)
+
+    def enc(
+        self,
+        e: tn.Term | tn.Formula,
+        env: dict[str, z3.ExprRef]={}
+    ) -> z3.ExprRef:
+        """
+        Encode a term or formula, substituting the values in `env` for
+        the variables it mentions.
+        """
+        f, names = self.encoder.enc(e), self.encoder.names(e)
+        return self.subst(f, {x: env[x] for x in names if x in env})
+
+    def subst(self, f: z3.ExprRef, env: dict[str, z3.ExprRef]) -> z3.ExprRef:
+        if not env or z3.is_true(f) or z3.is_false(f):
+            return f
+        return z3.substitute(f, *((self.var(x), e) for x, e in env.items()))
+
+    def seq(
+        self,
+        stmts: tuple[tn.Prog, ...],
+        post: z3.BoolRef,
+        depth: int,
+        step: Callable
+    ) -> z3.BoolRef:
+        i = len(stmts)
+        while i > 0:
+            j = i
+            while j > 0 and self.simple(stmts[j-1]):
+                j -= 1
+            if j < i:
+                post = self.straight(stmts[j:i], post)
+            if j > 0:
+                post = step(stmts[j-1], post, depth)
+                j -= 1
+            i = j
+        return post
+
+    def joinable(self, alpha: tn.If | tn.While, post: z3.BoolRef) -> bool:
+        return (
+            self.joins and
+            bool(_assigned(alpha, self.assigned)) and
+            dag_size(post, _JOIN_SIZE) >= _JOIN_SIZE)
+
+    def join(
+        self,
+        alpha: tn.If | tn.While,
+        post: z3.BoolRef,
+        depth: int
+    ) -> tuple[z3.BoolRef, z3.BoolRef]:
+        """
+        Bind the variables assigned by a conditional or loop to fresh
+        constants, returning the exit condition and the postcondition
+        over them. If the exit condition simplifies to a conjunction of
+        equations that determine the fresh constants and a condition on
+        the current state, the constants are substituted away instead.
+        """
+        names = _assigned(alpha, self.assigned)
+        fresh = {name: z3.FreshInt(name) for name in names}
+        self.fresh.update(j.get_id() for j in fresh.values())
+        # The exit condition does not join at `alpha` itself, since its
+        # postcondition may be as large as `post`
+        exits = self.branch if isinstance(alpha, tn.If) else self.unroll
+        exit = z3.simplify(exits(
+            alpha,
+            _and(*(self.var(name) == j for name, j in fresh.items())),
+            depth))
+        solved, rest = {}, []
+        for c in exit.children() if z3.is_and(exit) else [exit]:
+            if not self.mentions_fresh(c):
+                rest.append(c)
+                continue
+            if not z3.is_eq(c):
+                break
+            j, t = c.children()
+            if j.get_id() not in self.fresh:
+                j, t = t, j
+            if j.get_id() not in self.fresh or self.mentions_fresh(t):
+                break
+            solved[j.get_id()] = t
+        else:
+            if len(solved) == len(fresh):
+                return _and(*rest), self.subst(post, {
+                    name: solved[j.get_id()] for name, j in fresh.items()})
+        return exit, self.subst(post, fresh)
+
+    def mentions_fresh(self, t: z3.ExprRef) -> bool:
+        stack = [t]
+        while stack:
+            e = stack.pop()
+            if e.get_id() in self.fresh:
+                return True
+            stack.extend(e.children())
+        return False
+
+    def branch(self, alpha: tn.If, post: z3.BoolRef, depth: int) -> z3.BoolRef:
+        q = self.enc(alpha.q)
+        return _or(
+            _and(q, self.exits(alpha.alpha, post, depth)),
+            _and(z3.Not(q), self.exits(alpha.beta, post, depth)))
+
+    def box(self, alpha: tn.Prog, post: z3.BoolRef, depth: int) -> z3.BoolRef:
+        """
+        Compute a formula equivalent to `[alpha] post`, unrolling loops
+        `depth` times.
+        """
+        key = ('box', alpha, post.get_id(), depth)
+        if key in self.memo:
+            return self.memo[key][1]
+        if depth < 1:
+            res = _FALSE if self.strict else _TRUE
+        else:
+            match alpha:
+                case _ if self.simple(alpha):
+                    res = self.straight([alpha], post)
+                case tn.Abort():
+                    res = self.final
+                case tn.Seq(alpha_p, beta_p):
+                    res = self.seq((alpha_p, beta_p), post, depth, self.box)
+                case tn.Block(stmts):
+                    res = self.seq(stmts, post, depth, self.box)
+                case tn.If() | tn.While() if self.joinable(alpha, post):
+                    exit, post_j = self.join(alpha, post, depth)
+                    res = _and(
+                        self.box(alpha, _TRUE, depth),
+                        _implies(exit, post_j))
+                case tn.If(q, alpha_p, beta_p):
+                    q = self.enc(q)
+                    res = _and(
+                        _implies(q, self.box(alpha_p, post, depth)),
+                        _implies(z3.Not(q), self.box(beta_p, post, depth)))
+                case tn.While(q, alpha_p):
+                    q = self.enc(q)
+                    res = _and(
+                        _implies(q, self.box(
+                            alpha_p, self.box(alpha, post, depth-1), depth)),
+                        _implies(z3.Not(q), post))
+                case _:
+                    raise TypeError(
+                        f"box got {type(alpha)} ({alpha}), not Prog"
+                    )
+        self.memo[key] = (post, res)
+        return res
+
+    def exits(self, alpha: tn.Prog, post: z3.BoolRef, depth: int) -> z3.BoolRef:
+        """
+        Compute a formula equivalent to `<alpha> post` over traces that
+        terminate normally, i.e., without aborting, and within `depth`
+        unrollings of each loop.
+        """
+        key = ('exits', alpha, post.get_id(), depth)
+        if key in self.memo:
+            return self.memo[key][1]
+        if depth < 1:
+            res = _FALSE
+        else:
+            match alpha:
+                case _ if self.simple(alpha):
+                    res = self.straight([alpha], post)
+                case tn.Abort():
+                    res = _FALSE
+                case tn.Seq(alpha_p, beta_p):
+                    res = self.seq((alpha_p, beta_p), post, depth, self.exits)
+                case tn.Block(stmts):
+                    res = self.seq(stmts, post, depth, self.exits)
+                case tn.If() | tn.While() if self.joinable(alpha, post):
+                    exit, post_j = self.join(alpha, post, depth)
+                    res = _and(exit, post_j)
+                case tn.If():
+                    res = self.branch(alpha, post, depth)
+                case tn.While():
+                    res = self.unroll(alpha, post, depth)
+                case _:
+                    raise TypeError(
+                        f"exits got {type(alpha)} ({alpha}), not Prog"
+                    )
+        self.memo[key] = (post, res)
+        return res
+
+    def unroll(self, alpha: tn.While, post: z3.BoolRef, depth: int) -> z3.BoolRef:
+        """
+        Compute `<alpha> post` for a loop like `exits`, unrolling it
+        without binding its own continuation by a join.
+        """
+        if depth < 1:
+            return _FALSE
+        key = ('unroll', alpha, post.get_id(), depth)
+        if key in self.memo:
+            return self.memo[key][1]
+        q = self.enc(alpha.q)
+        res = _or(
+            _and(q, self.exits(
+                alpha.alpha, self.unroll(alpha, post, depth-1), depth)),
+            _and(z3.Not(q), post))
+        self.memo[key] = (post, res)
+        return res
+
+
 @simplify
 def box(
     alpha: tn.Prog,
     postcondition: z3.BoolRef,
     max_depth: int=10,
-    depth_exceed_strict: bool=True
+    depth_exceed_strict: bool=True,
+    joins: bool=True
 ) -> z3.BoolRef:
     """
     Apply the axioms of dynamic logic to convert a box formula to
     and equivalent box-free formula over integer arithmetic. If
     the program has loops, then the loop axiom is applied up to
     `max_depth` times. After reaching this bound, `box` returns
-    `z3.BoolVal(False)` if `depth_exceed_strict` is `True`, and 
+    `z3.BoolVal(False)` if `depth_exceed_strict` is `True`, and
     `z3.BoolVal(True)` otherwise.
 
+    An `abort` ends the program, so the formula requires the
+    postcondition to hold in the state where it is executed.
+
+    The result is built as a DAG whose size is polynomial in the size
+    of the program: subproblems are memoized, and the state after each
+    conditional is bound to fresh constants rather than substituted
+    into both of its branches (see `_Box`). The result may therefore
+    mention constants that are not program variables; it is valid iff
+    the box formula is.
+
     Args:
         alpha (tn.Prog): Program inside the box formula
         postcondition (z3.BoolRef): Formula outside the box
-        max_depth (int, optional): Recursion limit for loop axiom; 
+        max_depth (int, optional): Recursion limit for loop axiom;
             defaults to `10`.
         depth_exceed_strict (bool, optional): Flags strict
             verification conditions for traces that exceed the
             loop recursion bound; defaults to `True`.
-    
+        joins (bool, optional): Bind the state after conditionals to
+            fresh constants; if `False`, substitute the postcondition
+            into both branches as in the textbook axiom, which can
+            give exponentially larger formulas. Defaults to `True`.
+
     Returns:
         z3.BoolRef: Result of applying axioms
-    
+
     Raises:
         TypeError: `alpha` isn't a program
     """
-    if max_depth < 1:
-        return z3.BoolVal(False) if depth_exceed_strict else z3.BoolVal(True)
+    return _Box(postcondition, depth_exceed_strict, joins).box(
+        alpha, postcondition, max_depth)
 
-    match alpha:
-        case tn.Skip():
-            return z3.BoolVal(True)
-        case tn.Asgn(name, e):
-            return z3.BoolVal(True)
-        case tn.Seq(alpha_p, beta_p):
-            return z3.BoolVal(True)
-        case tn.If(q, alpha_p, beta_p):
-            return z3.BoolVal(True)
-        case tn.While(q, alpha_p):
-            return z3.BoolVal(True)
-        case tn.Output(e):
-            return z3.BoolVal(True)
-        case tn.Abort():
-            return z3.BoolVal(True)
+
+def find_violation(
+    alpha: tn.Prog,
+    postcondition: z3.BoolRef,
+    max_depth: int=10,
+    depth_exceed_strict: bool=True,
+    timeout: Optional[float]=None,
+    backend: str='box',
+    confirm: Optional[Callable[[z3.ModelRef], bool]]=None,
+    solver: Callable[..., tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]=check_sat,
+    slicing: bool=True,
+    folding: bool=True,
+    pruning: bool=True
+) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+    """
+    Search for an initial state from which `alpha` ends in a state
+    that violates `postcondition`, i.e., for a model of the negation
+    of the box formula `[alpha] postcondition`, with loops unrolled up
+    to `max_depth` times.
+
+    Args:
+        alpha (tn.Prog): Program inside the box formula
+        postcondition (z3.BoolRef): Formula outside the box
+        max_depth (int, optional): Loop unrolling depth; defaults to
+            `10`.
+        depth_exceed_strict (bool, optional): Whether traces that
+            exceed the unrolling depth count as violations; defaults
+            to `True`.
+        timeout (float, optional): Timeout in seconds, or `None` for
+            no timeout.
+        backend (str, optional): `'box'` to check the formula computed
+            by `box` with one solver call, or `'forward'` to explore
+            the paths of `alpha` with `forward.explore`, or `'bmc'` to
+            check the static single assignment encoding of `alpha`
+            built by `bmc.encode`, or `'deepening'` to explore its paths
+            with `forward.deepen`, which tries increasing unrolling
+            depths up to `max_depth` and stops at the first definite
+            answer. Defaults to `'box'`.
+        confirm (Callable[[z3.ModelRef], bool], optional): With the
+            `'deepening'` backend and `depth_exceed_strict`, decides
+            whether the model of a trace cut off before `max_depth` is
+            a violation, so that the search can stop there.
+        solver (Callable, optional): Function called like `check_sat`
+            to check the formula with the `'box'` and `'bmc'` backends,
+            e.g. `portfolio.check_sat_portfolio`; defaults to
+            `check_sat`.
+        slicing (bool, optional): Whether to first remove the statements
+            of `alpha` that cannot affect the variables of
+            `postcondition`, with `slicing.slice_prog`. The variables
+            outside their cone of influence then get arbitrary values
+            in models. Defaults to `True`.
+        folding (bool, optional): Whether to first propagate constants
+            through `alpha` and remove the code that cannot run, with
+            `optimize.fold_prog`. Defaults to `True`.
+        pruning (bool, optional): Whether to then remove the code that
+            the intervals of the variables show cannot run, with
+            `intervals.prune_prog`. Defaults to `True`.
+
+    Returns:
+        tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: `z3.sat` and a
+            model whose values for the program variables give a
+            violating initial state, `z3.unsat` if there is none, or
+            `z3.unknown`.
+
+    Raises:
+        ValueError: `backend` is not one of `BACKENDS`
+    """
+    if folding:
+        alpha = fold_prog(alpha)
+    if pruning:
+        alpha = prune_prog(alpha)
+    if slicing:
+        alpha = slice_prog(alpha, (
+            str(v) for v in z3.z3util.get_vars(postcondition)))
+    match backend:
+        case 'box':
+            f = box(alpha, postcondition, max_depth, depth_exceed_strict)
+            # Constant folding often decides the program, and then box
+            # simplifies to true without the solver
+            if z3.is_true(f):
+                return z3.unsat, None
+            return solver([z3.Not(f)], timeout)
+        case 'forward':
+            return forward.explore(
+                alpha, postcondition, max_depth, depth_exceed_strict, timeout)
+        case 'deepening':
+            return forward.deepen(
+                alpha, postcondition, max_depth, depth_exceed_strict, timeout,
+                confirm)
+        case 'bmc':
+            return solver([bmc.encode(
+                alpha, postcondition, max_depth, depth_exceed_strict)], timeout)
         case _:
-            raise TypeError(
-                f"box got {type(alpha)} ({alpha}), not Prog"
+            raise ValueError(
+                f"unknown backend {backend!r}, expected one of {BACKENDS}"
             )
+
+
+def find_violations(
+    alpha: tn.Prog,
+    postconditions: list[z3.BoolRef],
+    max_depth: int=10,
+    depth_exceed_strict: bool=True,
+    timeout: Optional[float]=None,
+    slicing: bool=True,
+    folding: bool=True,
+    pruning: bool=True,
+    solver: Optional[Callable[..., tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]]=None
+) -> list[tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]:
+    """
+    Search for a violation of each of several postconditions, like
+    `find_violation` with the `'box'` backend, on one incremental
+    solver. Each postcondition is conjoined under a fresh Boolean guard
+    and `box` is computed once, for the conjunction. The guards are
+    tied to the choice of one postcondition, and the query for a
+    postcondition assumes its guard, which rules out the others; the
+    program is thus encoded once, and what the solver learns about it
+    carries over from one query to the next. With `solver`, each query
+    is instead one call, on the same formula with its guard added.
+
+    Args:
+        alpha (tn.Prog): Program inside the box formula
+        postconditions (list[z3.BoolRef]): Formulas outside the box
+        max_depth (int, optional): Loop unrolling depth; defaults to
+            `10`.
+        depth_exceed_strict (bool, optional): Whether traces that
+            exceed the unrolling depth count as violations; defaults
+            to `True`, and then the traces cut off count as violations
+            of every postcondition.
+        timeout (float, optional): Timeout of each query in seconds,
+            or `None` for no timeout.
+        slicing (bool, optional): As for `find_violation`, with the
+            variables of all the postconditions
+        folding (bool, optional): As for `find_violation`
+        pruning (bool, optional): As for `find_violation`
+        solver (Callable, optional): Function called like `check_sat`
+            for each query, e.g. `cache.SolverCache.check_sat`, or
+            `None` to query one incremental z3 solver; defaults to
+            `None`.
+
+    Returns:
+        list[tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]: For each
+            postcondition, in order, the result of its query, as
+            `find_violation` returns it
+    """
+    if not postconditions:
+        return []
+    if folding:
+        alpha = fold_prog(alpha)
+    if pruning:
+        alpha = prune_prog(alpha)
+    if slicing:
+        alpha = slice_prog(alpha, {
+            v.decl().name() for p in postconditions
+            for v in z3.z3util.get_vars(p)})
+    guards = [z3.FreshBool('guard') for _ in postconditions]
+    f = box(alpha, z3.And(*(
+        z3.Implies(g, p) for g, p in zip(guards, postconditions))),
+        max_depth, depth_exceed_strict)
+    if z3.is_true(f):
+        return [(z3.unsat, None)] * len(postconditions)
+    # The guards select one postcondition, so that assuming one guard
+    # falsifies the others without a literal for each
+    selected = z3.FreshInt('selected')
+    ps = [z3.Not(f)] + [g == (selected == i) for i, g in enumerate(guards)]
+    if solver is not None:
+        return [solver(ps + [g], timeout) for g in guards]
+    s = z3.Solver()
+    if timeout is not None:
+        s.set(timeout=int(timeout*1000))
+    s.add(*ps)
+    res = []
+    for g in guards:
+        try:
+            r = s.check(g)
+        except z3.Z3Exception:
+            # A timeout that fires as a query returns can leave the
+            # solver canceled, and the next query then gives up at once
+            r = z3.unknown
+        res.append((r, s.model() if r == z3.sat else None))
+    return res
+
+
+def confirm_violations(
+    alpha: tn.Prog,
+    instrumented: tn.Prog,
+    flags: list[str],
+    found: list[tuple[z3.CheckSatResult, Optional[z3.ModelRef]]],
+    max_steps: int=REPLAY_STEPS
+) -> list[tuple[Result, Optional[tn.State]]]:
+    """
+    Turn the results of `find_violations`, for postconditions that
+    each require a flag of an instrumented program to stay `0`, into
+    policy results, replaying the counterexamples concretely. The
+    state of every model is built with `states_from_z3_models`, for
+    the variables of `instrumented`, so that those it reads without
+    assigning, such as the `target` of `taint.instrument`, take the
+    model's values, and all of them are run through `instrumented` at
+    once, by `batch.exc`. A `Violates` result is only kept when the
+    run sets its flag: a run that ends without setting it shows that
+    the model is spurious, and one cut off after `max_steps` before
+    setting it does not confirm it, so both give `Unknown`.
+
+    Args:
+        alpha (tn.Prog): Program whose variables the initial states
+            that are returned give
+        instrumented (tn.Prog): Instrumented program that was checked,
+            which initializes its flags
+        flags (list[str]): Flag of each postcondition
+        found (list[tuple[z3.CheckSatResult, Optional[z3.ModelRef]]]):
+            The result of `find_violations` for each postcondition
+        max_steps (int, optional): Step bound of each replay
+
+    Returns:
+        list[tuple[Result, Optional[tn.State]]]: For each
+            postcondition, in order, its result, and for
+            Result.Violates, the initial state of the counterexample
+    """
+    violated = [i for i, (r, _) in enumerate(found) if r == z3.sat]
+    states = states_from_z3_models(instrumented, [found[i][1] for i in violated])
+    names = {x.name for x in vars_prog(alpha)}
+    replayed = dict(zip(violated, zip(states, batch.exc(
+        states, instrumented, max_steps, quiet=True))))
+    res = []
+    for i, ((r, _), flag) in enumerate(zip(found, flags)):
+        if r == z3.unsat:
+            res.append((Result.Satisfies, None))
+        elif r != z3.sat:
+            res.append((Result.Unknown, None))
+        else:
+            state, (final, _, _) = replayed[i]
+            if final.variables.get(flag, 0) > 0:
+                res.append((Result.Violates, tn.State({
+                    x: v for x, v in state.variables.items() if x in names})))
+            else:
+                res.append((Result.Unknown, None))
+    return res
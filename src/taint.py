@@ -1,21 +1,202 @@
 #!/usr/bin/env python3
 
-from symbolic import box, Result
+from symbolic import (
+	box,
+	confirm_violations,
+	find_violation,
+	find_violations,
+	Result
+)
 from tinyscript_util import (
 	check_sat,
 	fmla_enc,
-	state_from_z3_model,
 	stringify,
 	vars_formula,
 	vars_prog,
 	vars_term,
 )
+from collections import Counter
 from functools import reduce
+from intervals import prune_prog
+from optimize import fold_prog
+from typing import Optional
 import interpreter as interp
 import tinyscript as tn
 import z3
 
-def instrument(alpha: tn.Prog, source_prefix: str='sec_') -> tn.Prog:
+# Counts the tainted values the instrumented program has output
+VIOLATED = '#violated'
+
+# Variable that `localize` has the instrumented program read to select
+# the sink a trace ends at (see `instrument`)
+SINK = '#sink'
+
+# Number of programs decided by each stage of `symbolic_check`:
+# `'dataflow'` for `dataflow_check`, `'symbolic'` for the solver
+DECIDED_BY = Counter()
+
+def taint_var(name: str) -> str:
+	"""
+	Name of the variable that tracks the taint of variable `name`.
+	"""
+	return f"#taint_{name}"
+
+def site_var(i: int) -> str:
+	"""
+	Name of the counter of the `i`-th sink when sinks are recorded
+	by site (see `instrument`).
+	"""
+	return f"{VIOLATED}_{i}"
+
+def taint_term(e: tn.Term, tainted: Optional[frozenset[str]]=None) -> tn.Term:
+	"""
+	A term that is positive iff `e` mentions a tainted variable. Taints
+	are never negative, so their sum is positive iff one of them is,
+	which avoids branching on each variable. If `tainted` is given,
+	only the variables in it can be tainted, and the others are left
+	out.
+	"""
+	ts = [
+		tn.Var(taint_var(x.name)) for x in vars_term(e)
+		if tainted is None or x.name in tainted]
+	return reduce(tn.Sum, ts) if ts else tn.Const(0)
+
+def _stop(target: Optional[str], site: Optional[int]) -> tn.Prog:
+	"""
+	The statement that ends a trace after sink `site`, or a sink
+	counted in `#violated` if that is `None`, has output a tainted
+	value (see `instrument`).
+	"""
+	if target is None:
+		return tn.Abort()
+	return tn.If(
+		tn.EqF(tn.Var(target), tn.Const(site or 0)), tn.Abort(), tn.Skip())
+
+def _join(
+	tainted_a: Optional[frozenset[str]],
+	tainted_b: Optional[frozenset[str]]) -> Optional[frozenset[str]]:
+	if tainted_a is None or tainted_b is None:
+		return tainted_b if tainted_a is None else tainted_a
+	return tainted_a | tainted_b
+
+def _track(
+	alpha: tn.Prog,
+	tainted: Optional[frozenset[str]],
+	sites: Optional[list[tn.Prog]]=None,
+	target: Optional[str]=None) -> tuple[tn.Prog, Optional[frozenset[str]], bool]:
+	"""
+	Instrument a statement, given the variables `tainted` that may be
+	tainted when it is reached, or `None` if it is unreachable. This
+	is a flow-sensitive taint analysis: assignments taint exactly the
+	variables they assign from tainted ones, branches join, and loops
+	are iterated to a fixed point. Variables that cannot be tainted
+	are left out of the taint terms, and sinks that cannot output a
+	tainted value are not instrumented. Returns the instrumented
+	statement, the variables that may be tainted after it, and
+	whether it has a sink that may output a tainted value. If `sites`
+	is given, each instrumented sink counts its tainted outputs in its
+	own counter, and is appended to it; `target` selects the sinks
+	that end the trace (see `_stop`).
+	"""
+	if tainted is None:
+		return alpha, None, False
+	match alpha:
+		case tn.Asgn(name, e):
+			t = taint_term(e, tainted)
+			if isinstance(t, tn.Const):
+				tainted = tainted - {name}
+			else:
+				tainted = tainted | {name}
+			return tn.Block.of([tn.Asgn(taint_var(name), t), alpha]), tainted, False
+		case tn.Output(e):
+			t = taint_term(e, tainted)
+			if isinstance(t, tn.Const):
+				return alpha, tainted, False
+			flag, site = VIOLATED, None
+			if sites is not None:
+				site = len(sites)
+				flag = site_var(site)
+				sites.append(alpha)
+			# The trace ends once a tainted value is output, so that a
+			# loop cut off later by the unrolling depth cannot hide it
+			return tn.Block.of([
+				tn.Asgn(flag, tn.Sum(tn.Var(flag), t)),
+				tn.If(tn.LtF(tn.Const(0), t), _stop(target, site), tn.Skip()),
+				alpha]), tainted, True
+		case tn.Skip():
+			return alpha, tainted, False
+		case tn.Abort():
+			return alpha, None, False
+		case tn.Seq(alpha_p, beta_p):
+			alpha_t, tainted, sink_a = _track(alpha_p, tainted, sites, target)
+			beta_t, tainted, sink_b = _track(beta_p, tainted, sites, target)
+			return tn.Seq(alpha_t, beta_t), tainted, sink_a or sink_b
+		case tn.Block(stmts):
+			res, sink = [], False
+			for beta in stmts:
+				beta_t, tainted, sink_b = _track(beta, tainted, sites, target)
+				res.append(beta_t)
+				sink = sink or sink_b
+			return tn.Block.of(res), tainted, sink
+		case tn.If(q, alpha_p, beta_p):
+			alpha_t, tainted_a, sink_a = _track(alpha_p, tainted, sites, target)
+			beta_t, tainted_b, sink_b = _track(beta_p, tainted, sites, target)
+			return tn.If(q, alpha_t, beta_t), _join(tainted_a, tainted_b), \
+				sink_a or sink_b
+		case tn.While(q, alpha_p):
+			# Grow the variables that may be tainted at the head of the
+			# loop until an iteration adds none
+			while True:
+				alpha_t, tainted_end, sink = _track(alpha_p, tainted, None, target)
+				head = _join(tainted, tainted_end)
+				if head == tainted:
+					break
+				tainted = head
+			# The sinks of the body are recorded once, as instrumented
+			# at the fixed point
+			if sites is not None:
+				alpha_t, _, sink = _track(alpha_p, tainted, sites, target)
+			return tn.While(q, alpha_t), tainted, sink
+		case _:
+			raise TypeError(
+				f"instrument got {type(alpha)} ({alpha}), not Prog"
+			)
+
+def sources(alpha: tn.Prog, source_prefix: str='sec_') -> frozenset[str]:
+	"""
+	The names of the variables of `alpha` that are sources.
+	"""
+	return frozenset(
+		x.name for x in vars_prog(alpha) if x.name.startswith(source_prefix))
+
+def dataflow_check(alpha: tn.Prog, source_prefix: str='sec_') -> Result:
+	"""
+	Decides the taint policy without a solver when a flow-sensitive
+	taint analysis, run after folding constants with
+	`optimize.fold_prog` and removing the branches that
+	`intervals.prune_prog` shows cannot run, shows that no sink can
+	output a value computed from a source.
+	
+	Args:
+	    alpha (tn.Prog): Program to check
+	    source_prefix (str, optional): String prefix for source
+	    	variables
+	
+	Returns:
+	    Result: Result.Satisfies if no sink can be tainted, as
+	    	`symbolic_check` would return at any unrolling depth,
+	    	and Result.Unknown otherwise, since whether a tainted
+	    	sink is reached depends on the feasibility of its path.
+	"""
+	alpha = prune_prog(fold_prog(alpha))
+	_, _, sink = _track(alpha, sources(alpha, source_prefix))
+	return Result.Unknown if sink else Result.Satisfies
+
+def instrument(
+	alpha: tn.Prog,
+	source_prefix: str='sec_',
+	sites: Optional[list[tn.Prog]]=None,
+	target: Optional[str]=None) -> tn.Prog:
 	"""
 	Instruments a program to support symbolic checking 
 	for violations of a taint policy that considers any variable 
@@ -26,20 +207,91 @@ def instrument(alpha: tn.Prog, source_prefix: str='sec_') -> tn.Prog:
 	    alpha (tn.Prog): A tinyscript program to instrument
 	    source_prefix (str, optional): The string prefix for
 	    	source variables
+	    sites (list[tn.Prog], optional): If given, each
+	    	instrumented sink is appended to it, and the `i`-th one
+	    	counts its tainted outputs in `site_var(i)` instead of
+	    	`#violated`.
+	    target (str, optional): If given, a sink that outputs a
+	    	tainted value only ends the trace when the variable
+	    	`target` equals its index, or `0` without `sites`. The
+	    	program never assigns `target`, so the initial state
+	    	chooses the sink a trace stops at.
 	
 	Returns:
 	    tn.Prog: The instrumented program. It should be possible
 	    	to use the box modality and a satisfiability solver
 	    	to determine whether a trace in the original program
 	    	`alpha` exists that violates the taint policy.
+	    	Only explicit flows are tracked: `#taint_x` is positive
+	    	iff the value of `x` was computed from a source, and
+	    	`#violated` is positive once a tainted value has been
+	    	output, which ends the trace. Variables and sinks that
+	    	the taint analysis shows cannot be tainted are not
+	    	tracked.
+	"""
+	prefix = [
+		tn.Asgn(
+			taint_var(x.name),
+			tn.Const(1 if x.name.startswith(source_prefix) else 0))
+		for x in vars_prog(alpha)]
+	tracked, _, _ = _track(alpha, sources(alpha, source_prefix), sites, target)
+	flags = [VIOLATED] + [site_var(i) for i in range(len(sites or []))]
+	return tn.Block.of(
+		prefix + [tn.Asgn(flag, tn.Const(0)) for flag in flags] + [tracked])
+
+def localize(
+	alpha: tn.Prog,
+	source_prefix: str='sec_',
+	max_depth: int=1,
+	timeout: int=10
+) -> list[tuple[tn.Prog, Result, Optional[tn.State]]]:
+	"""
+	Checks each sink that may output a tainted value separately,
+	reporting every one that does with its own witness. Each sink
+	counts its tainted outputs in its own counter (see
+	`instrument`), and the counters are checked by
+	`symbolic.find_violations`, as assumption-guarded queries on
+	one incremental solver, so the program is encoded once
+	rather than once per sink. A tainted output only ends the trace
+	at the sink that `SINK` selects, so the sinks after it are still
+	reached, and a loop cut off after it cannot hide it. The
+	witnesses are then replayed together on the instrumented program
+	by `symbolic.confirm_violations`, and one whose run ends without
+	setting its flag is reported as Result.Unknown.
+	
+	Args:
+	    alpha (tn.Prog): Program to check
+	    source_prefix (str, optional): String prefix for source
+	    	variables
+	    max_depth (int, optional): Loop unrolling depth
+	    timeout (int, optional): Solver timeout of each query, in
+	    	seconds
+	
+	Returns:
+	    list[tuple[tn.Prog, Result, Optional[tn.State]]]: For each
+	    	sink that the taint analysis does not rule out, in
+	    	program order, the `output` statement, the result for
+	    	it as `symbolic_check` would give it, and for
+	    	Result.Violates, an initial state from which a trace
+	    	within the unrolling depth outputs a tainted value
+	    	there.
 	"""
-	return alpha
+	sites = []
+	beta = instrument(alpha, source_prefix, sites, SINK)
+	flags = [site_var(i) for i in range(len(sites))]
+	found = find_violations(
+		beta, [z3.Int(flag) == 0 for flag in flags], max_depth, False, timeout)
+	return [
+		(site, r, state)
+		for site, (r, state) in zip(sites, confirm_violations(alpha, beta, flags, found))]
 
 def symbolic_check(
 	alpha: tn.Prog, 
 	source_prefix: str='sec_', 
 	max_depth: int=1,
-	timeout: int=10) -> Result:
+	timeout: int=10,
+	backend: str='box',
+	solver=check_sat) -> Result:
 	"""
 	Uses the box modality and a satisfiability solver to determine
 	whether there are any traces that violate a taint policy that 
@@ -47,7 +299,9 @@ def symbolic_check(
 	source, and the argument to any `output` statement to be a sink.
 	This function only considers traces generated after unrolling 
 	loops up to `max_depth` times, and will terminate the solver 
-	after `timeout` seconds.
+	after `timeout` seconds. Programs that `dataflow_check` decides
+	are not passed to the solver; the stage that decided each
+	program is counted in `DECIDED_BY`.
 	
 	Args:
 	    alpha (tn.Prog): Program to check
@@ -55,6 +309,11 @@ def symbolic_check(
 	    	variables
 	    max_depth (int, optional): Loop unrolling depth
 	    timeout (int, optional): Solver timeout, in seconds
+	    backend (str, optional): Search engine, one of
+	    	`symbolic.BACKENDS`
+	    solver (optional): Function called like `check_sat` by the
+	    	`'box'` and `'bmc'` backends, e.g. the `check_sat`
+	    	method of a `cache.SolverCache`
 	
 	Returns:
 	    Result: The status of the check, one of three values:
@@ -66,10 +325,24 @@ def symbolic_check(
 	    	- Result.Unknown: The result is indeterminate (e.g. the
 	    	  solver timed out, returning z3.unknown).
 	"""
+	res = dataflow_check(alpha, source_prefix)
+	if res != Result.Unknown:
+		DECIDED_BY['dataflow'] += 1
+		return res
+	DECIDED_BY['symbolic'] += 1
+	post = z3.Int(VIOLATED) == 0
+	res, _ = find_violation(
+		instrument(alpha, source_prefix), post, max_depth, False, timeout, backend,
+		solver=solver)
+	match res:
+		case z3.unsat:
+			return Result.Satisfies
+		case z3.sat:
+			return Result.Violates
 	return Result.Unknown
 
 if __name__ == "__main__":
-	from parser import parse, fmla_parse
+	from parser import parse_file
 	import sys
 	from pathlib import Path
 
@@ -85,18 +358,17 @@ if __name__ == "__main__":
 	for test_file in list(TEST_DIR.iterdir()):
 		if not str(test_file).endswith('tinyscript'):
 			continue
-		with test_file.open() as f:
-			prog = parse(f.read())
-			res = symbolic_check(prog)
-			print((
-				f"{test_file} result:" 
-				f"{res}"))
-			match res:
-				case Result.Satisfies:
-					passed += 1
-				case Result.Violates:
-					violate += 1
-				case Result.Unknown:
-					unknown += 1
+		prog = parse_file(test_file)
+		res = symbolic_check(prog)
+		print((
+			f"{test_file} result:" 
+			f"{res}"))
+		match res:
+			case Result.Satisfies:
+				passed += 1
+			case Result.Violates:
+				violate += 1
+			case Result.Unknown:
+				unknown += 1
 
 	print(f"\n{passed=}, {violate=}, {unknown=}")
\ No newline at end of file
@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from typing import Iterable
+from weakref import WeakValueDictionary
 
 
 @dataclass
@@ -7,6 +9,43 @@ class State:
 
 
 class Token:
+    """
+    Base class of all tinyscript syntax nodes.
+
+    Nodes are immutable and hash-consed: constructing a node that is
+    structurally equal to one that is still alive returns the existing
+    object. Equality and hashing are therefore identity-based and O(1),
+    and nodes can be used directly as keys when memoizing traversals.
+    """
+    __slots__ = ('__weakref__',)
+
+    _interned = WeakValueDictionary()
+
+    def __new__(cls, *args, **kwargs):
+        fields = cls.__match_args__
+        if kwargs:
+            args = args + tuple(kwargs.pop(f) for f in fields[len(args):]
+                                if f in kwargs)
+            if kwargs:
+                raise TypeError(
+                    f"{cls.__name__} got unexpected fields {list(kwargs)}")
+        if len(args) != len(fields):
+            raise TypeError(
+                f"{cls.__name__} expects {len(fields)} fields, "
+                f"got {len(args)}")
+        key = (cls, *args)
+        node = Token._interned.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            for field, arg in zip(fields, args):
+                object.__setattr__(node, field, arg)
+            Token._interned[key] = node
+        return node
+
+    def __reduce__(self):
+        return (type(self),
+                tuple(getattr(self, f) for f in self.__match_args__))
+
     @classmethod
     def parseaction(cls, toks: list):
         new = cls(*toks)
@@ -14,122 +53,160 @@ class Token:
         toks.append(new)
 
 
+node = dataclass(frozen=True, slots=True, eq=False, init=False)
+
+
 class Term(Token):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@node
 class Const(Term):
     value: int
 
-    def __init__(self, value: str) -> 'Const':
-        self.value = int(value)
+    def __new__(cls, value: str) -> 'Const':
+        return Token.__new__(cls, int(value))
 
 
-@dataclass
+@node
 class Var(Term):
     name: str
 
 
-@dataclass
+@node
 class Sum(Term):
     left: Term
     right: Term
 
 
-@dataclass
+@node
 class Difference(Term):
     left: Term
     right: Term
 
 
-@dataclass
+@node
 class Product(Term):
     left: Term
     right: Term
 
 
 class Formula(Token):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@node
 class TrueC(Formula):
     pass
 
 
-@dataclass
+@node
 class FalseC(Formula):
     pass
 
 
-@dataclass
+@node
 class NotF(Formula):
     q: Formula
 
 
-@dataclass
+@node
 class AndF(Formula):
     p: Formula
     q: Formula
 
 
-@dataclass
+@node
 class OrF(Formula):
     p: Formula
     q: Formula
 
 
-@dataclass
+@node
 class ImpliesF(Formula):
     p: Formula
     q: Formula
 
 
-@dataclass
+@node
 class EqF(Formula):
     left: Term
     right: Term
 
 
-@dataclass
+@node
 class LtF(Formula):
     left: Term
     right: Term
 
 
 class Prog(Token):
-    pass
+    __slots__ = ()
 
-@dataclass
+@node
 class Skip(Prog):
     pass
 
-@dataclass
+@node
 class Asgn(Prog):
     name: str
     exp: Term
 
-@dataclass
+@node
 class Seq(Prog):
     alpha: Prog
     beta: Prog
 
-@dataclass
+@node
+class Block(Prog):
+    """
+    A non-empty sequence of statements, executed in order. This is
+    the flat counterpart of a left-nested chain of `Seq` nodes, and
+    is what the parser produces for `alpha_1; ...; alpha_n`.
+    """
+    stmts: tuple[Prog, ...]
+
+    def __new__(cls, stmts: Iterable[Prog]) -> 'Block':
+        stmts = tuple(stmts)
+        if len(stmts) == 0:
+            raise ValueError("Block must contain at least one statement")
+        return Token.__new__(cls, stmts)
+
+    @classmethod
+    def of(cls, stmts: Iterable[Prog]) -> Prog:
+        """
+        Sequence statements, splicing in the contents of nested blocks
+        and returning a lone statement as-is.
+        """
+        flat = []
+        for alpha in stmts:
+            if isinstance(alpha, Block):
+                flat.extend(alpha.stmts)
+            else:
+                flat.append(alpha)
+        return flat[0] if len(flat) == 1 else cls(flat)
+
+    @classmethod
+    def parseaction(cls, toks: list):
+        new = cls.of(toks)
+        toks.clear()
+        toks.append(new)
+
+@node
 class If(Prog):
     q: Formula
     alpha: Prog
     beta: Prog
 
-@dataclass
+@node
 class While(Prog):
     q: Formula
     alpha: Prog
 
-@dataclass
+@node
 class Output(Prog):
     e: Term
 
-@dataclass
+@node
 class Abort(Prog):
-    pass
\ No newline at end of file
+    pass
@@ -1,17 +1,19 @@
-from functools import reduce
-from typing import Optional
+from dataclasses import fields
+from typing import Optional, get_origin
+import logging
+import marshal
 import tinyscript as tn
 import z3
+import zlib
 
 def unique(func):
     """
     Decorator to make items in a list unique
     """
     def simplifyInner(*args, **kwargs):
-        return reduce(
-    		lambda l, x: l.append(x) or l if x not in l else l, 
-    		func(*args, **kwargs), 
-    		[])
+        # Nodes are hash-consed, so equal items are the same object,
+        # and a dict keeps the first of each in linear time
+        return list(dict.fromkeys(func(*args, **kwargs)))
     return simplifyInner
 
 def simplify(func):
@@ -22,9 +24,50 @@ def simplify(func):
         return z3.simplify(func(*args, **kwargs))
     return simplifyInner
 
+# Tactic pipelines that `check_sat` builds its solver from, by logic.
+# Each simplifies and eliminates solved variables before handing off to
+# a core solver; `elim-uncnstr` pays off on nonlinear formulas, where
+# it removes the products that no other constraint mentions.
+TACTICS = {
+	'QF_BOOL': ('simplify', 'propagate-values', 'tseitin-cnf', 'sat'),
+	'QF_LIA': ('simplify', 'propagate-values', 'solve-eqs', 'smt'),
+	'QF_NIA': ('simplify', 'propagate-values', 'solve-eqs', 'elim-uncnstr', 'smt'),
+}
+
+_log = logging.getLogger(__name__)
+
+def detect_logic(ps: list[z3.BoolRef]) -> str:
+	"""
+	Classify a list of quantifier-free formulas by the theory they
+	need: `'QF_NIA'` if they multiply two non-constant terms,
+	`'QF_LIA'` if they have any other integer terms, and `'QF_BOOL'`
+	if they are propositional.
+	
+	Args:
+	    ps (list[z3.BoolRef]): Formulas to classify
+	
+	Returns:
+	    str: The name of the logic, a key of `TACTICS`
+	"""
+	logic = 'QF_BOOL'
+	seen = set()
+	stack = list(ps)
+	while stack:
+		e = stack.pop()
+		if e.get_id() in seen:
+			continue
+		seen.add(e.get_id())
+		if z3.is_mul(e) and sum(not z3.is_int_value(a) for a in e.children()) > 1:
+			return 'QF_NIA'
+		if z3.is_int(e):
+			logic = 'QF_LIA'
+		stack.extend(e.children())
+	return logic
+
 def check_sat(
 	ps: list[z3.BoolRef],
-	timeout: int=None
+	timeout: int=None,
+	logic: Optional[str]='auto'
 ) -> tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
 	"""
 	Checks a list of formulas for satisfiability, with
@@ -34,14 +77,31 @@ def check_sat(
 	    ps (list[z3.BoolRef]): Formulas to check
 	    timeout (int, optional): Timeout in seconds, or `None`
 	    	for no timeout. Defaults to `None`.
+	    logic (str, optional): Selects the solver: a key of
+	    	`TACTICS` to use its tactic pipeline, `'auto'` to
+	    	pick the pipeline for the logic `detect_logic`
+	    	finds, or `None` for Z3's default solver. Defaults
+	    	to `'auto'`. The choice is logged at debug level.
 	
 	Returns:
 	    tuple[z3.CheckSatResult, Optional[z3.ModelRef]]: If
 	    	the conjunction of `ps` is satisfiable, then a tuple
 	    	with a corresponding model in the second position.
 	    	Otherwise, the second position is `None`.
+	
+	Raises:
+	    ValueError: If `logic` is not `'auto'`, `None`, or a key
+	    	of `TACTICS`
 	"""
-	s = z3.Solver()
+	if logic == 'auto':
+		logic = detect_logic(ps)
+	if logic is None:
+		s = z3.Solver()
+	elif logic in TACTICS:
+		s = z3.Then(*TACTICS[logic]).solver()
+	else:
+		raise ValueError(f"unknown logic {logic!r}, expected one of {list(TACTICS)}")
+	_log.debug("check_sat: logic %s, tactics %s", logic, TACTICS.get(logic))
 	if timeout is not None:
 		s.set(timeout=int(timeout*1000))
 	for p in ps:
@@ -49,7 +109,69 @@ def check_sat(
 	res = s.check()
 	return (res, s.model() if res == z3.sat else None)
 
-@simplify
+def model_values(model: z3.ModelRef) -> dict[str, int | bool]:
+	"""
+	Extract the values a model gives to its integer, bit-vector and
+	Boolean constants, so that it can be stored or sent to another
+	process. Bit-vectors are read as signed integers.
+	
+	Args:
+	    model (z3.ModelRef): Model to read
+	
+	Returns:
+	    dict[str, int | bool]: Value of each constant, by name
+	"""
+	values = {}
+	for d in model.decls():
+		v = model[d]
+		if z3.is_bv_value(v):
+			values[d.name()] = v.as_signed_long()
+		elif z3.is_int_value(v):
+			values[d.name()] = v.as_long()
+		elif z3.is_true(v) or z3.is_false(v):
+			values[d.name()] = z3.is_true(v)
+	return values
+
+def model_from_values(
+	ps: list[z3.BoolRef],
+	values: dict[str, int | bool],
+	timeout: Optional[float]=None) -> Optional[z3.ModelRef]:
+	"""
+	Rebuild a model of `ps` from values obtained with `model_values`,
+	by solving `ps` with its constants fixed to them.
+	
+	Args:
+	    ps (list[z3.BoolRef]): Formulas the values satisfy
+	    values (dict[str, int | bool]): Values of the constants
+	    timeout (float, optional): Timeout in seconds, or `None`
+	    	for no timeout. Defaults to `None`.
+	
+	Returns:
+	    Optional[z3.ModelRef]: A model of `ps` that agrees with
+	    	`values`, or `None` if there is none, or none is found
+	    	within `timeout`
+	"""
+	s = z3.Solver()
+	if timeout is not None:
+		s.set(timeout=int(timeout*1000))
+	s.add(ps)
+	# Walk the formulas as a DAG, since `z3.z3util.get_vars` visits
+	# shared subterms once per occurrence
+	stack, seen = list(ps), set()
+	while stack:
+		e = stack.pop()
+		if e.get_id() in seen:
+			continue
+		seen.add(e.get_id())
+		if z3.is_const(e) and e.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+			name = e.decl().name()
+			if name in values:
+				v = values[name]
+				s.add(e == (z3.BoolVal(v) if isinstance(v, bool) else z3.IntVal(v)))
+		else:
+			stack.extend(e.children())
+	return s.model() if s.check() == z3.sat else None
+
 def term_enc(e: tn.Term) -> z3.IntNumRef:
     """
     Encode a tinyscript.Term as a z3.IntNumRef
@@ -64,24 +186,9 @@ def term_enc(e: tn.Term) -> z3.IntNumRef:
         TypeError: If the argument isn't a valid 
         	tinyscript term.
     """
-    match e:
-        case tn.Const(val):
-            return z3.IntVal(val)
-        case tn.Var(id):
-            return z3.Int(id)
-        case tn.Sum(left, right):
-            return term_enc(left) + term_enc(right)
-        case tn.Difference(left, right):
-            return term_enc(left) - term_enc(right)
-        case tn.Product(left, right):
-            return term_enc(left) * term_enc(right)
-        case _:
-            raise TypeError(
-                f"term_enc got {type(e)} ({e}), not Term"
-            )
+    return Encoder().term(e)
 
 
-@simplify
 def fmla_enc(p: tn.Formula) -> z3.BoolRef:
     """
     Encode a tinyscript.Formula as a z3.BoolRef
@@ -96,27 +203,160 @@ def fmla_enc(p: tn.Formula) -> z3.BoolRef:
         TypeError: If the argument isn't a valid 
         	tinyscript formula.
     """
-    match p:
-        case tn.TrueC():
-            return z3.BoolVal(True)
-        case tn.FalseC():
-            return z3.BoolVal(False)
-        case tn.NotF(q):
-            return z3.Not(fmla_enc(q))
-        case tn.AndF(p, q):
-            return z3.And(fmla_enc(p), fmla_enc(q))
-        case tn.OrF(p, q):
-            return z3.Or(fmla_enc(p), fmla_enc(q))
-        case tn.ImpliesF(p, q):
-            return z3.Implies(fmla_enc(p), fmla_enc(q))
-        case tn.EqF(left, right):
-            return term_enc(left) == term_enc(right)
-        case tn.LtF(left, right):
-            return term_enc(left) < term_enc(right)
-        case _:
-            raise TypeError(
-                f"fmla_enc got {type(p)} ({p}), not Formula"
-            )
+    return Encoder().fmla(p)
+
+
+class Encoder:
+    """
+    Encodes tinyscript terms and formulas as Z3 expressions, keeping a
+    symbol table of the constant for each variable name and memoizing
+    the encoding of every subterm, so that an expression shared by
+    several terms, or encoded repeatedly, is only built once.
+
+    If `simplify` is set, the result of `term` and `fmla` is simplified
+    once, at the root, rather than after each step of the recursion.
+    The encoder also records the variables that each term or formula
+    mentions (see `names`), which is what callers that substitute
+    values into encodings need.
+    """
+    def __init__(self, simplify: bool=True):
+        self.simplify = simplify
+        self.consts = {}
+        self.raw = {}
+        self.roots = {}
+        self.free = {}
+
+    def var(self, name: str) -> z3.ArithRef:
+        """
+        The Z3 constant standing for variable `name`.
+        """
+        if name not in self.consts:
+            self.consts[name] = z3.Int(name)
+        return self.consts[name]
+
+    def term(self, e: tn.Term) -> z3.ArithRef:
+        """
+        Encode a term.
+
+        Raises:
+            TypeError: If the argument isn't a valid tinyscript term
+        """
+        if e not in self.roots:
+            t = self.encode_term(e)
+            self.roots[e] = z3.simplify(t) if self.simplify else t
+        return self.roots[e]
+
+    def fmla(self, p: tn.Formula) -> z3.BoolRef:
+        """
+        Encode a formula.
+
+        Raises:
+            TypeError: If the argument isn't a valid tinyscript formula
+        """
+        if p not in self.roots:
+            f = self.encode_fmla(p)
+            self.roots[p] = z3.simplify(f) if self.simplify else f
+        return self.roots[p]
+
+    def enc(self, e: tn.Term | tn.Formula) -> z3.ExprRef:
+        """
+        Encode a term or formula.
+        """
+        return self.term(e) if isinstance(e, tn.Term) else self.fmla(e)
+
+    def names(self, e: tn.Term | tn.Formula) -> tuple[str, ...]:
+        """
+        The names of the variables a term or formula mentions, in order
+        of first occurrence.
+        """
+        if e not in self.free:
+            match e:
+                case tn.Var(name):
+                    names = (name,)
+                case tn.Sum(p, q) | tn.Difference(p, q) | tn.Product(p, q) | \
+                        tn.EqF(p, q) | tn.LtF(p, q) | tn.AndF(p, q) | \
+                        tn.OrF(p, q) | tn.ImpliesF(p, q):
+                    names = tuple(dict.fromkeys(self.names(p) + self.names(q)))
+                case tn.NotF(q):
+                    names = self.names(q)
+                case _:
+                    names = ()
+            self.free[e] = names
+        return self.free[e]
+
+    def encode_term(self, e: tn.Term) -> z3.ArithRef:
+        if e in self.raw:
+            return self.raw[e]
+        match e:
+            case tn.Const(val):
+                t = z3.IntVal(val)
+            case tn.Var(name):
+                t = self.var(name)
+            case tn.Sum(left, right):
+                t = self.encode_term(left) + self.encode_term(right)
+            case tn.Difference(left, right):
+                t = self.encode_term(left) - self.encode_term(right)
+            case tn.Product(left, right):
+                t = self.encode_term(left) * self.encode_term(right)
+            case _:
+                raise TypeError(
+                    f"term_enc got {type(e)} ({e}), not Term"
+                )
+        self.raw[e] = t
+        return t
+
+    def encode_fmla(self, p: tn.Formula) -> z3.BoolRef:
+        if p in self.raw:
+            return self.raw[p]
+        match p:
+            case tn.TrueC():
+                f = z3.BoolVal(True)
+            case tn.FalseC():
+                f = z3.BoolVal(False)
+            case tn.NotF(q):
+                f = z3.Not(self.encode_fmla(q))
+            case tn.AndF(p1, q):
+                f = z3.And(self.encode_fmla(p1), self.encode_fmla(q))
+            case tn.OrF(p1, q):
+                f = z3.Or(self.encode_fmla(p1), self.encode_fmla(q))
+            case tn.ImpliesF(p1, q):
+                f = z3.Implies(self.encode_fmla(p1), self.encode_fmla(q))
+            case tn.EqF(left, right):
+                f = self.encode_term(left) == self.encode_term(right)
+            case tn.LtF(left, right):
+                f = self.encode_term(left) < self.encode_term(right)
+            case _:
+                raise TypeError(
+                    f"fmla_enc got {type(p)} ({p}), not Formula"
+                )
+        self.raw[p] = f
+        return f
+
+def dag_size(f: z3.ExprRef, limit: Optional[int]=None) -> int:
+    """
+    Count the distinct subexpressions of a z3 expression, i.e., the
+    number of nodes in its DAG representation. Unlike the length of
+    its printed form, this does not count shared subexpressions more
+    than once.
+
+    Args:
+        f (z3.ExprRef): Expression to measure
+        limit (int, optional): Stop counting once this many
+            subexpressions have been found. Defaults to `None`.
+
+    Returns:
+        int: Number of distinct subexpressions of `f`, including `f`,
+            or `limit` if there are more
+    """
+    seen = set()
+    stack = [f]
+    while stack and (limit is None or len(seen) < limit):
+        e = stack.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        stack.extend(e.children())
+    return len(seen)
 
 def term_stringify(e: tn.Term) -> str:
     """
@@ -205,6 +445,8 @@ def stringify(alpha: tn.Prog, indent=0) -> str:
             return f"{' '*indent}{name} := {term_stringify(aexp)}"
         case tn.Seq(alpha_p, beta_p):
             return f"{stringify(alpha_p, indent)};\n{stringify(beta_p, indent)}"
+        case tn.Block(stmts):
+            return ";\n".join(stringify(beta, indent) for beta in stmts)
         case tn.If(p, alpha_p, beta_p):
             return (
                 f"{' '*indent}if ({fmla_stringify(p)}) then\n"
@@ -312,6 +554,11 @@ def vars_prog(alpha: tn.Prog) -> list[tn.Var]:
 			return [tn.Var(name)] + vars_term(aexp)
 		case tn.Seq(alpha_p, beta_p):
 			return vars_prog(alpha_p) + vars_prog(beta_p)
+		case tn.Block(stmts):
+			vs = []
+			for beta in stmts:
+				vs.extend(vars_prog(beta))
+			return vs
 		case tn.If(p, alpha_p, beta_p):
 			return vars_formula(p) + vars_prog(alpha_p) + vars_prog(beta_p)
 		case tn.While(q, alpha_p):
@@ -350,11 +597,137 @@ def state_from_z3_model(
 	    tn.State: A tinyscript interpreter state which represents the values
 	    	determined by `model`.
 	"""
-	vs = vars_prog(alpha)
-	m = lambda x: model.evaluate(z3.Int(x), model_completion=complete)
-	state = {
-		v.name: m(v.name).as_long() 
-		for v in vs
-		if isinstance(m(v.name), z3.IntNumRef)
-	}
-	return tn.State(state)
+	state, = states_from_z3_models(alpha, [model], complete)
+	return state
+
+def states_from_z3_models(
+	alpha: tn.Prog,
+	models: list[z3.ModelRef],
+	complete: bool=True
+) -> list[tn.State]:
+	"""
+	Construct the interpreter states of several models of formulas
+	about the same program, as `state_from_z3_model` does for each.
+	The variables of `alpha` are collected once, and each model is
+	read in one pass over its constants, so validating a batch of
+	counterexamples costs little besides running them.
+	
+	Args:
+	    alpha (tn.Prog): The program which will run on the states
+	    models (list[z3.ModelRef]): Models to read
+	    complete (bool, optional): Whether to give the variables
+	    	of `alpha` that a model leaves unconstrained the value
+	    	z3's model completion gives them, `0`. Defaults to
+	    	`True`.
+	
+	Returns:
+	    list[tn.State]: The state of each model, in order
+	"""
+	names = [v.name for v in vars_prog(alpha)]
+	states = []
+	for model in models:
+		values = {
+			x: v for x, v in model_values(model).items()
+			if not isinstance(v, bool)}
+		states.append(tn.State({
+			x: values.get(x, 0) for x in names
+			if complete or x in values}))
+	return states
+
+
+# Node classes in serialization order; appending is backwards-compatible,
+# anything else requires bumping AST_FORMAT_VERSION.
+_AST_CLASSES = (
+    tn.Const, tn.Var, tn.Sum, tn.Difference, tn.Product,
+    tn.TrueC, tn.FalseC, tn.NotF, tn.AndF, tn.OrF, tn.ImpliesF, tn.EqF, tn.LtF,
+    tn.Skip, tn.Asgn, tn.Seq, tn.Block, tn.If, tn.While, tn.Output, tn.Abort,
+)
+_AST_TAGS = {cls: tag for tag, cls in enumerate(_AST_CLASSES)}
+# For each class, whether each field holds a node, a tuple of nodes, or
+# a plain value.
+_AST_FIELDS = tuple(
+    tuple(
+        'nodes' if get_origin(f.type) is tuple else
+        'node' if issubclass(f.type, tn.Token) else
+        'value'
+        for f in fields(cls))
+    for cls in _AST_CLASSES)
+
+AST_FORMAT_VERSION = 1
+
+
+def ast_dumps(alpha: tn.Token) -> bytes:
+    """
+    Serialize a tinyscript term, formula, or program to a compact
+    binary form. Shared subterms are written once, so the output is
+    proportional to the size of the hash-consed DAG rather than the
+    tree, and the result is zlib-compressed.
+
+    Args:
+        alpha (tn.Token): Node to serialize
+
+    Returns:
+        bytes: Serialized node, to be read back with `ast_loads`
+    """
+    index = {}
+    table = []
+    stack = [alpha]
+    while stack:
+        node = stack[-1]
+        if node in index:
+            stack.pop()
+            continue
+        tag = _AST_TAGS[type(node)]
+        vals = [getattr(node, f) for f in node.__match_args__]
+        pending = [
+            child
+            for kind, val in zip(_AST_FIELDS[tag], vals)
+            for child in (val if kind == 'nodes' else
+                          (val,) if kind == 'node' else ())
+            if child not in index]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        index[node] = len(table)
+        table.append((tag,) + tuple(
+            tuple(index[child] for child in val) if kind == 'nodes' else
+            index[val] if kind == 'node' else
+            val
+            for kind, val in zip(_AST_FIELDS[tag], vals)))
+    return zlib.compress(marshal.dumps((AST_FORMAT_VERSION, tuple(table))))
+
+
+def ast_loads(data: bytes) -> tn.Token:
+    """
+    Deserialize a node written by `ast_dumps`
+
+    Args:
+        data (bytes): Serialized node
+
+    Returns:
+        tn.Token: The node, interned like any other
+
+    Raises:
+        ValueError: If `data` is not a serialized node in the
+            current format
+    """
+    try:
+        version, table = marshal.loads(zlib.decompress(data))
+    except Exception as e:
+        raise ValueError(f"ast_loads got malformed data ({e})")
+    if version != AST_FORMAT_VERSION:
+        raise ValueError(
+            f"ast_loads got format {version}, not {AST_FORMAT_VERSION}")
+    # Corrupt tables fail in many ways, e.g. with a bad tag or index
+    try:
+        nodes = []
+        for tag, *vals in table:
+            nodes.append(_AST_CLASSES[tag](*(
+                tuple(nodes[i] for i in val) if kind == 'nodes' else
+                nodes[val] if kind == 'node' else
+                val
+                for kind, val in zip(_AST_FIELDS[tag], vals))))
+        return nodes[-1]
+    except Exception as e:
+        raise ValueError(f"ast_loads got malformed data ({e!r})")